@@ -0,0 +1,55 @@
+"""
+Atomic file replacement for the l10n outputs.
+
+The same helper as `storage.atomic` of the match processing package, which these
+standalone scripts cannot import: a file is written to a temporary file next to
+it, flushed to disk and renamed over it, so a crash leaves either the previous
+file or the complete new one.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import IO, Any, Callable, Union
+
+
+def atomic_write(
+    path: Union[str, Path], write: Callable[[IO[Any]], None], mode: str = "wb"
+) -> None:
+    """
+    Write a file atomically, replacing the previous one if any.
+
+    :param path: The file to write.
+    :param write: Writes the content to the open file.
+    :param mode: The mode to open the temporary file in, "w" for text.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    kwargs = {} if "b" in mode else {"encoding": "utf-8"}
+    with tempfile.NamedTemporaryFile(
+        mode, dir=path.parent, prefix=f".{path.name}-", delete=False, **kwargs
+    ) as f:
+        try:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+    fsync_directory(path.parent)
+
+
+def fsync_directory(directory: Union[str, Path]) -> None:
+    """
+    Flush a directory's entries, such as a rename into it, to disk.
+    """
+    if os.name != "posix":
+        # Directories cannot be opened for syncing elsewhere.
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
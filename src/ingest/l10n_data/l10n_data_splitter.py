@@ -1,46 +1,218 @@
+import json
 import typer
 from pathlib import Path
-from collections import defaultdict
+from typing import Optional
 
 app = typer.Typer()
 
-def process_file(input_file: Path, filter_prefix: str = None):
-    categories = defaultdict(list)
-
-    with input_file.open('r', encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split('┃')
-            if len(parts) == 2:
-                key = parts[0].split('/', 2)
-                if len(key) >= 2:
-                    category = f"{key[0].lower()}_{key[1].lower()}"
-                    if filter_prefix is None or key[0].lower() == filter_prefix.lower():
-                        categories[category].append(line.strip())
-
-    output_dir = input_file.parent / "texts"
-    output_dir.mkdir(exist_ok=True)
-
-    for category, lines in categories.items():
-        output_file = output_dir / f"{category}.txt"
-        with output_file.open('w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
+SEPARATOR = '┃'
+
+
+def parse_line(line: str, filter_prefix: str = None) -> Optional[tuple[str, str, str]]:
+    """
+    Parse one dump line into its category, key and text.
+
+    :param line: A `Type/Sub/.../Id┃Text` line of the l10n dump.
+    :param filter_prefix: Only keep lines whose first key part matches, case-insensitively.
+
+    :return: The `type_sub` category, the last key part and the text, or None if the line is not an entry.
+    """
+    line = line.strip()
+    parts = line.split(SEPARATOR)
+    if len(parts) != 2:
+        return None
+    key = parts[0].split('/', 2)
+    if len(key) < 2:
+        return None
+    if filter_prefix is not None and key[0].lower() != filter_prefix.lower():
+        return None
+    return f"{key[0].lower()}_{key[1].lower()}", parts[0].split('/')[-1], parts[1]
+
+
+class CategoryWriter:
+    """
+    Buffer entries per category and write them as text and/or JSON files.
+
+    Categories are kept in memory until the buffered text exceeds `max_buffered_bytes`;
+    the largest buffers are then appended to their text files, and their JSON entries
+    to a `.<category>.json.part` file, so memory stays bounded whatever the dump size.
+    A key repeated across spills replaces the text written earlier, so the JSON file of
+    a spilled category is only written on close, merging its part file one category at
+    a time. Files of categories never spilled are written in one go.
+
+    The outputs match `process_file` (text lines joined by newlines) and `convert.py`
+    (a flat JSON object indented by 4 spaces) at any budget.
+    """
+
+    def __init__(self, texts_dir: Optional[Path], jsons_dir: Optional[Path], max_buffered_bytes: int = 8 << 20):
+        self.texts_dir = texts_dir
+        self.jsons_dir = jsons_dir
+        self.max_buffered_bytes = max_buffered_bytes
+        self.buffers: dict[str, list[tuple[str, str, str]]] = {}
+        self.sizes: dict[str, int] = {}
+        self.spilled: set[str] = set()
+        self.buffered_bytes = 0
+        for directory in (texts_dir, jsons_dir):
+            if directory is not None:
+                directory.mkdir(parents=True, exist_ok=True)
+
+    def add(self, category: str, key: str, line: str, text: str):
+        self.buffers.setdefault(category, []).append((key, line, text))
+        size = len(line) + len(text)
+        self.sizes[category] = self.sizes.get(category, 0) + size
+        self.buffered_bytes += size
+        if self.buffered_bytes > self.max_buffered_bytes:
+            self._spill()
+
+    def _spill(self):
+        # Append the largest buffers to their files until half the budget is free.
+        for category in sorted(self.sizes, key=self.sizes.get, reverse=True):
+            if self.buffered_bytes <= self.max_buffered_bytes // 2:
+                break
+            self._write(category, final=False)
+
+    def _write(self, category: str, final: bool):
+        entries = self.buffers.pop(category, [])
+        self.buffered_bytes -= self.sizes.pop(category, 0)
+        first = category not in self.spilled
+        mode = 'w' if first else 'a'
+        if self.texts_dir is not None and entries:
+            with (self.texts_dir / f"{category}.txt").open(mode, encoding='utf-8') as f:
+                f.write(('' if first else '\n') + '\n'.join(line for _, line, _ in entries))
+        if self.jsons_dir is not None:
+            if final:
+                self._write_json(category, entries)
+            elif entries:
+                with self._part_path(category).open(mode, encoding='utf-8') as f:
+                    f.writelines(json.dumps([key, text]) + '\n' for key, _, text in entries)
+        if not final:
+            self.spilled.add(category)
+
+    def _part_path(self, category: str) -> Path:
+        return self.jsons_dir / f".{category}.json.part"
+
+    def _write_json(self, category: str, entries: list[tuple[str, str, str]]):
+        # Later duplicates overwrite the text but keep the first position, like a dict.
+        items = {}
+        part = self._part_path(category)
+        if category in self.spilled:
+            with part.open('r', encoding='utf-8') as f:
+                for line in f:
+                    key, text = json.loads(line)
+                    items[key] = text
+        items.update((key, text) for key, _, text in entries)
+        with (self.jsons_dir / f"{category}.json").open('w', encoding='utf-8') as f:
+            json.dump(items, f, indent=4)
+        part.unlink(missing_ok=True)
+
+    def close(self):
+        for category in set(self.buffers) | self.spilled:
+            self._write(category, final=True)
 
+
+def stream_file(
+    input_file: Path,
+    output_dir: Path = None,
+    filter_prefix: str = None,
+    texts: bool = True,
+    jsons: bool = False,
+    combined: Path = None,
+    max_buffered_bytes: int = 8 << 20,
+) -> int:
+    """
+    Split and convert the l10n dump in a single pass.
+
+    :param input_file: The l10n dump, e.g. `l10n-English-20240705012716.txt`.
+    :param output_dir: Directory to create `texts` and `jsons` in. Default is the dump's directory.
+    :param filter_prefix: Only keep categories of this first key part, e.g. `Item`.
+    :param texts: Write one text file per category to `texts`. Default is True.
+    :param jsons: Write one JSON file per category to `jsons`. Default is False.
+    :param combined: Also write every entry as a JSON line `{"category", "key", "text"}` to this file.
+    :param max_buffered_bytes: Text held in memory before buffers are appended to their files.
+
+    :return: Number of categories written.
+    """
+    output_dir = output_dir or input_file.parent
+    writer = CategoryWriter(
+        output_dir / "texts" if texts else None,
+        output_dir / "jsons" if jsons else None,
+        max_buffered_bytes,
+    )
+    combined_file = combined.open('w', encoding='utf-8', buffering=1 << 20) if combined else None
+    categories = set()
+    try:
+        with input_file.open('r', encoding='utf-8', buffering=1 << 20) as f:
+            for line in f:
+                entry = parse_line(line, filter_prefix)
+                if entry is None:
+                    continue
+                category, key, text = entry
+                categories.add(category)
+                if texts or jsons:
+                    writer.add(category, key, line.strip(), text)
+                if combined_file is not None:
+                    combined_file.write(json.dumps({"category": category, "key": key, "text": text}) + '\n')
+    finally:
+        if combined_file is not None:
+            combined_file.close()
+    writer.close()
     return len(categories)
 
+
+def process_file(input_file: Path, filter_prefix: str = None):
+    return stream_file(input_file, filter_prefix=filter_prefix)
+
+
+def check_jsons(output_dir: Path) -> list[str]:
+    """
+    Compare the JSON files written next to the text files with what `convert.py` makes of them.
+
+    :param output_dir: Directory holding the `texts` and `jsons` written by `stream_file`.
+
+    :return: The categories whose JSON file differs from `convert.py`'s, empty if all match.
+    """
+    from convert import convert_item_data
+
+    mismatches = []
+    for text_file in sorted((output_dir / "texts").glob("*.txt")):
+        expected = json.dumps(convert_item_data(text_file.read_text(encoding='utf-8')), indent=4)
+        json_file = output_dir / "jsons" / f"{text_file.stem}.json"
+        if not json_file.exists() or json_file.read_text(encoding='utf-8') != expected:
+            mismatches.append(text_file.stem)
+    return mismatches
+
+
 @app.command()
 def split_file(
     input_file: Path = typer.Argument(..., help="Input text file to process"),
-    filter_prefix: str = typer.Option(None, help="Filter by prefix (e.g., 'Item')")
+    filter_prefix: str = typer.Option(None, help="Filter by prefix (e.g., 'Item')"),
+    texts: bool = typer.Option(True, "--texts/--no-texts", help="Write per-category text files to texts/"),
+    jsons: bool = typer.Option(False, "--json/--no-json", help="Write per-category JSON files to jsons/"),
+    combined: Optional[Path] = typer.Option(None, help="Also write every entry to this JSON Lines file"),
+    output_dir: Optional[Path] = typer.Option(None, help="Directory for texts/ and jsons/ (default: the input file's)"),
+    max_buffered_bytes: int = typer.Option(8 << 20, help="Text held in memory before buffers are appended to their files"),
+    check: bool = typer.Option(False, "--check", help="Check the JSON files against convert.py's conversion of the texts"),
 ):
     """
-    Split a text file into multiple files based on categories.
+    Split a text file into multiple files based on categories, optionally converting them to JSON in the same pass.
     """
     if not input_file.exists():
         typer.echo(f"Error: Input file '{input_file}' does not exist.")
         raise typer.Exit(code=1)
 
-    num_files = process_file(input_file, filter_prefix)
+    if check and not (texts and jsons):
+        typer.echo("Error: --check compares the JSON files with the texts, pass --texts and --json.")
+        raise typer.Exit(code=1)
+
+    num_files = stream_file(input_file, output_dir, filter_prefix, texts, jsons, combined, max_buffered_bytes)
     typer.echo(f"Successfully created {num_files} output files.")
+    if check:
+        mismatches = check_jsons(output_dir or input_file.parent)
+        if mismatches:
+            typer.echo(f"JSON files differing from convert.py: {', '.join(mismatches)}")
+            raise typer.Exit(code=1)
+        typer.echo("Every JSON file matches convert.py.")
+
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,388 @@
+import json
+import mmap
+import struct
+import sys
+import typer
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Union
+
+from atomic import atomic_write
+from l10n_data_splitter import parse_line
+
+index_app = typer.Typer()
+
+DEFAULT_INDEX_PATH = Path(__file__).parent / "l10n.idx"
+
+# Header: magic, category count, entry count, then the offsets of the category
+# table, the entry table and the string blob, and the blob size.
+MAGIC = b"L10NIDX1"
+HEADER = struct.Struct("<8s6I")
+# Every table row is four little-endian uint32: (name or key offset, length, and for
+# categories the first entry and entry count, for entries the text offset and length).
+ROW_SIZE = 16
+
+Key = Union[str, int]
+
+
+def build_index(categories: dict[str, dict[str, str]], output: Path) -> int:
+    """
+    Pack categories of key/text pairs into one memory-mappable index file.
+
+    Categories and the keys within each are sorted by their UTF-8 bytes, so both
+    can be binary searched straight from the mapped file.
+
+    :param categories: Texts by key by category name, e.g. `{"item_name": {"101101": "Scissors"}}`.
+    :param output: The index file to write.
+
+    :return: Number of entries written.
+    """
+    blob = bytearray()
+    strings: dict[bytes, int] = {}
+
+    def intern(value: str) -> tuple[int, int]:
+        data = value.encode("utf-8")
+        if data not in strings:
+            strings[data] = len(blob)
+            blob.extend(data)
+        return strings[data], len(data)
+
+    category_rows = array("I")
+    entry_rows = array("I")
+    for name in sorted(categories, key=lambda name: name.encode("utf-8")):
+        entries = categories[name]
+        category_rows.extend((*intern(name), len(entry_rows) // 4, len(entries)))
+        for key in sorted(entries, key=lambda key: key.encode("utf-8")):
+            entry_rows.extend((*intern(key), *intern(entries[key])))
+
+    categories_offset = HEADER.size
+    entries_offset = categories_offset + len(category_rows) * 4
+    blob_offset = entries_offset + len(entry_rows) * 4
+    n_entries = len(entry_rows) // 4
+    if blob_offset + len(blob) >= 1 << 32:
+        raise ValueError("The l10n index cannot exceed 4 GiB")
+
+    def write(f):
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                len(category_rows) // 4,
+                n_entries,
+                categories_offset,
+                entries_offset,
+                blob_offset,
+                len(blob),
+            )
+        )
+        f.write(_little_endian(category_rows))
+        f.write(_little_endian(entry_rows))
+        f.write(blob)
+
+    atomic_write(output, write)
+    return n_entries
+
+
+def _little_endian(rows: array) -> bytes:
+    if sys.byteorder == "big":
+        rows = array("I", rows)
+        rows.byteswap()
+    return rows.tobytes()
+
+
+def _uint32_table(view: memoryview) -> Sequence[int]:
+    """
+    Read a table of little-endian uint32, in place on little-endian hosts.
+    """
+    if sys.byteorder == "little":
+        return view.cast("I")
+    rows = array("I", view.tobytes())
+    rows.byteswap()
+    return rows
+
+
+def read_dump(dump: Path) -> dict[str, dict[str, str]]:
+    """
+    Read every category of an l10n dump, later duplicate keys overriding earlier ones.
+
+    :param dump: The l10n dump, e.g. `l10n-English-20240705012716.txt`.
+
+    :return: Texts by key by category name.
+    """
+    categories: dict[str, dict[str, str]] = {}
+    with dump.open("r", encoding="utf-8", buffering=1 << 20) as f:
+        for line in f:
+            entry = parse_line(line)
+            if entry is not None:
+                category, key, text = entry
+                categories.setdefault(category, {})[key] = text
+    return categories
+
+
+def read_jsons(jsons_dir: Path) -> dict[str, dict[str, str]]:
+    """
+    Read every flat `<category>.json` file of a directory, e.g. `jsons/`.
+
+    :param jsons_dir: Directory of JSON files mapping keys to texts.
+
+    :return: Texts by key by category name. Values that are not strings are stored as JSON.
+        Files that are not valid JSON objects are skipped with a warning.
+    """
+    categories = {}
+    for path in sorted(jsons_dir.glob("*.json")):
+        with path.open("r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                typer.echo(f"Warning: Skipping '{path}': {e}")
+                continue
+        if not isinstance(data, dict):
+            typer.echo(f"Warning: Skipping '{path}': not a JSON object")
+            continue
+        categories[path.stem] = {
+            str(key): value if isinstance(value, str) else json.dumps(value)
+            for key, value in data.items()
+        }
+    return categories
+
+
+class L10nCategory:
+    """
+    Read-only mapping view of one category of an L10nIndex, decoded on access.
+    """
+
+    def __init__(self, index: "L10nIndex", name: str, first: int, count: int):
+        self.index = index
+        self.name = name
+        self.first = first
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _position(self, key: bytes) -> Optional[int]:
+        entries = self.index._entries
+        low, high = self.first, self.first + self.count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.index._bytes(entries[4 * middle], entries[4 * middle + 1])
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def get(self, key: Key, default: Optional[str] = None) -> Optional[str]:
+        position = self._position(str(key).encode("utf-8"))
+        if position is None:
+            return default
+        entries = self.index._entries
+        return self.index._string(entries[4 * position + 2], entries[4 * position + 3])
+
+    def __getitem__(self, key: Key) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Key) -> bool:
+        return self._position(str(key).encode("utf-8")) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        entries = self.index._entries
+        for position in range(self.first, self.first + self.count):
+            yield self.index._string(entries[4 * position], entries[4 * position + 1])
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        entries = self.index._entries
+        for position in range(self.first, self.first + self.count):
+            row = entries[4 * position : 4 * position + 4]
+            yield self.index._string(row[0], row[1]), self.index._string(row[2], row[3])
+
+
+class L10nIndex:
+    """
+    Memory-mapped l10n index written by `build_index`.
+
+    Opening maps the file and reads its 32-byte header; categories and texts are
+    only read (and paged in) when looked up.
+
+    Example:
+        index = L10nIndex("l10n.idx")
+        index.lookup("item_name", 101101)  # "Scissors"
+        dict(index["area_name"].items())
+    """
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        (
+            magic,
+            n_categories,
+            n_entries,
+            categories_offset,
+            entries_offset,
+            blob_offset,
+            blob_size,
+        ) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not an l10n index")
+        self._view = view
+        self._categories = _uint32_table(
+            view[categories_offset : categories_offset + n_categories * ROW_SIZE]
+        )
+        self._entries = _uint32_table(
+            view[entries_offset : entries_offset + n_entries * ROW_SIZE]
+        )
+        self._blob = view[blob_offset : blob_offset + blob_size]
+        self._cache: dict[str, Optional[L10nCategory]] = {}
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        return self._blob[offset : offset + length].tobytes()
+
+    def _string(self, offset: int, length: int) -> str:
+        return str(self._blob[offset : offset + length], "utf-8")
+
+    def __len__(self) -> int:
+        return len(self._categories) // 4
+
+    @property
+    def categories(self) -> list[str]:
+        return [
+            self._string(self._categories[4 * i], self._categories[4 * i + 1])
+            for i in range(len(self))
+        ]
+
+    def category(self, name: str) -> Optional[L10nCategory]:
+        """
+        Get a category by name, e.g. `item_name`, or None if it does not exist.
+        """
+        if name in self._cache:
+            return self._cache[name]
+        target = name.encode("utf-8")
+        rows = self._categories
+        low, high = 0, len(self)
+        found = None
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._bytes(rows[4 * middle], rows[4 * middle + 1])
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                found = L10nCategory(
+                    self, name, rows[4 * middle + 2], rows[4 * middle + 3]
+                )
+                break
+        self._cache[name] = found
+        return found
+
+    def __getitem__(self, name: str) -> L10nCategory:
+        category = self.category(name)
+        if category is None:
+            raise KeyError(name)
+        return category
+
+    def __contains__(self, name: str) -> bool:
+        return self.category(name) is not None
+
+    def lookup(
+        self, category: str, key: Key, default: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Look up the text of a key, e.g. `lookup("item_name", 101101)`.
+
+        :param category: The category name, i.e. the JSON file name without extension.
+        :param key: The key within the category; integers are matched as strings.
+        :param default: Returned if the category or key does not exist.
+
+        :return: The text, or `default`.
+        """
+        found = self.category(category)
+        return default if found is None else found.get(key, default)
+
+    def close(self):
+        self._cache.clear()
+        for view in (self._categories, self._entries, self._blob, self._view):
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "L10nIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@lru_cache(maxsize=None)
+def open_index(path: Union[str, Path] = DEFAULT_INDEX_PATH) -> L10nIndex:
+    """
+    Open an index once per process and share it between callers.
+    """
+    return L10nIndex(path)
+
+
+def lookup(
+    category: str,
+    key: Key,
+    default: Optional[str] = None,
+    path: Union[str, Path] = DEFAULT_INDEX_PATH,
+) -> Optional[str]:
+    """
+    Look up a text in the shared index at `path`, e.g. `lookup("item_name", 101101)`.
+    """
+    return open_index(path).lookup(category, key, default)
+
+
+@index_app.command()
+def build(
+    output: Path = typer.Option(DEFAULT_INDEX_PATH, help="Index file to write"),
+    jsons_dir: Optional[Path] = typer.Option(
+        None, help="Directory of category JSON files to include, e.g. jsons"
+    ),
+    dump: Optional[Path] = typer.Option(
+        None, help="l10n dump to include; its categories override the JSON files'"
+    ),
+):
+    """
+    Pack l10n categories into one memory-mapped index file.
+    """
+    if jsons_dir is None and dump is None:
+        typer.echo("Error: Provide --jsons-dir, --dump or both.")
+        raise typer.Exit(code=1)
+    categories = read_jsons(jsons_dir) if jsons_dir else {}
+    if dump:
+        categories.update(read_dump(dump))
+    n_entries = build_index(categories, output)
+    typer.echo(
+        f"Indexed {n_entries} entries in {len(categories)} categories to {output}."
+    )
+
+
+@index_app.command()
+def get(
+    category: str = typer.Argument(..., help="Category name, e.g. item_name"),
+    key: str = typer.Argument(..., help="Key within the category, e.g. 101101"),
+    index: Path = typer.Option(DEFAULT_INDEX_PATH, help="Index file to read"),
+):
+    """
+    Print the text of a key.
+    """
+    with L10nIndex(index) as opened:
+        text = opened.lookup(category, key)
+    if text is None:
+        typer.echo(f"Error: {category}/{key} not found.")
+        raise typer.Exit(code=1)
+    typer.echo(text)
+
+
+if __name__ == "__main__":
+    index_app()
@@ -0,0 +1,291 @@
+import json
+import os
+import re
+import typer
+from datetime import datetime, timezone
+from hashlib import blake2b
+from pathlib import Path
+from typing import Optional
+
+from atomic import atomic_write, fsync_directory
+from l10n_data_splitter import CategoryWriter, parse_line
+from l10n_index import build_index
+
+refresh_app = typer.Typer()
+
+DUMP_NAME = re.compile(r"l10n-(?P<language>[A-Za-z]+)-(?P<timestamp>\d+)\.txt$")
+MANIFEST_NAME = "manifest.json"
+REPORTS_DIR = "changes"
+
+
+def dump_version(dump: Path) -> tuple[str, str]:
+    """
+    Get the language and timestamp of a dump from its name.
+
+    :param dump: A dump named like `l10n-English-20240705012716.txt`.
+
+    :return: The language and the timestamp, e.g. `("English", "20240705012716")`.
+    """
+    match = DUMP_NAME.search(dump.name)
+    if match is None:
+        raise ValueError(
+            f"'{dump.name}' is not named like l10n-<Language>-<timestamp>.txt"
+        )
+    return match["language"], match["timestamp"]
+
+
+def digest(text: str, size: int = 8) -> str:
+    return blake2b(text.encode("utf-8"), digest_size=size).hexdigest()
+
+
+def read_categories(dump: Path) -> dict[str, list[tuple[str, str, str]]]:
+    """
+    Read the entries of every category of a dump, in dump order.
+
+    :param dump: The l10n dump.
+
+    :return: `(key, line, text)` entries by category name.
+    """
+    categories: dict[str, list[tuple[str, str, str]]] = {}
+    with dump.open("r", encoding="utf-8", buffering=1 << 20) as f:
+        for line in f:
+            entry = parse_line(line)
+            if entry is not None:
+                category, key, text = entry
+                categories.setdefault(category, []).append((key, line.strip(), text))
+    return categories
+
+
+def category_manifest(entries: list[tuple[str, str, str]]) -> dict:
+    """
+    Hash one category: its whole text file content, and the text of each key (the last one of duplicate keys).
+    """
+    return {
+        "hash": digest("\n".join(line for _, line, _ in entries), size=16),
+        "keys": {key: digest(text) for key, _, text in entries},
+    }
+
+
+def diff_manifests(old: dict[str, dict], new: dict[str, dict]) -> dict:
+    """
+    Compare the category manifests of two dump versions.
+
+    :param old: Category manifests of the previous version.
+    :param new: Category manifests of the new version.
+
+    :return: The added, removed and changed category names, and per added or changed
+        category the added, changed and removed keys. A category whose content changed
+        without any key changing (reordered or duplicated lines) is changed with no keys.
+    """
+    report = {
+        "categories": {
+            "added": [],
+            "removed": sorted(set(old) - set(new)),
+            "changed": [],
+        },
+        "keys": {},
+    }
+    for category in sorted(new):
+        if category not in old:
+            report["categories"]["added"].append(category)
+            report["keys"][category] = {
+                "added": sorted(new[category]["keys"]),
+                "changed": [],
+                "removed": [],
+            }
+            continue
+        if old[category]["hash"] == new[category]["hash"]:
+            continue
+        report["categories"]["changed"].append(category)
+        old_keys, new_keys = old[category]["keys"], new[category]["keys"]
+        report["keys"][category] = {
+            "added": sorted(new_keys.keys() - old_keys.keys()),
+            "changed": sorted(
+                key
+                for key in new_keys.keys() & old_keys.keys()
+                if new_keys[key] != old_keys[key]
+            ),
+            "removed": sorted(old_keys.keys() - new_keys.keys()),
+        }
+    return report
+
+
+def load_manifest(output_dir: Path) -> dict:
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {"dump": None, "timestamp": None, "categories": {}}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: Path, data: dict):
+    atomic_write(path, lambda f: json.dump(data, f, indent=4, ensure_ascii=False), "w")
+
+
+def sync_outputs(outputs: list[tuple[Path, str]], categories: set[str]):
+    """
+    Flush the rewritten category files, and their directories' entries, to disk.
+
+    Called before the manifest is replaced, so it never records content that a crash could lose.
+
+    :param outputs: The output directories with the suffix of their files, e.g. `(jsons_dir, ".json")`.
+    :param categories: The categories rewritten.
+    """
+    for directory, suffix in outputs:
+        for category in categories:
+            fd = os.open(directory / f"{category}{suffix}", os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        fsync_directory(directory)
+
+
+def refresh(
+    dump: Path,
+    output_dir: Path,
+    texts: bool = True,
+    jsons: bool = True,
+    index: bool = True,
+    force: bool = False,
+) -> Optional[dict]:
+    """
+    Bring the outputs of one language up to date with a new dump, rewriting only what changed.
+
+    The manifest in `output_dir` records the hash of every category and of every key's text
+    as of the last refresh. The new dump is hashed the same way; only added or changed
+    categories are rewritten to `texts` and `jsons`, and the files of removed categories
+    are deleted. Categories whose output files have gone missing are rewritten too.
+
+    :param dump: The new dump, named like `l10n-English-20240705012716.txt`.
+    :param output_dir: The language's directory holding `texts`, `jsons`, the manifest and the reports.
+    :param texts: Maintain one text file per category in `texts`. Default is True.
+    :param jsons: Maintain one JSON file per category in `jsons`. Default is True.
+    :param index: Rebuild the `l10n.idx` lookup index when anything changed. Default is True.
+    :param force: Apply the dump even if it is not newer than the last one applied.
+
+    :return: The change report, also written to `changes/<timestamp>.json`, or None if the
+        dump is not newer than the last one applied.
+    """
+    language, timestamp = dump_version(dump)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    if (
+        not force
+        and manifest["timestamp"] is not None
+        and timestamp <= manifest["timestamp"]
+    ):
+        return None
+
+    categories = read_categories(dump)
+    new = {
+        category: category_manifest(entries) for category, entries in categories.items()
+    }
+    report = diff_manifests(manifest["categories"], new)
+    rewrite = set(report["categories"]["added"]) | set(report["categories"]["changed"])
+    texts_dir = output_dir / "texts" if texts else None
+    jsons_dir = output_dir / "jsons" if jsons else None
+    for category in new.keys() - rewrite:
+        # Outputs deleted by hand, or not maintained by a previous refresh.
+        if (texts_dir and not (texts_dir / f"{category}.txt").exists()) or (
+            jsons_dir and not (jsons_dir / f"{category}.json").exists()
+        ):
+            rewrite.add(category)
+
+    writer = CategoryWriter(texts_dir, jsons_dir)
+    for category in sorted(rewrite):
+        for key, line, text in categories[category]:
+            writer.add(category, key, line, text)
+    writer.close()
+    for category in report["categories"]["removed"]:
+        for directory, suffix in ((texts_dir, ".txt"), (jsons_dir, ".json")):
+            if directory is not None:
+                (directory / f"{category}{suffix}").unlink(missing_ok=True)
+
+    outputs = [(texts_dir, ".txt"), (jsons_dir, ".json")]
+    sync_outputs([output for output in outputs if output[0] is not None], rewrite)
+
+    changed = bool(report["keys"] or report["categories"]["removed"])
+    index_path = output_dir / "l10n.idx"
+    if index and (changed or not index_path.exists()):
+        build_index(
+            {
+                category: {key: text for key, _, text in entries}
+                for category, entries in categories.items()
+            },
+            index_path,
+        )
+
+    report = {
+        "language": language,
+        "dump": dump.name,
+        "previous_dump": manifest["dump"],
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "files_rewritten": len(rewrite),
+        **report,
+    }
+    reports_dir = output_dir / REPORTS_DIR
+    reports_dir.mkdir(exist_ok=True)
+    write_json(reports_dir / f"{timestamp}.json", report)
+    write_json(
+        output_dir / MANIFEST_NAME,
+        {"dump": dump.name, "timestamp": timestamp, "categories": new},
+    )
+    return report
+
+
+@refresh_app.command()
+def refresh_dumps(
+    dumps: list[Path] = typer.Argument(
+        ..., help="l10n dumps named like l10n-<Language>-<timestamp>.txt"
+    ),
+    output_root: Path = typer.Option(
+        Path(__file__).parent,
+        help="Directory holding one output directory per language",
+    ),
+    texts: bool = typer.Option(
+        True, "--texts/--no-texts", help="Maintain per-category text files in texts/"
+    ),
+    jsons: bool = typer.Option(
+        True, "--json/--no-json", help="Maintain per-category JSON files in jsons/"
+    ),
+    index: bool = typer.Option(
+        True, "--index/--no-index", help="Rebuild the l10n.idx lookup index on changes"
+    ),
+    force: bool = typer.Option(
+        False, help="Apply dumps that are not newer than the last one applied"
+    ),
+):
+    """
+    Apply new l10n dumps, rewriting only the categories that changed.
+
+    Each language is kept in `<output-root>/<Language>/`; its dumps are applied oldest first.
+    """
+    for dump in dumps:
+        if not dump.exists():
+            typer.echo(f"Error: Input file '{dump}' does not exist.")
+            raise typer.Exit(code=1)
+    try:
+        versions = sorted((dump_version(dump), dump) for dump in dumps)
+    except ValueError as e:
+        typer.echo(f"Error: {e}")
+        raise typer.Exit(code=1)
+
+    for (language, _), dump in versions:
+        report = refresh(dump, output_root / language, texts, jsons, index, force)
+        if report is None:
+            typer.echo(
+                f"{dump.name}: not newer than the last {language} dump applied, skipped."
+            )
+            continue
+        keys = report["keys"].values()
+        typer.echo(
+            f"{dump.name}: {len(report['categories']['added'])} categories added, "
+            f"{len(report['categories']['changed'])} changed, {len(report['categories']['removed'])} removed; "
+            f"{sum(len(k['added']) for k in keys)} keys added, {sum(len(k['changed']) for k in keys)} changed, "
+            f"{sum(len(k['removed']) for k in keys)} removed; {report['files_rewritten']} categories rewritten."
+        )
+
+
+if __name__ == "__main__":
+    refresh_app()
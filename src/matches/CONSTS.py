@@ -1,20 +1,76 @@
 import tomllib
 import enum
 import os
+from typing import Any
 
-with open(".secrets.toml", "rb") as f:
-    secrets = tomllib.load(f)
-    API_KEY = secrets["er_api"]["key"]
-    SUPABASE_URL = secrets["supabase"]["url"]
-    SUPABASE_KEY = secrets["supabase"]["key"]
+# Secrets are read on first access, so importing this module (for `--help` or
+# local-only commands) needs no credentials. Each is taken from its environment
+# variable if set, else from the first secrets file of `secrets_paths`.
+SECRETS = {
+    "API_KEY": ("ER_API_KEY", "er_api", "key"),
+    "SUPABASE_URL": ("SUPABASE_URL", "supabase", "url"),
+    "SUPABASE_KEY": ("SUPABASE_KEY", "supabase", "key"),
+}
 
-MATCHES_PATH = "/home/whahn/projects/lumia-kenkyu/src/matches/output_examples"
-ARCHIVE_PATH = "/home/whahn/projects/lumia-kenkyu/src/matches/output_examples/archive"
+
+def secrets_paths() -> list[str]:
+    """The secrets files searched, in order: $MATCHES_SECRETS, then
+    `.secrets.toml` in the working directory and next to this module."""
+    paths = [
+        os.path.abspath(".secrets.toml"),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".secrets.toml"),
+    ]
+    if os.environ.get("MATCHES_SECRETS"):
+        paths.insert(0, os.path.abspath(os.environ["MATCHES_SECRETS"]))
+    return list(dict.fromkeys(paths))
+
+
+def load_secrets() -> dict[str, Any]:
+    """Read the first secrets file that exists, or nothing if none does."""
+    for path in secrets_paths():
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return tomllib.load(f)
+    return {}
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve a secret or HEADERS on first access and cache it on the module."""
+    if name == "HEADERS":
+        value = {"Accept": "application/json", "x-api-key": __getattr__("API_KEY")}
+    elif name in SECRETS:
+        env, section, key = SECRETS[name]
+        value = os.environ.get(env) or load_secrets().get(section, {}).get(key)
+        if not value:
+            raise RuntimeError(
+                f"{name} is not configured: set ${env}, or [{section}] {key} in one "
+                f"of {', '.join(secrets_paths())}"
+            )
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+MATCHES_PATH = os.environ.get(
+    "MATCHES_PATH", "/home/whahn/projects/lumia-kenkyu/src/matches/output_examples"
+)
+ARCHIVE_PATH = os.environ.get("ARCHIVE_PATH", os.path.join(MATCHES_PATH, "archive"))
 ERROR_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "error")
+CHECKPOINT_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "checkpoints")
+EXPORT_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "parquet")
+ARROW_CACHE_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "arrow_cache")
+AGGREGATES_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "aggregates.sqlite")
+BUILD_INDEX_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "build_index.npz")
+KILL_GRAPH_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "kill_graph.npz")
+TEAM_SYNERGY_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "team_synergy.npz")
+MMR_SERIES_PATH = os.path.join(os.path.dirname(ARCHIVE_PATH), "mmr_series")
+L10N_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ingest", "l10n_data"
+)
 
 BASE_URL = "https://open-api.bser.io/"
 CURRENT_SEASON = 25  # Season 4 "SUNSET"
-HEADERS = {"Accept": "application/json", "x-api-key": API_KEY}
 
 
 class version(enum.Enum):
@@ -0,0 +1,464 @@
+"""
+Item build co-occurrence index.
+
+Counts, over every indexed player, how often and how successfully items are
+combined:
+
+- item x item co-occurrence within a final build,
+- first item -> final item transitions per equipment slot,
+- final build -> picks and wins per character.
+
+Every counter is a SparseCounts: sorted int64 keys packing the dimensions, with
+the counts and wins alongside. Keys sharing a prefix (an item, a slot and first
+item, a character) are contiguous, so each query is two binary searches and a
+sort of the matching slice. New games are merged in batches, and players already
+indexed are skipped, so updates are incremental and idempotent.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+import numpy as np
+import pyarrow as pa
+from models.game import UserGame
+from analytics.character_stats import lookup, pack_player_keys, to_numpy
+from storage.atomic import atomic_write
+
+
+# Equipment slots of a build: weapon, chest, head, arm, leg and accessory.
+BUILD_SLOTS = 6
+# Item IDs are packed into 24 bits of the counter keys.
+ITEM_BITS = 24
+_ITEM_MASK = (1 << ITEM_BITS) - 1
+_LOW_MASK = (1 << 32) - 1
+
+
+@dataclass
+class SparseCounts:
+    """Counts and wins per int64 key, with the keys sorted and unique.
+
+    Attributes:
+        keys (np.ndarray): Sorted unique int64 keys.
+        counts (np.ndarray): int64 occurrences per key.
+        wins (np.ndarray): int64 occurrences in won games per key.
+    """
+
+    keys: np.ndarray
+    counts: np.ndarray
+    wins: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "SparseCounts":
+        return cls(np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, keys: np.ndarray, wins: np.ndarray) -> None:
+        """Count one occurrence per key, a win where `wins` is set."""
+        if not len(keys):
+            return
+        keys = np.concatenate([self.keys, keys.astype(np.int64)])
+        counts = np.concatenate([self.counts, np.ones(len(wins), np.int64)])
+        all_wins = np.concatenate([self.wins, wins.astype(np.int64)])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self.wins = np.bincount(inverse, weights=all_wins).astype(np.int64)
+
+    def prefix(self, low: int, high: int) -> slice:
+        """Positions of the keys in [low, high)."""
+        start, stop = np.searchsorted(self.keys, [low, high])
+        return slice(int(start), int(stop))
+
+
+def _top(
+    counts: np.ndarray, wins: np.ndarray, limit: int, min_games: int, sort: str
+) -> np.ndarray:
+    """Positions of the best entries by pick count or win rate."""
+    candidates = np.flatnonzero(counts >= max(min_games, 1))
+    if sort == "win_rate":
+        score = wins[candidates] / counts[candidates]
+    elif sort == "count":
+        score = counts[candidates].astype(np.float64)
+    else:
+        raise ValueError(f"Unknown sort: {sort}")
+    if len(candidates) > limit:
+        best = np.argpartition(-score, limit - 1)[:limit]
+        candidates, score = candidates[best], score[best]
+    return candidates[np.argsort(-score, kind="stable")]
+
+
+def _stats(count: int, wins: int) -> dict[str, Any]:
+    return {"games": count, "wins": wins, "win_rate": wins / count}
+
+
+class BuildIndex:
+    """Co-occurrence counters over players' final and first equipment.
+
+    Attributes:
+        pairs (SparseCounts): Item pairs of final builds, keyed
+            `item << 32 | other_item`, stored in both directions.
+        transitions (SparseCounts): First to final item per slot, keyed
+            `slot << 48 | first_item << 24 | final_item`.
+        builds (SparseCounts): Final builds per character, keyed
+            `character_id << 32 | build_id`.
+        build_items (np.ndarray): int32 (builds, BUILD_SLOTS) items of every build
+            ID, 0 for an empty slot.
+        players (np.ndarray): Sorted packed (game_id, user_id) keys indexed so far.
+    """
+
+    def __init__(self):
+        self.pairs = SparseCounts.empty()
+        self.transitions = SparseCounts.empty()
+        self.builds = SparseCounts.empty()
+        self.build_items = np.empty((0, BUILD_SLOTS), np.int32)
+        self.players = np.empty(0, np.int64)
+        self._build_ids: dict[bytes, int] = {}
+
+    def _assign_build_ids(self, final_items: np.ndarray) -> np.ndarray:
+        unique, inverse = np.unique(final_items, axis=0, return_inverse=True)
+        ids = np.empty(len(unique), np.int64)
+        new_builds = []
+        for position, build in enumerate(unique):
+            key = build.tobytes()
+            build_id = self._build_ids.get(key)
+            if build_id is None:
+                build_id = len(self._build_ids)
+                self._build_ids[key] = build_id
+                new_builds.append(build)
+            ids[position] = build_id
+        if new_builds:
+            self.build_items = np.concatenate([self.build_items, np.array(new_builds)])
+        return ids[inverse.ravel()]
+
+    def add(
+        self,
+        players: np.ndarray,
+        character_id: np.ndarray,
+        victory: np.ndarray,
+        final_items: np.ndarray,
+        first_items: np.ndarray,
+    ) -> int:
+        """Index a batch of players, skipping the ones already indexed.
+
+        Args:
+            players (np.ndarray): Packed (game_id, user_id) key per player.
+            character_id (np.ndarray): Character per player.
+            victory (np.ndarray): Whether each player won.
+            final_items (np.ndarray): (players, BUILD_SLOTS) final item per slot,
+                0 for an empty slot.
+            first_items (np.ndarray): (players, BUILD_SLOTS) first item per slot,
+                0 for an empty slot.
+
+        Returns:
+            int: Number of players newly indexed.
+
+        Raises:
+            ValueError: If an item ID does not fit in ITEM_BITS bits.
+        """
+        _, first = np.unique(players, return_index=True)
+        new = first[~np.isin(players[first], self.players)]
+        if not len(new):
+            return 0
+        players = players[new]
+        character_id = character_id[new].astype(np.int64)
+        victory = victory[new].astype(bool)
+        final_items = final_items[new].astype(np.int32)
+        first_items = first_items[new].astype(np.int32)
+        if (
+            final_items.max(initial=0) > _ITEM_MASK
+            or first_items.max(initial=0) > _ITEM_MASK
+        ):
+            raise ValueError(f"Item IDs must fit in {ITEM_BITS} bits")
+
+        # Item pairs within the final build, in both directions.
+        pair_keys, pair_wins = [], []
+        for slot in range(BUILD_SLOTS):
+            for other in range(BUILD_SLOTS):
+                if slot == other:
+                    continue
+                item, other_item = final_items[:, slot], final_items[:, other]
+                present = (item > 0) & (other_item > 0)
+                pair_keys.append(
+                    (item[present].astype(np.int64) << 32) | other_item[present]
+                )
+                pair_wins.append(victory[present])
+        self.pairs.add(np.concatenate(pair_keys), np.concatenate(pair_wins))
+
+        # First item to final item of every slot with both.
+        transition_keys, transition_wins = [], []
+        for slot in range(BUILD_SLOTS):
+            first_item, final_item = first_items[:, slot], final_items[:, slot]
+            present = (first_item > 0) & (final_item > 0)
+            transition_keys.append(
+                (np.int64(slot) << 48)
+                | (first_item[present].astype(np.int64) << ITEM_BITS)
+                | final_item[present]
+            )
+            transition_wins.append(victory[present])
+        self.transitions.add(
+            np.concatenate(transition_keys), np.concatenate(transition_wins)
+        )
+
+        # Whole final builds per character.
+        has_build = final_items.any(axis=1)
+        build_ids = self._assign_build_ids(final_items[has_build])
+        self.builds.add((character_id[has_build] << 32) | build_ids, victory[has_build])
+
+        self.players = np.union1d(self.players, players)
+        return len(players)
+
+    def add_user_games(self, games: Iterable[UserGame]) -> int:
+        """Index validated players; see `add`."""
+        games = list(games)
+        final_items = np.zeros((len(games), BUILD_SLOTS), np.int32)
+        first_items = np.zeros((len(games), BUILD_SLOTS), np.int32)
+        for row, game in enumerate(games):
+            for slot, item_id in game.final_equipment.items():
+                if int(slot) < BUILD_SLOTS:
+                    final_items[row, int(slot)] = item_id
+            for slot, item_ids in game.equipment_first_item.items():
+                if int(slot) < BUILD_SLOTS and item_ids:
+                    first_items[row, int(slot)] = item_ids[0]
+        return self.add(
+            pack_player_keys(
+                np.array([game.game_id for game in games], np.int64),
+                np.array([game.user_id for game in games], np.int64),
+            ),
+            np.array([game.character_id for game in games], np.int64),
+            np.array([game.victory for game in games], bool),
+            final_items,
+            first_items,
+        )
+
+    def add_tables(self, tables: dict[str, pa.Table]) -> int:
+        """Index players from Arrow `player_game_stats` and `equipment` tables.
+
+        Args:
+            tables (dict[str, pa.Table]): The tables, e.g. from `ArrowCache.load`.
+
+        Returns:
+            int: Number of players newly indexed.
+        """
+        stats = tables["player_game_stats"]
+        players = pack_player_keys(
+            to_numpy(stats["game_id"], np.int64), to_numpy(stats["user_id"], np.int64)
+        )
+        equipment = tables["equipment"]
+        row = lookup(
+            players,
+            np.arange(len(players), dtype=np.int64),
+            pack_player_keys(
+                to_numpy(equipment["game_id"], np.int64),
+                to_numpy(equipment["user_id"], np.int64),
+            ),
+            default=-1,
+        )
+        slot = to_numpy(equipment["slot"], np.int64)
+        item_id = to_numpy(equipment["item_id"], np.int32)
+        kind = to_numpy(equipment["type"], np.int8)
+        valid = (row >= 0) & (slot >= 0) & (slot < BUILD_SLOTS)
+
+        final_items = np.zeros((len(players), BUILD_SLOTS), np.int32)
+        first_items = np.zeros((len(players), BUILD_SLOTS), np.int32)
+        final = valid & (kind == 2)
+        final_items[row[final], slot[final]] = item_id[final]
+        first = valid & (kind == 1)
+        first_items[row[first], slot[first]] = item_id[first]
+        return self.add(
+            players,
+            to_numpy(stats["character_id"], np.int64),
+            to_numpy(stats["victory"], np.bool_),
+            final_items,
+            first_items,
+        )
+
+    def partners(
+        self, item_id: int, limit: int = 10, min_games: int = 1, sort: str = "count"
+    ) -> list[dict[str, Any]]:
+        """Items most often in the same final build as an item.
+
+        Args:
+            item_id (int): The item.
+            limit (int): Number of partners to return.
+            min_games (int): Minimum builds shared with the item.
+            sort (str): Rank by "count" or "win_rate".
+
+        Returns:
+            list[dict[str, Any]]: Partner item_id with games, wins and win_rate.
+        """
+        positions = self.pairs.prefix(item_id << 32, (item_id + 1) << 32)
+        keys = self.pairs.keys[positions]
+        counts, wins = self.pairs.counts[positions], self.pairs.wins[positions]
+        return [
+            {
+                "item_id": int(keys[i] & _LOW_MASK),
+                **_stats(int(counts[i]), int(wins[i])),
+            }
+            for i in _top(counts, wins, limit, min_games, sort)
+        ]
+
+    def final_items_from(
+        self,
+        slot: int,
+        first_item: int,
+        limit: int = 10,
+        min_games: int = 1,
+        sort: str = "count",
+    ) -> list[dict[str, Any]]:
+        """Final items players reached from a first item in a slot.
+
+        Args:
+            slot (int): The equipment slot.
+            first_item (int): The slot's first item.
+            limit (int): Number of final items to return.
+            min_games (int): Minimum players per transition.
+            sort (str): Rank by "count" or "win_rate".
+
+        Returns:
+            list[dict[str, Any]]: Final item_id with games, wins and win_rate.
+        """
+        low = (slot << 48) | (first_item << ITEM_BITS)
+        positions = self.transitions.prefix(low, low + (1 << ITEM_BITS))
+        keys = self.transitions.keys[positions]
+        counts = self.transitions.counts[positions]
+        wins = self.transitions.wins[positions]
+        return [
+            {
+                "item_id": int(keys[i] & _ITEM_MASK),
+                **_stats(int(counts[i]), int(wins[i])),
+            }
+            for i in _top(counts, wins, limit, min_games, sort)
+        ]
+
+    def _character_builds(
+        self, character_id: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        positions = self.builds.prefix(character_id << 32, (character_id + 1) << 32)
+        build_ids = self.builds.keys[positions] & _LOW_MASK
+        return (
+            self.build_items[build_ids],
+            self.builds.counts[positions],
+            self.builds.wins[positions],
+        )
+
+    def top_builds(
+        self,
+        character_id: int,
+        limit: int = 10,
+        min_games: int = 1,
+        sort: str = "count",
+    ) -> list[dict[str, Any]]:
+        """The most picked or most winning final builds of a character.
+
+        Args:
+            character_id (int): The character.
+            limit (int): Number of builds to return.
+            min_games (int): Minimum players per build.
+            sort (str): Rank by "count" or "win_rate".
+
+        Returns:
+            list[dict[str, Any]]: Builds as `items` (item per slot, 0 if empty)
+            with games, wins and win_rate.
+        """
+        items, counts, wins = self._character_builds(character_id)
+        return [
+            {"items": items[i].tolist(), **_stats(int(counts[i]), int(wins[i]))}
+            for i in _top(counts, wins, limit, min_games, sort)
+        ]
+
+    def complete_build(
+        self,
+        character_id: int,
+        partial: dict[int, int],
+        limit: int = 5,
+        min_games: int = 1,
+        sort: str = "count",
+    ) -> dict[str, Any]:
+        """Suggest how a character's partial build is usually completed.
+
+        Args:
+            character_id (int): The character.
+            partial (dict[int, int]): Item already chosen per slot.
+            limit (int): Number of builds and of items per open slot to return.
+            min_games (int): Minimum players per returned build or item.
+            sort (str): Rank by "count" or "win_rate".
+
+        Returns:
+            dict[str, Any]: `builds`, the matching full builds as in `top_builds`,
+            and `slots`, the best items for every open slot with games, wins and
+            win_rate among the matching builds.
+        """
+        items, counts, wins = self._character_builds(character_id)
+        matches = np.ones(len(items), dtype=bool)
+        for slot, item_id in partial.items():
+            matches &= items[:, slot] == item_id
+        items, counts, wins = items[matches], counts[matches], wins[matches]
+
+        slots = {}
+        for slot in range(BUILD_SLOTS):
+            if slot in partial:
+                continue
+            slot_items, inverse = np.unique(items[:, slot], return_inverse=True)
+            slot_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+            slot_wins = np.bincount(inverse, weights=wins).astype(np.int64)
+            slots[slot] = [
+                {
+                    "item_id": int(slot_items[i]),
+                    **_stats(int(slot_counts[i]), int(slot_wins[i])),
+                }
+                for i in _top(slot_counts, slot_wins, limit, min_games, sort)
+                if slot_items[i] > 0
+            ]
+        return {
+            "builds": [
+                {"items": items[i].tolist(), **_stats(int(counts[i]), int(wins[i]))}
+                for i in _top(counts, wins, limit, min_games, sort)
+            ],
+            "slots": slots,
+        }
+
+    def save(self, path: str) -> None:
+        """Write the index to a NumPy .npz file atomically, replacing the
+        previous one."""
+        arrays = {
+            f"{name}_{part}": getattr(getattr(self, name), part)
+            for name in ("pairs", "transitions", "builds")
+            for part in ("keys", "counts", "wins")
+        }
+        atomic_write(
+            path,
+            lambda f: np.savez(
+                f, **arrays, build_items=self.build_items, players=self.players
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BuildIndex":
+        """Read an index written by `save`."""
+        index = cls()
+        with np.load(path) as data:
+            for name in ("pairs", "transitions", "builds"):
+                setattr(
+                    index,
+                    name,
+                    SparseCounts(
+                        data[f"{name}_keys"],
+                        data[f"{name}_counts"],
+                        data[f"{name}_wins"],
+                    ),
+                )
+            index.build_items = data["build_items"]
+            index.players = data["players"]
+        index._build_ids = {
+            build.tobytes(): build_id
+            for build_id, build in enumerate(index.build_items)
+        }
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: Optional[str]) -> "BuildIndex":
+        """Read the index at `path` if it exists, otherwise start an empty one."""
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
@@ -0,0 +1,359 @@
+"""
+Vectorized character and weapon statistics.
+
+Aggregates win rate, placement, kills, damage and MMR gain per group of
+character, weapon, match mode and MMR bracket in a single pass over columnar
+player data, using integer group codes and `np.bincount` instead of Python loops.
+
+Player columns come from a UserGameBatch or from the tables of the Arrow cache,
+and are plain NumPy arrays keyed by name (see PLAYER_COLUMNS).
+"""
+
+import csv
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Iterable, Iterator
+import numpy as np
+import pyarrow as pa
+from models.batch import UserGameBatch
+
+
+# Mastery codes below this are weapon masteries (1 Glove ... 25 VF Arm), the
+# rest are movement, search, hunt and similar non-weapon masteries.
+WEAPON_MASTERY_LIMIT = 100
+# Weapon of players without any weapon mastery.
+NO_WEAPON = 0
+# MMR bracket of players without an MMR, e.g. in normal games.
+NO_BRACKET = -1
+
+PLAYER_COLUMNS = (
+    "character_id",
+    "weapon",
+    "match_mode",
+    "mmr_before",
+    "victory",
+    "game_place_result",
+    "kills",
+    "damage_to_player",
+    "mmr_gain",
+)
+GROUP_KEYS = ("character_id", "weapon", "match_mode", "mmr_bracket")
+
+# Output column prefix and player column of every averaged metric.
+_MEAN_METRICS = {
+    "avg_place": "game_place_result",
+    "avg_kills": "kills",
+    "avg_damage": "damage_to_player",
+    "avg_mmr_gain": "mmr_gain",
+}
+# Group codes are counted densely when the key space is at most this large.
+_DENSE_GROUP_LIMIT = 1 << 24
+
+
+def player_weapons(
+    player_index: np.ndarray,
+    mastery_type: np.ndarray,
+    level: np.ndarray,
+    player_count: int,
+) -> np.ndarray:
+    """Pick every player's weapon as their highest-level weapon mastery.
+
+    Args:
+        player_index (np.ndarray): Player of every mastery row.
+        mastery_type (np.ndarray): Mastery code of every mastery row.
+        level (np.ndarray): Mastery level of every mastery row.
+        player_count (int): Number of players.
+
+    Returns:
+        np.ndarray: int32 weapon mastery code per player, NO_WEAPON if none.
+    """
+    weapons = np.full(player_count, NO_WEAPON, dtype=np.int32)
+    is_weapon = mastery_type < WEAPON_MASTERY_LIMIT
+    player_index = player_index[is_weapon]
+    mastery_type = mastery_type[is_weapon]
+    level = level[is_weapon]
+    if not len(player_index):
+        return weapons
+
+    # Sort by player then level; the last row of every player is its best.
+    order = np.lexsort((level, player_index))
+    players = player_index[order]
+    last = np.ones(len(players), dtype=bool)
+    last[:-1] = players[1:] != players[:-1]
+    weapons[players[last]] = mastery_type[order][last]
+    return weapons
+
+
+def columns_from_batch(batch: UserGameBatch) -> dict[str, np.ndarray]:
+    """Extract the player columns from a UserGameBatch.
+
+    The batch must hold the scalar PLAYER_COLUMNS fields and
+    `final_mastery_levels`.
+    """
+    mastery = batch.ragged["final_mastery_levels"]
+    columns = {name: batch[name] for name in PLAYER_COLUMNS if name != "weapon"}
+    columns["weapon"] = player_weapons(
+        mastery.parent_index, mastery.values["key"], mastery.values["value"], len(batch)
+    )
+    return columns
+
+
+def pack_player_keys(game_id: np.ndarray, user_id: np.ndarray) -> np.ndarray:
+    """Pack (game_id, user_id) pairs into single int64 keys.
+
+    Game IDs fit in 32 bits and user IDs in 31, so the pair packs losslessly.
+    """
+    return (game_id.astype(np.int64) << 31) | user_id.astype(np.int64)
+
+
+def to_numpy(column: pa.ChunkedArray, dtype: Any) -> np.ndarray:
+    """Convert an Arrow column to a NumPy array of the given dtype."""
+    if column.null_count:
+        return column.to_numpy().astype(dtype)
+    return column.to_numpy().astype(dtype, copy=False)
+
+
+def lookup(
+    keys: np.ndarray, values: np.ndarray, query: np.ndarray, default: int
+) -> np.ndarray:
+    """Look up the value of every query key, `default` where the key is missing."""
+    if not len(keys):
+        return np.full(len(query), default, dtype=values.dtype)
+    order = np.argsort(keys, kind="stable")
+    position = np.searchsorted(keys, query, sorter=order)
+    position = order[np.minimum(position, len(keys) - 1)]
+    return np.where(keys[position] == query, values[position], default)
+
+
+def columns_from_tables(tables: dict[str, pa.Table]) -> dict[str, np.ndarray]:
+    """Extract the player columns from cached or exported Arrow tables.
+
+    Joins `player_game_stats` with `games` for the match mode and with
+    `mastery_levels` for the weapon.
+
+    Args:
+        tables (dict[str, pa.Table]): At least the player_game_stats, games and
+            mastery_levels tables, e.g. from `ArrowCache.load`.
+
+    Returns:
+        dict[str, np.ndarray]: The PLAYER_COLUMNS arrays, one entry per player.
+    """
+    stats = tables["player_game_stats"]
+    columns = {
+        "character_id": to_numpy(stats["character_id"], np.int32),
+        "victory": to_numpy(stats["victory"], np.bool_),
+        "game_place_result": to_numpy(stats["game_place_result"], np.int32),
+        "kills": to_numpy(stats["kills"], np.int32),
+        "damage_to_player": to_numpy(stats["damage_to_player"], np.int64),
+        "mmr_before": to_numpy(stats["mmr_before"], np.float64),
+        "mmr_gain": to_numpy(stats["mmr_gain"], np.float64),
+    }
+    game_ids = to_numpy(stats["game_id"], np.int64)
+    user_ids = to_numpy(stats["user_id"], np.int64)
+
+    games = tables["games"]
+    columns["match_mode"] = lookup(
+        to_numpy(games["game_id"], np.int64),
+        to_numpy(games["match_mode"], np.int32),
+        game_ids,
+        default=0,
+    )
+
+    mastery = tables["mastery_levels"]
+    player = lookup(
+        pack_player_keys(game_ids, user_ids),
+        np.arange(len(game_ids), dtype=np.int64),
+        pack_player_keys(
+            to_numpy(mastery["game_id"], np.int64),
+            to_numpy(mastery["user_id"], np.int64),
+        ),
+        default=-1,
+    )
+    matched = player >= 0
+    columns["weapon"] = player_weapons(
+        player[matched],
+        to_numpy(mastery["mastery_type"], np.int32)[matched],
+        to_numpy(mastery["level"], np.int32)[matched],
+        len(game_ids),
+    )
+    return columns
+
+
+def mmr_brackets(mmr: np.ndarray, bracket_size: int) -> np.ndarray:
+    """Bucket MMRs into brackets labelled by their lower bound.
+
+    Args:
+        mmr (np.ndarray): MMR per player, NaN when unknown.
+        bracket_size (int): Width of every bracket.
+
+    Returns:
+        np.ndarray: int32 bracket lower bound per player, NO_BRACKET when unknown.
+    """
+    mmr = np.asarray(mmr, dtype=np.float64)
+    known = ~np.isnan(mmr)
+    brackets = np.full(len(mmr), NO_BRACKET, dtype=np.int32)
+    brackets[known] = (mmr[known] // bracket_size * bracket_size).astype(np.int32)
+    return brackets
+
+
+def _factorize(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Integer codes of the values and the value of every code."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iub" and len(values):
+        low, high = int(values.min()), int(values.max())
+        if high - low < _DENSE_GROUP_LIMIT:
+            # Small integer ranges need no sort: count the offsets and number
+            # the values present, so gaps such as between brackets cost nothing.
+            offsets = values.astype(np.int64) - low
+            present = np.bincount(offsets, minlength=high - low + 1) > 0
+            codes = np.cumsum(present) - 1
+            return codes[offsets], np.flatnonzero(present) + low
+    uniques, codes = np.unique(values, return_inverse=True)
+    return codes.astype(np.int64), uniques
+
+
+def wilson_interval(
+    successes: np.ndarray, trials: np.ndarray, z: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval of binomial proportions.
+
+    Args:
+        successes (np.ndarray): Successes per group.
+        trials (np.ndarray): Trials per group, all positive.
+        z (float): Standard normal quantile of the confidence level.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Lower and upper bounds per group.
+    """
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    center = (p + z**2 / (2 * trials)) / denominator
+    margin = z * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    return center - margin, center + margin
+
+
+@dataclass
+class GroupStats:
+    """Per-group statistics, one array entry per group.
+
+    Attributes:
+        keys (tuple[str, ...]): Names of the group key columns.
+        columns (dict[str, np.ndarray]): Key columns followed by `games`,
+            `win_rate` with its `win_rate_low`/`win_rate_high` interval, and every
+            average with its `<name>_ci` confidence half-width.
+    """
+
+    keys: tuple[str, ...]
+    columns: dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.columns["games"])
+
+    def sort(self, column: str, descending: bool = True) -> "GroupStats":
+        """Order the groups by a column, NaNs last."""
+        values = self.columns[column].astype(np.float64)
+        order = np.argsort(-values if descending else values, kind="stable")
+        return GroupStats(
+            self.keys, {name: array[order] for name, array in self.columns.items()}
+        )
+
+    def records(self) -> Iterator[dict[str, Any]]:
+        """Yield one dict per group with Python scalars."""
+        names = list(self.columns)
+        for values in zip(*(self.columns[name].tolist() for name in names)):
+            yield dict(zip(names, values))
+
+    def to_csv(self, path: str) -> None:
+        """Write the groups to a CSV file."""
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.columns))
+            writer.writeheader()
+            writer.writerows(self.records())
+
+
+def group_stats(
+    columns: dict[str, np.ndarray],
+    by: Iterable[str] = GROUP_KEYS,
+    bracket_size: int = 1000,
+    min_games: int = 30,
+    confidence: float = 0.95,
+) -> GroupStats:
+    """Aggregate player columns per group in one vectorized pass.
+
+    Args:
+        columns (dict[str, np.ndarray]): The PLAYER_COLUMNS arrays.
+        by (Iterable[str]): Group keys, any of GROUP_KEYS.
+        bracket_size (int): Width of the `mmr_bracket` key's MMR brackets.
+        min_games (int): Groups with fewer players are dropped.
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        GroupStats: The groups with at least `min_games` players, in key order.
+
+    Raises:
+        ValueError: If a group key is unknown.
+    """
+    by = tuple(by)
+    unknown = [key for key in by if key not in GROUP_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown group keys: {', '.join(unknown)}")
+
+    key_values = {
+        key: (
+            mmr_brackets(columns["mmr_before"], bracket_size)
+            if key == "mmr_bracket"
+            else columns[key]
+        )
+        for key in by
+    }
+    player_count = len(columns["character_id"])
+
+    # Combine the per-key codes into one mixed-radix group code per player.
+    group = np.zeros(player_count, dtype=np.int64)
+    radices = []
+    for key in by:
+        codes, uniques = _factorize(key_values[key])
+        group = group * len(uniques) + codes
+        radices.append(uniques)
+    group_space = int(np.prod([len(uniques) for uniques in radices], dtype=np.float64))
+    if group_space <= _DENSE_GROUP_LIMIT:
+        group_ids, inverse = None, group
+        size = max(group_space, 1)
+    else:
+        group_ids, inverse = np.unique(group, return_inverse=True)
+        size = len(group_ids)
+
+    games = np.bincount(inverse, minlength=size)
+    keep = np.flatnonzero(games >= max(min_games, 1))
+    games = games[keep]
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    # Decode the kept group codes back into key values.
+    codes = keep if group_ids is None else group_ids[keep]
+    result: dict[str, np.ndarray] = {}
+    for key, uniques in reversed(list(zip(by, radices))):
+        codes, code = np.divmod(codes, len(uniques))
+        result[key] = uniques[code]
+    result = {key: result[key] for key in by}
+    result["games"] = games
+
+    wins = np.bincount(inverse, weights=columns["victory"], minlength=size)[keep]
+    result["win_rate"] = wins / games
+    result["win_rate_low"], result["win_rate_high"] = wilson_interval(wins, games, z)
+
+    for name, column in _MEAN_METRICS.items():
+        values = np.asarray(columns[column], dtype=np.float64)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.0)
+        count = np.bincount(inverse, weights=valid, minlength=size)[keep]
+        total = np.bincount(inverse, weights=values, minlength=size)[keep]
+        squares = np.bincount(inverse, weights=values * values, minlength=size)[keep]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            variance = np.maximum(squares / count - mean * mean, 0.0)
+            # Sample standard deviation; undefined for single observations.
+            std = np.sqrt(variance * count / (count - 1))
+            result[name] = mean
+            result[f"{name}_ci"] = z * std / np.sqrt(count)
+
+    return GroupStats(by, result)
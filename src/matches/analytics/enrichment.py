@@ -0,0 +1,238 @@
+"""
+ID to name enrichment from the l10n data.
+
+Character, item, area and weather IDs are labelled from the l10n JSON files
+(`character_name.json`, `item_name.json`, `weather_name.json`, and
+`area_name.json` through the hand-made `area_codes.json`). Each kind of ID is
+loaded once into a `LabelTable`: a dense int32 array mapping every ID to its
+position among the names, so a whole column is labelled with one NumPy gather
+and returned as a dictionary-encoded Arrow array sharing a single copy of the
+names. Several languages can be loaded side by side.
+"""
+
+import json
+import os
+from typing import Any, Mapping, Optional, Sequence
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# IDs up to this are looked up in a dense array, larger ones are binary searched.
+DENSE_LIMIT = 1 << 22
+DEFAULT_LANGUAGE = "English"
+# l10n category naming every kind of ID.
+KIND_CATEGORIES = {
+    "character": "character_name",
+    "item": "item_name",
+    "weather": "weather_name",
+    "area": "area_name",
+}
+# Area codes to the `area_name` keys, shared by every language. The file is made
+# by hand, so it only lives in the top-level `jsons` directory.
+AREA_CODES_FILE = "area_codes.json"
+# Columns labelled by `Enricher.labels`: the kind of ID held and the name column.
+LABEL_COLUMNS = {
+    "character_id": ("character", "character_name"),
+    "item_id": ("item", "item_name"),
+    "starting_area": ("area", "starting_area_name"),
+    "died_area": ("area", "died_area_name"),
+    "main_weather": ("weather", "main_weather_name"),
+    "sub_weather": ("weather", "sub_weather_name"),
+    "main_weather_code": ("weather", "main_weather_name"),
+    "sub_weather_code": ("weather", "sub_weather_name"),
+}
+
+
+def integer_ids(values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Read a column of IDs as int64, whatever its type.
+
+    Args:
+        values (Any): A NumPy array, Arrow array or sequence of integers,
+            floats or numeric strings, such as the string `died_area`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The IDs, and a mask of the values that
+        are missing or not integers.
+    """
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    elif not isinstance(values, pa.Array):
+        values = pa.array(values, from_pandas=True)
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        numeric = pc.fill_null(
+            pc.match_substring_regex(values, r"^-?[0-9]{1,18}$"), False
+        )
+        values = pc.if_else(numeric, values, pa.scalar(None, values.type))
+    if pa.types.is_floating(values.type):
+        values = pc.if_else(pc.is_nan(values), pa.scalar(None, values.type), values)
+    values = pc.cast(values, pa.int64(), safe=False)
+    missing = values.is_null().to_numpy(zero_copy_only=False)
+    return values.fill_null(0).to_numpy(zero_copy_only=False), missing
+
+
+class LabelTable:
+    """Names of integer IDs, gathered for whole columns at once.
+
+    Args:
+        mapping (dict[int, str]): Name of every known ID.
+
+    Attributes:
+        ids (np.ndarray): Sorted known IDs.
+        names (pa.Array): Names aligned with `ids`.
+        dense (Optional[np.ndarray]): Position in `names` of every ID up to the
+            largest, -1 if unknown; None if IDs are negative or above DENSE_LIMIT.
+    """
+
+    def __init__(self, mapping: dict[int, str]):
+        self.ids = np.array(sorted(mapping), np.int64)
+        self.names = pa.array([mapping[key] for key in self.ids.tolist()], pa.string())
+        self.dense: Optional[np.ndarray] = None
+        if len(self.ids) and self.ids[0] >= 0 and self.ids[-1] < DENSE_LIMIT:
+            self.dense = np.full(self.ids[-1] + 1, -1, np.int32)
+            self.dense[self.ids] = np.arange(len(self.ids), dtype=np.int32)
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """Position in `names` of every ID, -1 for unknown IDs."""
+        ids = np.asarray(ids, np.int64)
+        if self.dense is not None:
+            known = (ids >= 0) & (ids < len(self.dense))
+            return np.where(known, self.dense[np.where(known, ids, 0)], -1)
+        if not len(self.ids):
+            return np.full(len(ids), -1, np.int32)
+        position = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[position] == ids, position, -1).astype(np.int32)
+
+    def label(self, values: Any) -> pa.DictionaryArray:
+        """Name every ID of a column, null for unknown or missing IDs.
+
+        Args:
+            values (Any): The IDs, see `integer_ids`.
+
+        Returns:
+            pa.DictionaryArray: The names, indices into `names`.
+        """
+        ids, missing = integer_ids(values)
+        positions = self.positions(ids)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(positions, pa.int32(), mask=missing | (positions < 0)),
+            self.names,
+        )
+
+
+def l10n_jsons_dir(l10n_dir: str, language: str) -> str:
+    """The JSON directory of a language under the l10n data directory.
+
+    Languages maintained by `l10n_refresh.py` live in `<Language>/jsons`; the
+    English files split by hand live in `jsons`.
+
+    Raises:
+        FileNotFoundError: If the language has no JSON directory.
+    """
+    path = os.path.join(l10n_dir, language, "jsons")
+    if os.path.isdir(path):
+        return path
+    if language == DEFAULT_LANGUAGE and os.path.isdir(os.path.join(l10n_dir, "jsons")):
+        return os.path.join(l10n_dir, "jsons")
+    raise FileNotFoundError(f"No l10n JSON files for {language} in {l10n_dir}")
+
+
+def _read_json(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_label_tables(l10n_dir: str, language: str) -> dict[str, LabelTable]:
+    """Load the label table of every kind of ID in KIND_CATEGORIES for a language.
+
+    Area codes are mapped to their `area_name` key through `area_codes.json` of
+    the top-level `jsons` directory; areas missing from `area_name` keep that key.
+    """
+    jsons_dir = l10n_jsons_dir(l10n_dir, language)
+    tables = {}
+    for kind, category in KIND_CATEGORIES.items():
+        texts = _read_json(os.path.join(jsons_dir, f"{category}.json"))
+        if kind == "area":
+            area_codes = os.path.join(l10n_dir, "jsons", AREA_CODES_FILE)
+            areas = _read_json(area_codes)["areas"]
+            mapping = {
+                area["code"]: texts.get(area["name"], area["name"]) for area in areas
+            }
+        else:
+            mapping = {
+                int(key): text
+                for key, text in texts.items()
+                if key.lstrip("-").isdigit()
+            }
+        tables[kind] = LabelTable(mapping)
+    return tables
+
+
+class Enricher:
+    """Label ID columns with their names in one or more languages.
+
+    Name columns of the first language are called as in LABEL_COLUMNS, e.g.
+    `character_name`; those of other languages get the lowercased language as a
+    suffix, e.g. `character_name_korean`.
+
+    Args:
+        l10n_dir (str): The l10n data directory, see `l10n_jsons_dir`.
+        languages (Sequence[str]): Languages to label in.
+
+    Example:
+        enricher = Enricher(L10N_PATH, ["English", "Korean"])
+        table = enricher.enrich_table(table)
+        names = enricher.label("character", batch["character_id"])
+    """
+
+    def __init__(self, l10n_dir: str, languages: Sequence[str] = (DEFAULT_LANGUAGE,)):
+        if not languages:
+            raise ValueError("At least one language is required")
+        self.languages = list(languages)
+        self.tables = {
+            language: load_label_tables(l10n_dir, language)
+            for language in self.languages
+        }
+
+    def label(
+        self, kind: str, values: Any, language: Optional[str] = None
+    ) -> pa.DictionaryArray:
+        """Name a column of IDs of a kind in KIND_CATEGORIES.
+
+        Raises:
+            KeyError: If the kind or language is unknown.
+        """
+        return self.tables[language or self.languages[0]][kind].label(values)
+
+    def column_name(self, name: str, language: str) -> str:
+        if language == self.languages[0]:
+            return name
+        return f"{name}_{language.lower()}"
+
+    def labels(self, columns: Mapping[str, Any]) -> dict[str, pa.DictionaryArray]:
+        """Name columns of every column in LABEL_COLUMNS, in every language.
+
+        Args:
+            columns (Mapping[str, Any]): Columns by name, e.g. of a UserGameBatch
+                or an Arrow table; columns not in LABEL_COLUMNS are ignored.
+
+        Returns:
+            dict[str, pa.DictionaryArray]: The name columns by name.
+        """
+        labelled = {}
+        for column, (kind, name) in LABEL_COLUMNS.items():
+            if column not in columns:
+                continue
+            for language in self.languages:
+                labelled[self.column_name(name, language)] = self.label(
+                    kind, columns[column], language
+                )
+        return labelled
+
+    def enrich_table(self, table: pa.Table) -> pa.Table:
+        """Append the name columns of an Arrow table's ID columns."""
+        columns = {name: table.column(name) for name in table.column_names}
+        for name, names in self.labels(columns).items():
+            if name not in columns:
+                table = table.append_column(name, names)
+        return table
@@ -0,0 +1,414 @@
+"""
+Kill graph analytics over killed_by_data.
+
+Every death in `killed_by_data` is an edge from the killer's character and weapon
+(stored by name) to the victim's character (the `character_id` of the victim's
+player_game_stats row), located in `died_area`. The graph keeps three sparse
+count matrices in CSR form, rows indexing the source and columns the victim
+character:
+
+- kills: killer character x victim character,
+- weapon_kills: killer weapon x victim character,
+- area_deaths: death area x victim character, a heatmap counting every death
+  whatever the killer,
+
+plus phase_kills, the sum of `early_kills`, `midgame_kills` and `lategame_kills`
+(columns 0 to 2) per character.
+
+Names are coded by a growing Vocabulary, so batches are merged by concatenating
+their (row, column) pairs with the existing entries and summing duplicates.
+Players already in the graph are skipped and archive files already read are not
+parsed again, making updates incremental. The phase kills are not part of the
+stored tables, so the graph is fed from UserGameBatch columns rather than from
+the Arrow cache.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Union
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from archive import archive_index
+from models.batch import UserGameBatch
+from models.game import UserGame
+from analytics.character_stats import lookup, pack_player_keys
+from storage.atomic import atomic_write
+
+
+PHASES = ("early", "midgame", "lategame")
+# UserGame fields read by KillGraph.add_batch.
+BATCH_FIELDS = (
+    "game_id",
+    "user_id",
+    "character_id",
+    *(f"{phase}_kills" for phase in PHASES),
+    "killed_by_data",
+)
+
+
+class Vocabulary:
+    """Dense integer codes for names, in order of first appearance.
+
+    Args:
+        names (Iterable[str]): Names already coded, code i being names[i].
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: list[str] = list(names)
+        self._codes = {name: code for code, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def code(self, name: str) -> Optional[int]:
+        """Code of a name, or None if it was never seen."""
+        return self._codes.get(name)
+
+    def _add(self, name: Optional[str]) -> int:
+        if not name:
+            return -1
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def encode(self, values: Union[np.ndarray, list[str]]) -> np.ndarray:
+        """Code every value, adding unseen names; empty names are coded -1.
+
+        Only the distinct values go through Python, the rest is a dictionary
+        encoding and a take.
+        """
+        encoded = pc.dictionary_encode(pa.array(values, pa.string()))
+        codes = np.array(
+            [self._add(name) for name in encoded.dictionary.to_pylist()] + [-1],
+            dtype=np.int64,
+        )
+        # Null values take the trailing -1.
+        indices = encoded.indices.fill_null(len(codes) - 1)
+        return codes[indices.to_numpy(zero_copy_only=False)]
+
+
+@dataclass
+class CSRMatrix:
+    """Sparse count matrix in compressed sparse row form.
+
+    Attributes:
+        indptr (np.ndarray): int64 offsets of every row's entries, rows + 1 long.
+        indices (np.ndarray): int64 column of every entry, sorted within rows.
+        data (np.ndarray): int64 count of every entry.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "CSRMatrix":
+        return cls(np.zeros(1, np.int64), np.empty(0, np.int64), np.empty(0, np.int64))
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_cols(self) -> int:
+        return int(self.indices.max()) + 1 if len(self.indices) else 0
+
+    def rows(self) -> np.ndarray:
+        """Row of every entry, the COO counterpart of `indices`."""
+        return np.repeat(np.arange(self.n_rows, dtype=np.int64), np.diff(self.indptr))
+
+    def add(
+        self, rows: np.ndarray, cols: np.ndarray, weights: Optional[np.ndarray] = None
+    ) -> None:
+        """Add a weight, 1 by default, at every (row, column) pair."""
+        if not len(rows):
+            return
+        if weights is None:
+            weights = np.ones(len(rows), np.int64)
+        keys = np.concatenate(
+            [
+                (self.rows() << 32) | self.indices,
+                (rows.astype(np.int64) << 32) | cols.astype(np.int64),
+            ]
+        )
+        keys, inverse = np.unique(keys, return_inverse=True)
+        weights = np.concatenate([self.data, weights.astype(np.int64)])
+        self.data = np.bincount(inverse, weights=weights).astype(np.int64)
+        self.indices = keys & 0xFFFFFFFF
+        row_counts = np.bincount(keys >> 32, minlength=self.n_rows)
+        self.indptr = np.concatenate([[0], np.cumsum(row_counts)]).astype(np.int64)
+
+    def row(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        """Columns and counts of a row's entries."""
+        if row >= self.n_rows:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        entries = slice(self.indptr[row], self.indptr[row + 1])
+        return self.indices[entries], self.data[entries]
+
+    def column(self, col: int) -> tuple[np.ndarray, np.ndarray]:
+        """Rows and counts of a column's entries."""
+        entries = self.indices == col
+        return self.rows()[entries], self.data[entries]
+
+    def to_dense(self) -> np.ndarray:
+        """The matrix as a dense (rows, columns) int64 array."""
+        dense = np.zeros((self.n_rows, self.n_cols), np.int64)
+        dense[self.rows(), self.indices] = self.data
+        return dense
+
+
+def _ranked(
+    key: str, labels: list[Any], counts: np.ndarray, limit: Optional[int]
+) -> list[dict[str, Any]]:
+    total = int(counts.sum())
+    order = np.argsort(-counts, kind="stable")[:limit]
+    return [
+        {key: labels[i], "count": int(counts[i]), "share": float(counts[i] / total)}
+        for i in order
+    ]
+
+
+class KillGraph:
+    """Kill and death counts over indexed players.
+
+    Attributes:
+        kills (CSRMatrix): Killer character code x victim character ID.
+        weapon_kills (CSRMatrix): Killer weapon code x victim character ID.
+        area_deaths (CSRMatrix): Death area code x victim character ID.
+        phase_kills (CSRMatrix): Character ID x phase, kills summed per phase.
+        killer_characters (Vocabulary): Codes of killer character names.
+        weapons (Vocabulary): Codes of killer weapon names.
+        areas (Vocabulary): Codes of death areas.
+        players (np.ndarray): Sorted packed (game_id, user_id) keys indexed so far.
+        files (dict[str, list]): Size and modification time of every archive
+            file indexed by `add_archive`, relative to the archive root.
+    """
+
+    def __init__(self):
+        self.kills = CSRMatrix.empty()
+        self.weapon_kills = CSRMatrix.empty()
+        self.area_deaths = CSRMatrix.empty()
+        self.phase_kills = CSRMatrix.empty()
+        self.killer_characters = Vocabulary()
+        self.weapons = Vocabulary()
+        self.areas = Vocabulary()
+        self.players = np.empty(0, np.int64)
+        self.files: dict[str, list] = {}
+
+    def add(
+        self,
+        players: np.ndarray,
+        character_id: np.ndarray,
+        phase_kills: np.ndarray,
+        death_players: np.ndarray,
+        killer_character: np.ndarray,
+        killer_weapon: np.ndarray,
+        died_area: np.ndarray,
+    ) -> int:
+        """Index a batch of players and their deaths, skipping indexed players.
+
+        Args:
+            players (np.ndarray): Packed (game_id, user_id) key per player.
+            character_id (np.ndarray): Character per player.
+            phase_kills (np.ndarray): (players, 3) early, midgame and lategame
+                kills per player.
+            death_players (np.ndarray): Packed key of the victim of every death.
+            killer_character (np.ndarray): Killer character code per death, -1
+                when not killed by a player.
+            killer_weapon (np.ndarray): Killer weapon code per death, -1 if none.
+            died_area (np.ndarray): Area code per death, -1 if unknown.
+
+        Returns:
+            int: Number of players newly indexed.
+        """
+        _, first = np.unique(players, return_index=True)
+        new = first[~np.isin(players[first], self.players)]
+        if not len(new):
+            return 0
+        players = players[new]
+        character_id = character_id[new].astype(np.int64)
+
+        self.phase_kills.add(
+            np.repeat(character_id, len(PHASES)),
+            np.tile(np.arange(len(PHASES)), len(new)),
+            phase_kills[new].ravel(),
+        )
+
+        # Deaths of new players only, with the victim's character.
+        victim = lookup(players, character_id, death_players, default=-1)
+        known = victim >= 0
+        by_player = known & (killer_character >= 0)
+        self.kills.add(killer_character[by_player], victim[by_player])
+        with_weapon = known & (killer_weapon >= 0)
+        self.weapon_kills.add(killer_weapon[with_weapon], victim[with_weapon])
+        in_area = known & (died_area >= 0)
+        self.area_deaths.add(died_area[in_area], victim[in_area])
+
+        self.players = np.union1d(self.players, players)
+        return len(players)
+
+    def add_batch(self, batch: UserGameBatch) -> int:
+        """Index the players of a columnar batch holding BATCH_FIELDS; see `add`."""
+        players = pack_player_keys(batch["game_id"], batch["user_id"])
+        deaths = batch["killed_by_data"]
+        return self.add(
+            players,
+            batch["character_id"],
+            np.column_stack([batch[f"{phase}_kills"] for phase in PHASES]),
+            players[deaths.parent_index],
+            self.killer_characters.encode(deaths.values["killed_by_character"]),
+            self.weapons.encode(deaths.values["killed_by_character_weapon"]),
+            self.areas.encode(deaths.values["died_area"]),
+        )
+
+    def add_user_games(self, games: Iterable[UserGame]) -> int:
+        """Index validated players; see `add`."""
+        return self.add_batch(UserGameBatch.from_user_games(games, BATCH_FIELDS))
+
+    def add_archive(self, archive_dir: str, files_per_batch: int = 500) -> int:
+        """Index the archive files added or rewritten since they were last read.
+
+        Args:
+            archive_dir (str): The archive root.
+            files_per_batch (int): Archive files parsed at once.
+
+        Returns:
+            int: Number of players newly indexed.
+        """
+        index = archive_index(archive_dir)
+        paths = [
+            path for path, entry in index.items() if self.files.get(path) != list(entry)
+        ]
+        added = 0
+        for start in range(0, len(paths), files_per_batch):
+            chunk = paths[start : start + files_per_batch]
+            added += self.add_batch(
+                UserGameBatch.from_json_files(
+                    [os.path.join(archive_dir, path) for path in chunk], BATCH_FIELDS
+                )
+            )
+            self.files.update({path: list(index[path]) for path in chunk})
+        return added
+
+    def killers_of(
+        self, character_id: int, limit: Optional[int] = 10, by: str = "character"
+    ) -> list[dict[str, Any]]:
+        """Characters or weapons that killed a character most.
+
+        Args:
+            character_id (int): The victim character.
+            limit (Optional[int]): Number of killers to return, all when None.
+            by (str): Rank killer "character" or "weapon" names.
+
+        Returns:
+            list[dict[str, Any]]: Killer name under the `by` key, with count and
+            share of the kills.
+        """
+        if by == "character":
+            matrix, vocabulary = self.kills, self.killer_characters
+        elif by == "weapon":
+            matrix, vocabulary = self.weapon_kills, self.weapons
+        else:
+            raise ValueError(f"Unknown killer kind: {by}")
+        rows, counts = matrix.column(character_id)
+        return _ranked(by, [vocabulary.names[row] for row in rows], counts, limit)
+
+    def victims_of(
+        self, killer_character: str, limit: Optional[int] = 10
+    ) -> list[dict[str, Any]]:
+        """Victim characters a killer character killed most.
+
+        Args:
+            killer_character (str): Killer character name as stored.
+            limit (Optional[int]): Number of victims to return, all when None.
+
+        Returns:
+            list[dict[str, Any]]: Victim character_id with count and share.
+        """
+        code = self.killer_characters.code(killer_character)
+        if code is None:
+            return []
+        cols, counts = self.kills.row(code)
+        return _ranked("character_id", cols.tolist(), counts, limit)
+
+    def area_heatmap(
+        self, character_id: Optional[int] = None, limit: Optional[int] = None
+    ) -> list[dict[str, Any]]:
+        """Deaths per area, of one character or of all.
+
+        Args:
+            character_id (Optional[int]): Victim character, all when omitted.
+            limit (Optional[int]): Number of areas to return, all when None.
+
+        Returns:
+            list[dict[str, Any]]: Area with death count and share.
+        """
+        if character_id is None:
+            counts = np.bincount(
+                self.area_deaths.rows(),
+                weights=self.area_deaths.data,
+                minlength=len(self.areas),
+            ).astype(np.int64)
+            rows = np.flatnonzero(counts)
+            counts = counts[rows]
+        else:
+            rows, counts = self.area_deaths.column(character_id)
+        return _ranked("area", [self.areas.names[row] for row in rows], counts, limit)
+
+    def phase_distribution(self, character_id: int) -> dict[str, float]:
+        """Share of a character's kills scored in each game phase."""
+        phases, counts = self.phase_kills.row(character_id)
+        total = counts.sum()
+        shares = dict.fromkeys(PHASES, 0.0)
+        for phase, count in zip(phases, counts):
+            shares[PHASES[phase]] = float(count / total)
+        return shares
+
+    def save(self, path: str) -> None:
+        """Write the graph to exactly `path` as a NumPy .npz file, atomically."""
+        arrays = {
+            f"{name}_{part}": getattr(getattr(self, name), part)
+            for name in ("kills", "weapon_kills", "area_deaths", "phase_kills")
+            for part in ("indptr", "indices", "data")
+        }
+        arrays.update(
+            killer_characters=np.array(self.killer_characters.names, dtype=str),
+            weapons=np.array(self.weapons.names, dtype=str),
+            areas=np.array(self.areas.names, dtype=str),
+            players=self.players,
+            files=np.array(json.dumps(self.files)),
+        )
+        atomic_write(path, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, path: str) -> "KillGraph":
+        """Read a graph written by `save`."""
+        graph = cls()
+        with np.load(path) as data:
+            for name in ("kills", "weapon_kills", "area_deaths", "phase_kills"):
+                setattr(
+                    graph,
+                    name,
+                    CSRMatrix(
+                        data[f"{name}_indptr"],
+                        data[f"{name}_indices"],
+                        data[f"{name}_data"],
+                    ),
+                )
+            for name in ("killer_characters", "weapons", "areas"):
+                setattr(graph, name, Vocabulary(data[name].tolist()))
+            graph.players = data["players"]
+            graph.files = json.loads(data["files"].item())
+        return graph
+
+    @classmethod
+    def load_or_create(cls, path: str) -> "KillGraph":
+        """Read the graph at `path` if it exists, otherwise start an empty one."""
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
@@ -0,0 +1,335 @@
+"""
+Team composition synergy index.
+
+Teams are the players of a game sharing a `team_id`, as grouped by
+`group_by_team`. Every complete duo or trio (as many members as the game's
+`match_team_mode`) is counted once under its composition, the sorted character
+IDs packed into one int64 key, and once under each of its character pairs.
+
+Per key the index keeps the team games, wins, summed placement and summed MMR
+gain (the mean over the members reporting one), as arrays aligned with the
+sorted keys. Batches are buffered and merged in one sorted pass, so adding a game
+is cheap and queries are vectorized over the arrays. Teams already counted are
+skipped, making updates idempotent.
+"""
+
+import json
+import os
+from statistics import NormalDist
+from typing import Any, Iterable, Optional
+import numpy as np
+from archive import archive_index
+from models.batch import UserGameBatch
+from models.game import UserGame
+from analytics.character_stats import pack_player_keys, wilson_interval
+from storage.atomic import atomic_write
+
+
+# Character IDs are packed into 21 bits each, 0 padding duo keys.
+CHARACTER_BITS = 21
+_CHARACTER_MASK = (1 << CHARACTER_BITS) - 1
+TEAM_SIZES = (2, 3)
+# UserGame fields read by TeamSynergyIndex.add_batch.
+BATCH_FIELDS = (
+    "game_id",
+    "user_id",
+    "team_id",
+    "character_id",
+    "match_team_mode",
+    "victory",
+    "game_place_result",
+    "mmr_gain",
+)
+# Summed columns, in the order of the stats arrays.
+STAT_COLUMNS = ("games", "wins", "place", "mmr_gain", "mmr_games")
+
+
+def pack_characters(characters: np.ndarray) -> np.ndarray:
+    """Pack rows of sorted character IDs, 0 for missing members, into keys."""
+    keys = np.zeros(len(characters), np.int64)
+    for column in range(characters.shape[1]):
+        keys = (keys << CHARACTER_BITS) | characters[:, column]
+    return keys
+
+
+def unpack_characters(key: int) -> list[int]:
+    """Character IDs of a composition or pair key, in ascending order."""
+    characters = []
+    while key:
+        characters.append(int(key & _CHARACTER_MASK))
+        key >>= CHARACTER_BITS
+    return characters[::-1]
+
+
+class _KeyedStats:
+    """Summed STAT_COLUMNS per sorted unique int64 key."""
+
+    def __init__(
+        self, keys: Optional[np.ndarray] = None, stats: Optional[np.ndarray] = None
+    ):
+        self.keys = np.empty(0, np.int64) if keys is None else keys
+        self.stats = (
+            np.empty((0, len(STAT_COLUMNS)), np.float64) if stats is None else stats
+        )
+
+    def add(self, keys: np.ndarray, stats: np.ndarray) -> None:
+        if not len(keys):
+            return
+        keys, inverse = np.unique(
+            np.concatenate([self.keys, keys]), return_inverse=True
+        )
+        stats = np.concatenate([self.stats, stats])
+        self.stats = np.column_stack(
+            [
+                np.bincount(inverse, weights=stats[:, column], minlength=len(keys))
+                for column in range(len(STAT_COLUMNS))
+            ]
+        )
+        self.keys = keys
+
+
+class TeamSynergyIndex:
+    """Games, wins, placement and MMR gain per team composition and character pair.
+
+    Attributes:
+        compositions (_KeyedStats): Stats per packed sorted duo or trio.
+        pairs (_KeyedStats): Stats per packed sorted character pair.
+        teams (np.ndarray): Sorted `game_id << 8 | team_id` keys counted so far,
+            team IDs being below 256.
+        files (dict[str, list]): Size and modification time of every archive
+            file indexed by `add_archive`, relative to the archive root.
+    """
+
+    def __init__(self):
+        self.compositions = _KeyedStats()
+        self.pairs = _KeyedStats()
+        self.teams = np.empty(0, np.int64)
+        self.files: dict[str, list] = {}
+        self._pending: list[dict[str, np.ndarray]] = []
+
+    def add_batch(self, batch: UserGameBatch) -> None:
+        """Buffer the players of a columnar batch holding BATCH_FIELDS.
+
+        Buffered players are merged on `flush`, which every query and `save`
+        calls first. A team's members must all be in the same batch.
+        """
+        if len(batch):
+            self._pending.append({field: batch[field] for field in BATCH_FIELDS})
+
+    def add_user_games(self, games: Iterable[UserGame]) -> None:
+        """Buffer validated players; see `add_batch`."""
+        self.add_batch(UserGameBatch.from_user_games(games, BATCH_FIELDS))
+
+    def add_teams(self, teams: dict[int, list[UserGame]]) -> None:
+        """Buffer the teams of one game as returned by `group_by_team`."""
+        self.add_user_games(game for members in teams.values() for game in members)
+
+    def flush(self) -> int:
+        """Merge the buffered players into the index.
+
+        Returns:
+            int: Number of teams newly counted.
+        """
+        if not self._pending:
+            return 0
+        columns = {
+            field: np.concatenate([pending[field] for pending in self._pending])
+            for field in BATCH_FIELDS
+        }
+        self._pending = []
+
+        # A player stored twice would make their team look larger.
+        _, unique = np.unique(
+            pack_player_keys(columns["game_id"], columns["user_id"]),
+            return_index=True,
+        )
+        columns = {field: column[unique] for field, column in columns.items()}
+
+        # Group members by team, characters ascending within each team.
+        team = (columns["game_id"].astype(np.int64) << 8) | columns["team_id"]
+        order = np.lexsort((columns["character_id"], team))
+        columns = {field: column[order] for field, column in columns.items()}
+        team = team[order]
+        boundary = np.r_[True, team[1:] != team[:-1]]
+        starts = np.flatnonzero(boundary)
+        sizes = np.diff(np.r_[starts, len(team)])
+        complete = (sizes == columns["match_team_mode"][starts]) & np.isin(
+            sizes, TEAM_SIZES
+        )
+        complete &= ~np.isin(team[starts], self.teams)
+        # Position of every member's team among the complete teams, -1 if none.
+        position = np.full(len(starts), -1)
+        position[complete] = np.arange(complete.sum())
+        member_position = position[np.cumsum(boundary) - 1]
+        starts, sizes = starts[complete], sizes[complete]
+        if not len(starts):
+            return 0
+
+        characters = np.zeros((len(starts), max(TEAM_SIZES)), np.int64)
+        for member in range(max(TEAM_SIZES)):
+            # Left pad duos with 0 so the columns stay sorted.
+            present = sizes > member
+            column = max(TEAM_SIZES) - sizes[present] + member
+            characters[present, column] = columns["character_id"][
+                starts[present] + member
+            ]
+
+        mmr = columns["mmr_gain"].astype(np.float64)
+        reported = (member_position >= 0) & ~np.isnan(mmr)
+        mmr_sum = np.bincount(
+            member_position[reported], weights=mmr[reported], minlength=len(starts)
+        )
+        mmr_members = np.bincount(member_position[reported], minlength=len(starts))
+        has_mmr = mmr_members > 0
+        stats = np.column_stack(
+            [
+                np.ones(len(starts)),
+                columns["victory"][starts],
+                columns["game_place_result"][starts],
+                np.where(has_mmr, mmr_sum / np.maximum(mmr_members, 1), 0.0),
+                has_mmr,
+            ]
+        ).astype(np.float64)
+        self.compositions.add(pack_characters(characters), stats)
+
+        pair_keys, pair_stats = [], []
+        for first in range(max(TEAM_SIZES)):
+            for second in range(first + 1, max(TEAM_SIZES)):
+                present = characters[:, first] > 0
+                pair_keys.append(
+                    pack_characters(characters[present][:, [first, second]])
+                )
+                pair_stats.append(stats[present])
+        self.pairs.add(np.concatenate(pair_keys), np.concatenate(pair_stats))
+
+        self.teams = np.union1d(self.teams, team[starts])
+        return len(starts)
+
+    def add_archive(self, archive_dir: str, files_per_batch: int = 500) -> int:
+        """Index the archive files added or rewritten since they were last read.
+
+        Args:
+            archive_dir (str): The archive root.
+            files_per_batch (int): Archive files parsed at once.
+
+        Returns:
+            int: Number of teams newly counted.
+        """
+        index = archive_index(archive_dir)
+        paths = [
+            path for path, entry in index.items() if self.files.get(path) != list(entry)
+        ]
+        added = 0
+        for start in range(0, len(paths), files_per_batch):
+            chunk = paths[start : start + files_per_batch]
+            self.add_batch(
+                UserGameBatch.from_json_files(
+                    [os.path.join(archive_dir, path) for path in chunk], BATCH_FIELDS
+                )
+            )
+            added += self.flush()
+            self.files.update({path: list(index[path]) for path in chunk})
+        return added
+
+    def top(
+        self,
+        kind: str = "composition",
+        limit: int = 10,
+        min_games: int = 30,
+        character_id: Optional[int] = None,
+        confidence: float = 0.95,
+    ) -> list[dict[str, Any]]:
+        """Best compositions or pairs by the lower Wilson bound of their win rate.
+
+        Ranking by the lower bound rather than the raw win rate keeps rarely
+        played teams with a few lucky wins from topping the list.
+
+        Args:
+            kind (str): "composition" for duos and trios, "pair" for pairs.
+            limit (int): Number of entries to return.
+            min_games (int): Minimum team games per entry.
+            character_id (Optional[int]): Only entries including this character.
+            confidence (float): Confidence level of the Wilson bound.
+
+        Returns:
+            list[dict[str, Any]]: Entries with `characters`, games, wins,
+            win_rate, win_rate_low, avg_place and avg_mmr_gain (None if no
+            member reported MMR).
+
+        Raises:
+            ValueError: If the kind is unknown.
+        """
+        self.flush()
+        if kind == "composition":
+            table = self.compositions
+        elif kind == "pair":
+            table = self.pairs
+        else:
+            raise ValueError(f"Unknown kind: {kind}")
+        games, wins, place, mmr_gain, mmr_games = table.stats.T
+        candidates = games >= max(min_games, 1)
+        if character_id is not None:
+            member = np.zeros(len(table.keys), dtype=bool)
+            for shift in range(0, 3 * CHARACTER_BITS, CHARACTER_BITS):
+                member |= (table.keys >> shift) & _CHARACTER_MASK == character_id
+            candidates &= member
+        candidates = np.flatnonzero(candidates)
+
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        low, _ = wilson_interval(wins[candidates], games[candidates], z)
+        if len(candidates) > limit:
+            best = np.argpartition(-low, limit - 1)[:limit]
+            candidates, low = candidates[best], low[best]
+        ranked = np.argsort(-low, kind="stable")
+        return [
+            {
+                "characters": unpack_characters(int(table.keys[i])),
+                "games": int(games[i]),
+                "wins": int(wins[i]),
+                "win_rate": float(wins[i] / games[i]),
+                "win_rate_low": float(low[position]),
+                "avg_place": float(place[i] / games[i]),
+                "avg_mmr_gain": (
+                    float(mmr_gain[i] / mmr_games[i]) if mmr_games[i] else None
+                ),
+            }
+            for position, i in ((position, candidates[position]) for position in ranked)
+        ]
+
+    def save(self, path: str) -> None:
+        """Merge buffered players and write the index to a NumPy .npz file.
+
+        The file replaces `path` in one rename, with no suffix added, so an
+        interrupted save leaves the previous index readable.
+        """
+        self.flush()
+        arrays = dict(
+            composition_keys=self.compositions.keys,
+            composition_stats=self.compositions.stats,
+            pair_keys=self.pairs.keys,
+            pair_stats=self.pairs.stats,
+            teams=self.teams,
+            files=np.array(json.dumps(self.files)),
+        )
+        atomic_write(path, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, path: str) -> "TeamSynergyIndex":
+        """Read an index written by `save`."""
+        index = cls()
+        with np.load(path) as data:
+            index.compositions = _KeyedStats(
+                data["composition_keys"], data["composition_stats"]
+            )
+            index.pairs = _KeyedStats(data["pair_keys"], data["pair_stats"])
+            index.teams = data["teams"]
+            index.files = json.loads(data["files"].item())
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: str) -> "TeamSynergyIndex":
+        """Read the index at `path` if it exists, otherwise start an empty one."""
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
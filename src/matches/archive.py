@@ -0,0 +1,80 @@
+"""
+Helpers for reading the on-disk match archive.
+
+The archive is a directory tree of JSON files, each holding a list of player
+records as written by `retrieve-games` (`<game_id>/team_<team_id>.json`) and
+moved there by `process-json-files`.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Iterator
+
+
+def iter_archive_files(root: str) -> Iterator[str]:
+    """Yield the paths of all JSON files under the archive root, in sorted order.
+
+    Args:
+        root (str): The archive root directory.
+
+    Returns:
+        Iterator[str]: Paths of the archived JSON files.
+    """
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".json"):
+                yield os.path.join(directory, file)
+
+
+def load_archive_file(file_path: str) -> list[dict[str, Any]]:
+    """Load the player records of a single archived JSON file.
+
+    Args:
+        file_path (str): Path to the JSON file.
+
+    Returns:
+        list[dict[str, Any]]: The player records in the file.
+    """
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def iter_archive_records(root: str) -> Iterator[dict[str, Any]]:
+    """Yield every player record in the archive.
+
+    Args:
+        root (str): The archive root directory.
+
+    Returns:
+        Iterator[dict[str, Any]]: Player records, file by file.
+    """
+    for file_path in iter_archive_files(root):
+        yield from load_archive_file(file_path)
+
+
+def archive_index(root: str) -> dict[str, tuple[int, int]]:
+    """Index the archive by file, for detecting changes without reading files.
+
+    Args:
+        root (str): The archive root directory.
+
+    Returns:
+        dict[str, tuple[int, int]]: Size in bytes and modification time in
+        nanoseconds of every JSON file, keyed by path relative to the root.
+    """
+    index = {}
+    for file_path in iter_archive_files(root):
+        stat = os.stat(file_path)
+        index[os.path.relpath(file_path, root)] = (stat.st_size, stat.st_mtime_ns)
+    return index
+
+
+def index_fingerprint(index: dict[str, tuple[int, int]]) -> str:
+    """Hash an archive index; any added, removed or rewritten file changes it."""
+    digest = hashlib.sha256()
+    for path in sorted(index):
+        size, mtime_ns = index[path]
+        digest.update(f"{path}\0{size}\0{mtime_ns}\n".encode())
+    return digest.hexdigest()
@@ -0,0 +1,354 @@
+"""
+Local stand-in for the ER API, replaying recorded game payloads.
+
+`MockERApi` serves `games/{id}`, `user/games/{user_id}` and `user/nickname`
+from a set of API-shaped player payloads, with configurable latency and
+injected 404 and 429 responses, so the fetch commands can be benchmarked
+without the live API. Point `CONSTS.BASE_URL` at `MockERApi.url` to use it.
+
+Payloads come from a fixtures directory, holding either responses recorded
+from the live API with `record` (`{"userGames": [...]}` per game) or archive
+files written by `retrieve-games` (lists of players keyed by field name). Run
+from `src/matches`:
+
+    poetry run python -m benchmarks.mock_api record 35000001 35000002 --output-dir fixtures
+    poetry run python -m benchmarks.mock_api serve --fixtures fixtures --port 8765 --latency 0.05
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import requests
+import typer
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterable, Optional
+from urllib.parse import parse_qs, urlparse
+from zlib import crc32
+from models.batch import UserGameBatch
+from models.game import UserGame
+
+app = typer.Typer()
+
+Payload = dict[str, Any]
+
+_GAME_PATH = re.compile(r"^/v1/games/(\d+)$")
+_USER_GAMES_PATH = re.compile(r"^/v1/user/games/(\d+)$")
+_NICKNAME_PATH = re.compile(r"^/v1/user/nickname/?$")
+
+
+def to_api_payload(game: UserGame) -> Payload:
+    """Dump a player as the API reports it, keyed by alias.
+
+    The killer list is flattened into `killer`, `killer2`, ... fields and the
+    start time formatted like the API's, e.g. `2024-07-01T13:53:00.000+0900`.
+    """
+    payload = game.model_dump(by_alias=True, mode="json", exclude={"killed_by_data"})
+    for index, kill_data in enumerate(game.killed_by_data.root):
+        suffix = "" if index == 0 else str(index + 1)
+        for alias, value in kill_data.model_dump(by_alias=True).items():
+            payload[f"{alias}{suffix}"] = value
+    start = game.game_start_datetime
+    payload["startDtm"] = (
+        start.strftime("%Y-%m-%dT%H:%M:%S.")
+        + f"{start.microsecond // 1000:03d}"
+        + start.strftime("%z")
+    )
+    return payload
+
+
+def _is_api_payload(player: Payload) -> bool:
+    return "gameId" in player and "startDtm" in player
+
+
+def load_fixtures(path: str) -> dict[int, list[Payload]]:
+    """Read API-shaped player payloads by game ID from a fixtures directory.
+
+    Args:
+        path (str): Directory searched recursively for JSON files, each a
+            recorded response (`{"userGames": [...]}`) or a list of players
+            keyed by API alias or by UserGame field name.
+
+    Returns:
+        dict[int, list[Payload]]: The players of every game.
+    """
+    games: dict[int, list[Payload]] = {}
+    for root, _, files in os.walk(path):
+        for file in sorted(files):
+            if not file.endswith(".json"):
+                continue
+            with open(os.path.join(root, file), "r") as f:
+                data = json.load(f)
+            players = data.get("userGames", []) if isinstance(data, dict) else data
+            if players and not _is_api_payload(players[0]):
+                # Archive dumps are keyed by field name, which UserGame does
+                # not validate; the batch reads both.
+                players = [
+                    to_api_payload(game)
+                    for game in UserGameBatch.from_records(players).to_user_games()
+                ]
+            for player in players:
+                games.setdefault(player["gameId"], []).append(player)
+    return games
+
+
+def _start_time(player: Payload) -> datetime:
+    return datetime.fromisoformat(player["startDtm"].replace("+0900", "+09:00"))
+
+
+class MockERApi:
+    """Threaded HTTP server answering like the ER API from recorded payloads.
+
+    Args:
+        games (dict[int, list[Payload]]): Players by game ID, see `load_fixtures`.
+        latency (float): Seconds every response is delayed by.
+        jitter (float): Extra delay drawn uniformly from [0, jitter] seconds.
+        not_found_rate (float): Share of requests answered with a 404.
+        rate_limit_rate (float): Share of requests answered with a 429.
+        serve_any (bool): Answer unknown game IDs with a recorded game
+            renumbered to the requested ID, and unknown users and nicknames
+            with a history made of recorded players, instead of a 404.
+        user_history (int): Games in the made-up history of an unknown user.
+        page_size (int): Games per `user/games` page.
+        seed (int): Seed of the injected errors and jitter.
+        port (int): Port to listen on, 0 for any free port.
+
+    Attributes:
+        url (str): Base URL to set `CONSTS.BASE_URL` to once started.
+        statuses (Counter): Responses sent per HTTP status.
+    """
+
+    def __init__(
+        self,
+        games: dict[int, list[Payload]],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        not_found_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        serve_any: bool = True,
+        user_history: int = 100,
+        page_size: int = 10,
+        seed: int = 0,
+        port: int = 0,
+    ):
+        if not games:
+            raise ValueError("No recorded games to serve")
+        self.games = games
+        self.game_ids = sorted(games)
+        self.latency = latency
+        self.jitter = jitter
+        self.not_found_rate = not_found_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.serve_any = serve_any
+        self.user_history = user_history
+        self.page_size = page_size
+        self.port = port
+        self.statuses: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._users: dict[int, list[Payload]] = {}
+        self._nicknames: dict[str, int] = {}
+        for players in games.values():
+            for player in players:
+                self._users.setdefault(player["userNum"], []).append(player)
+                self._nicknames[player["nickname"]] = player["userNum"]
+        for history in self._users.values():
+            history.sort(key=lambda player: (_start_time(player), player["gameId"]))
+            history.reverse()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    def start(self) -> "MockERApi":
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                status, body = api.respond(self.path)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-er-api", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockERApi":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def respond(self, path: str) -> tuple[int, Any]:
+        """Answer a request path, after the configured delay.
+
+        Returns:
+            tuple[int, Any]: The HTTP status and the JSON body.
+        """
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            draw = self._random.random()
+        if delay:
+            time.sleep(delay)
+        if draw < self.rate_limit_rate:
+            status, body = 429, {"code": 429, "message": "Too Many Requests"}
+        elif draw < self.rate_limit_rate + self.not_found_rate:
+            status, body = 404, {"code": 404, "message": "Not Found"}
+        else:
+            status, body = self._route(urlparse(path))
+        with self._lock:
+            self.statuses[status] += 1
+        return status, body
+
+    def _route(self, url: Any) -> tuple[int, Any]:
+        query = parse_qs(url.query)
+        if match := _GAME_PATH.match(url.path):
+            players = self.game(int(match[1]))
+            if players is not None:
+                return 200, {"code": 200, "message": "Success", "userGames": players}
+        elif match := _USER_GAMES_PATH.match(url.path):
+            history = self.history(int(match[1]))
+            if history is not None:
+                return 200, self._page(history, query.get("next", [None])[0])
+        elif _NICKNAME_PATH.match(url.path):
+            nickname = query.get("query", [""])[0]
+            user_id = self._nicknames.get(nickname)
+            if user_id is None and self.serve_any and nickname:
+                user_id = crc32(nickname.encode()) & 0x7FFFFFFF
+            if user_id is not None:
+                user = {"userNum": user_id, "nickname": nickname}
+                return 200, {"code": 200, "message": "Success", "user": user}
+        return 404, {"code": 404, "message": "Not Found"}
+
+    def game(self, game_id: int) -> Optional[list[Payload]]:
+        """The players of a game, None if it is unknown and not served anyway."""
+        if game_id in self.games:
+            return self.games[game_id]
+        if not self.serve_any:
+            return None
+        recorded = self.games[self.game_ids[game_id % len(self.game_ids)]]
+        return [{**player, "gameId": game_id} for player in recorded]
+
+    def history(self, user_id: int) -> Optional[list[Payload]]:
+        """A user's games newest first, None if unknown and not served anyway."""
+        if user_id in self._users:
+            return self._users[user_id]
+        if not self.serve_any:
+            return None
+        # Stand the user in for one recorded player of each of the newest games.
+        history = []
+        for game_id in self.game_ids[::-1][: self.user_history]:
+            players = self.games[game_id]
+            player = players[user_id % len(players)]
+            history.append({**player, "userNum": user_id})
+        return history
+
+    def _page(self, history: list[Payload], next_id: Optional[str]) -> Payload:
+        start = 0
+        if next_id is not None:
+            start = next(
+                (
+                    index
+                    for index, player in enumerate(history)
+                    if player["gameId"] == int(next_id)
+                ),
+                len(history),
+            )
+        page = history[start : start + self.page_size]
+        body: Payload = {"code": 200, "message": "Success", "userGames": page}
+        if start + self.page_size < len(history):
+            body["next"] = history[start + self.page_size]["gameId"]
+        return body
+
+
+def record_games(game_ids: Iterable[int], output_dir: str, delay: float = 1.0) -> int:
+    """Save live `games/{id}` responses as fixtures, `<output_dir>/<id>.json`.
+
+    Returns:
+        int: Number of games recorded.
+    """
+    import CONSTS  # Needs .secrets.toml, only for recording.
+
+    os.makedirs(output_dir, exist_ok=True)
+    recorded = 0
+    for game_id in game_ids:
+        endpoint = CONSTS.endpoints.game.value["fetch_by_id"].format(game_id=game_id)
+        response = requests.get(
+            f"{CONSTS.BASE_URL}{CONSTS.version.v1.value}/{endpoint}",
+            headers=CONSTS.HEADERS,
+        )
+        if response.status_code == 200 and "userGames" in response.json():
+            with open(os.path.join(output_dir, f"{game_id}.json"), "w") as f:
+                json.dump(response.json(), f)
+            recorded += 1
+        else:
+            typer.echo(f"Game {game_id}: HTTP {response.status_code}, skipped")
+        time.sleep(delay)
+    return recorded
+
+
+@app.command()
+def record(
+    game_ids: list[int] = typer.Argument(..., help="Game IDs to record"),
+    output_dir: str = typer.Option("fixtures", help="Directory to save responses to"),
+    delay: float = typer.Option(1.0, help="Seconds between requests"),
+) -> None:
+    """Record live ER API game responses as fixtures."""
+    recorded = record_games(game_ids, output_dir, delay)
+    typer.echo(f"Recorded {recorded} of {len(game_ids)} games to {output_dir}")
+
+
+@app.command()
+def serve(
+    fixtures: str = typer.Option(..., help="Directory of recorded payloads"),
+    port: int = typer.Option(8765, help="Port to listen on"),
+    latency: float = typer.Option(0.0, help="Seconds every response is delayed by"),
+    jitter: float = typer.Option(0.0, help="Extra random delay, up to this"),
+    not_found_rate: float = typer.Option(0.0, help="Share of 404 responses"),
+    rate_limit_rate: float = typer.Option(0.0, help="Share of 429 responses"),
+) -> None:
+    """Serve recorded payloads like the ER API until interrupted."""
+    api = MockERApi(
+        load_fixtures(fixtures),
+        latency=latency,
+        jitter=jitter,
+        not_found_rate=not_found_rate,
+        rate_limit_rate=rate_limit_rate,
+        port=port,
+    ).start()
+    typer.echo(f"Serving {len(api.games)} games at {api.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,413 @@
+"""
+End-to-end pipeline benchmarks against local API and database stand-ins.
+
+Each scenario runs a CLI command unchanged, with `CONSTS.BASE_URL` pointed at
+a `MockERApi` and the command's DAO replaced by an `InMemoryDAO` or by the real
+`SupabaseDAO` talking to a `PostgRESTStandIn`, and reports games/sec, rows/sec
+per table, p50/p99 latency of the API requests and DAO calls, and peak RSS.
+Results are saved as JSON for `compare`. Run from `src/matches`, where the
+CLI's `.secrets.toml` must exist (its values are not used):
+
+    poetry run python -m benchmarks.scenarios run --games 200 --api-latency 0.02 --db postgrest
+    poetry run python -m benchmarks.scenarios compare before.json after.json
+
+Each scenario runs in a fresh process, so its peak RSS is its own.
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import typer
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator, Optional
+import numpy as np
+import requests
+import CONSTS
+import getter
+import game_data_cli
+from data_access.supabase import SupabaseDAO
+from benchmarks.memory_db import InMemoryDAO, MemoryStore, PostgRESTStandIn
+from benchmarks.mock_api import MockERApi, Payload, load_fixtures
+from benchmarks.synthetic import GeneratorConfig, generate
+
+app = typer.Typer()
+
+SCENARIOS = ("retrieve_games", "fetch_user_games", "process_json_files")
+RESULTS_DIR = "benchmark_results"
+
+
+class LatencyRecorder:
+    """Thread-safe durations per kind of call, in seconds."""
+
+    def __init__(self):
+        self.durations: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def timed(self, kind: str, function: Callable) -> Callable:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.durations.setdefault(kind, []).append(elapsed)
+
+        return wrapper
+
+    def summary(self, kind: str) -> dict[str, Any]:
+        durations = np.array(self.durations.get(kind, []))
+        if not len(durations):
+            return {"count": 0, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(durations, [50, 99]) * 1000
+        return {"count": len(durations), "p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+class _TimedRequests:
+    """The `requests` module as seen by `getter`, timing every `get`."""
+
+    def __init__(self, recorder: LatencyRecorder):
+        self.get = recorder.timed("api", requests.get)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(requests, name)
+
+
+class _TimedDAO:
+    """Proxy timing every method call of a DAO."""
+
+    def __init__(self, dao: Any, recorder: LatencyRecorder):
+        self._dao = dao
+        self._recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._dao, name)
+        if callable(attribute):
+            return self._recorder.timed("db", attribute)
+        return attribute
+
+
+@contextlib.contextmanager
+def _patched(target: Any, **attributes: Any) -> Iterator[None]:
+    # Read through vars so that lazy module attributes, such as the CONSTS
+    # secrets, are not resolved only to be replaced.
+    missing = object()
+    previous = {name: vars(target).get(name, missing) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is missing:
+                delattr(target, name)
+            else:
+                setattr(target, name, value)
+
+
+def sample_fixtures(games: int, seed: int = 0) -> dict[int, list[Payload]]:
+    """API-shaped payloads of synthetic games of the current season."""
+    config = GeneratorConfig(season_id=CONSTS.CURRENT_SEASON)
+    return dict(generate(config, seed, games))
+
+
+@contextlib.contextmanager
+def database(kind: str, latency: float) -> Iterator[tuple[Any, MemoryStore]]:
+    """A fresh DAO of the given kind, and the store behind it.
+
+    Args:
+        kind (str): "memory" for an InMemoryDAO, "postgrest" for a SupabaseDAO
+            connected to a PostgRESTStandIn.
+        latency (float): Seconds added to every database call.
+    """
+    store = MemoryStore()
+    if kind == "memory":
+        yield InMemoryDAO(store, latency), store
+    elif kind == "postgrest":
+        from supabase import create_client
+
+        with PostgRESTStandIn(store, latency) as stand_in:
+            # Bypass the singleton, which connects to the configured project.
+            dao = object.__new__(SupabaseDAO)
+            dao.client = create_client(stand_in.url, PostgRESTStandIn.KEY)
+            yield dao, store
+    else:
+        raise ValueError(f"Unknown database: {kind}")
+
+
+def _write_incoming(fixtures: dict[int, list[Payload]], directory: str) -> int:
+    """Write the fixtures as `retrieve-games` output files, one per game."""
+    os.makedirs(directory, exist_ok=True)
+    for game_id, players in fixtures.items():
+        games = [getter._parse_player_data(dict(player)) for player in players]
+        with open(os.path.join(directory, f"{game_id}.json"), "w") as f:
+            json.dump([game.model_dump() for game in games], f, default=str)
+    return len(fixtures)
+
+
+def run_scenario(
+    name: str,
+    api: MockERApi,
+    dao: Any,
+    store: MemoryStore,
+    work_dir: str,
+    games: int,
+) -> dict[str, Any]:
+    """Run one scenario and measure it.
+
+    Args:
+        name (str): One of SCENARIOS.
+        api (MockERApi): The started API stand-in.
+        dao (Any): The DAO the CLI writes with.
+        store (MemoryStore): The store behind the DAO, for row counts.
+        work_dir (str): Empty directory for the scenario's files.
+        games (int): Games to retrieve, fetch or process.
+
+    Returns:
+        dict[str, Any]: The scenario's metrics.
+    """
+    recorder = LatencyRecorder()
+    statuses_before = api.statuses.copy()
+    incoming = os.path.join(work_dir, "incoming")
+    if name == "process_json_files":
+        _write_incoming(dict(list(api.games.items())[:games]), incoming)
+    for directory in ("archive", "error", "output"):
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+
+    commands: dict[str, Callable[[], None]] = {
+        "retrieve_games": lambda: game_data_cli.retrieve_games(
+            count=games,
+            output_dir=os.path.join(work_dir, "output"),
+            delay=0,
+            resume=False,
+            checkpoint_path=os.path.join(work_dir, "retrieve_games.json"),
+            checkpoint_every=10,
+            synergy_path=os.path.join(work_dir, "team_synergy.npz"),
+        ),
+        "fetch_user_games": lambda: game_data_cli.fetch_user_games(
+            username="benchmark_user",
+            limit=games,
+            resume=False,
+            checkpoint_path=os.path.join(work_dir, "fetch_user_games.json"),
+            checkpoint_every=10,
+        ),
+        "process_json_files": lambda: game_data_cli.process_json_files(
+            directory=incoming,
+            archive_dir=os.path.join(work_dir, "archive"),
+            error_dir=os.path.join(work_dir, "error"),
+        ),
+    }
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(
+            _patched(
+                CONSTS,
+                BASE_URL=api.url,
+                HEADERS={"Accept": "application/json", "x-api-key": "benchmark"},
+            )
+        )
+        stack.enter_context(_patched(getter, requests=_TimedRequests(recorder)))
+        stack.enter_context(
+            _patched(
+                game_data_cli,
+                dao=_TimedDAO(dao, recorder),
+                ARCHIVE_PATH=os.path.join(work_dir, "archive"),
+                AGGREGATES_PATH=os.path.join(work_dir, "aggregates.sqlite"),
+                MMR_SERIES_PATH=os.path.join(work_dir, "mmr_series"),
+            )
+        )
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        started = time.perf_counter()
+        commands[name]()
+        seconds = time.perf_counter() - started
+
+    if name == "retrieve_games":
+        games_done = len(os.listdir(os.path.join(work_dir, "output")))
+    elif name == "process_json_files":
+        games_done = len(os.listdir(os.path.join(work_dir, "archive")))
+    else:
+        games_done = store.row_counts().get("player_game_stats", 0)
+    rows = dict(store.rows_written)
+    return {
+        "seconds": seconds,
+        "games": games_done,
+        "games_per_second": games_done / seconds,
+        "rows": rows,
+        "rows_per_second": {table: count / seconds for table, count in rows.items()},
+        "api_latency": recorder.summary("api"),
+        "db_latency": recorder.summary("db"),
+        "api_statuses": {
+            str(status): count - statuses_before.get(status, 0)
+            for status, count in api.statuses.items()
+            if count - statuses_before.get(status, 0)
+        },
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _run_in_process(
+    name: str, payloads: dict[int, list[Payload]], config: dict[str, Any]
+) -> dict[str, Any]:
+    """Run one scenario against fresh stand-ins, in a process of its own."""
+    api = MockERApi(
+        payloads,
+        latency=config["api_latency"],
+        jitter=config["api_jitter"],
+        not_found_rate=config["not_found_rate"],
+        rate_limit_rate=config["rate_limit_rate"],
+        user_history=config["games"],
+        seed=config["seed"],
+    )
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    try:
+        with api, database(config["db"], config["db_latency"]) as (dao, store):
+            return run_scenario(name, api, dao, store, work_dir, config["games"])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@app.command()
+def run(
+    scenarios: Optional[list[str]] = typer.Option(
+        None, "--scenario", help="Scenario to run, repeatable; all by default"
+    ),
+    games: int = typer.Option(100, help="Games per scenario"),
+    fixtures: Optional[str] = typer.Option(
+        None, help="Directory of recorded payloads; sample games if omitted"
+    ),
+    db: str = typer.Option("memory", help="Database stand-in: 'memory' or 'postgrest'"),
+    api_latency: float = typer.Option(0.0, help="Seconds every API response takes"),
+    api_jitter: float = typer.Option(0.0, help="Extra random API delay, up to this"),
+    not_found_rate: float = typer.Option(0.0, help="Share of 404 API responses"),
+    rate_limit_rate: float = typer.Option(0.0, help="Share of 429 API responses"),
+    db_latency: float = typer.Option(0.0, help="Seconds every database call takes"),
+    output: Optional[str] = typer.Option(
+        None, help=f"Results file; {RESULTS_DIR}/<timestamp>.json by default"
+    ),
+    seed: int = typer.Option(0, help="Seed for the sample games and injected errors"),
+) -> None:
+    """Run the pipeline scenarios against local stand-ins and save the results."""
+    scenarios = scenarios or list(SCENARIOS)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown scenarios: {', '.join(unknown)}")
+    payloads = load_fixtures(fixtures) if fixtures else sample_fixtures(games, seed)
+    config = {
+        "games": games,
+        "fixtures": fixtures,
+        "db": db,
+        "api_latency": api_latency,
+        "api_jitter": api_jitter,
+        "not_found_rate": not_found_rate,
+        "rate_limit_rate": rate_limit_rate,
+        "db_latency": db_latency,
+        "seed": seed,
+    }
+
+    results = {}
+    for name in scenarios:
+        # A fresh process per scenario, as ru_maxrss never goes down.
+        with ProcessPoolExecutor(1, multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(
+                _run_in_process, name, payloads, config
+            ).result()
+        result = results[name]
+        typer.echo(
+            f"{name}: {result['games']} games in {result['seconds']:.2f}s, "
+            f"{result['games_per_second']:.1f} games/sec, "
+            f"API p50/p99 {_ms(result['api_latency'])}, "
+            f"DB p50/p99 {_ms(result['db_latency'])}, "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+
+    now = datetime.now(timezone.utc)
+    output = output or os.path.join(RESULTS_DIR, f"{now:%Y%m%dT%H%M%SZ}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "created_at": now.isoformat(),
+                "commit": _commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": config,
+                "scenarios": results,
+            },
+            f,
+            indent=2,
+        )
+    typer.echo(f"Saved results to {output}")
+
+
+def _ms(latency: dict[str, Any]) -> str:
+    if not latency["count"]:
+        return "-"
+    return f"{latency['p50_ms']:.1f}/{latency['p99_ms']:.1f} ms"
+
+
+def _change(before: Optional[float], after: Optional[float]) -> str:
+    if before is None or after is None:
+        return "-"
+    if not before:
+        return f"{after:.1f}"
+    return f"{before:.1f} -> {after:.1f} ({(after - before) / before:+.0%})"
+
+
+@app.command()
+def compare(
+    before: str = typer.Argument(..., help="Earlier results file"),
+    after: str = typer.Argument(..., help="Later results file"),
+) -> None:
+    """Compare the scenarios of two results files."""
+    with open(before, "r") as f:
+        old = json.load(f)
+    with open(after, "r") as f:
+        new = json.load(f)
+    typer.echo(f"{old.get('commit')} -> {new.get('commit')}")
+    for name in SCENARIOS:
+        if name not in old["scenarios"] or name not in new["scenarios"]:
+            continue
+        a, b = old["scenarios"][name], new["scenarios"][name]
+        typer.echo(f"{name}:")
+        typer.echo(
+            f"  games/sec     {_change(a['games_per_second'], b['games_per_second'])}"
+        )
+        for kind in ("api_latency", "db_latency"):
+            for stat in ("p50_ms", "p99_ms"):
+                typer.echo(
+                    f"  {kind[:-8]} {stat[:3]} ms".ljust(16)
+                    + _change(a[kind][stat], b[kind][stat])
+                )
+        for table in sorted(set(a["rows_per_second"]) | set(b["rows_per_second"])):
+            typer.echo(
+                f"  {table} rows/sec: "
+                + _change(
+                    a["rows_per_second"].get(table), b["rows_per_second"].get(table)
+                )
+            )
+        typer.echo(f"  peak RSS MB   {_change(a['peak_rss_mb'], b['peak_rss_mb'])}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,683 @@
+"""
+Synthetic match generator for scale and load testing.
+
+`generate` yields games shaped exactly like the `games/{game_id}` API response:
+every UserGame alias, flattened killer fields (collected into `killerList` by
+the getter), equipment and mastery maps, skill orders and purchase lists. Games
+are internally consistent: teams of `team_mode` players share a `gameRank`
+given by the order teams are eliminated, every dead player's killer is a
+player of a team still alive, and kill, death, team kill and per phase counts
+add up across the game.
+
+Distributions are set by a `GeneratorConfig`, loadable from JSON. Games are
+drawn in chunks of `chunk_games`, each from its own generator seeded with
+`(seed, chunk)`, so output is deterministic and any range of games can be
+regenerated on its own. Run from `src/matches`:
+
+    poetry run python -m benchmarks.synthetic generate --games 100000 --output-dir synthetic_archive
+    poetry run python -m benchmarks.synthetic generate --games 1000 --format api --output-dir fixtures
+    poetry run python -m benchmarks.synthetic serve --games 10000 --port 8765
+    poetry run python -m benchmarks.synthetic throughput --games 50000
+"""
+
+import json
+import os
+import time
+import typer
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, Optional
+import numpy as np
+from models.game import KillData, UserGame
+from benchmarks.mock_api import MockERApi, Payload
+
+app = typer.Typer()
+
+KST = timezone(timedelta(hours=9))
+PHASES = 3
+# The API's weapon mastery type per weapon name; non-weapon masteries are 100+.
+WEAPON_MASTERY_TYPES = {
+    "Glove": 1, "Tonfa": 2, "Bat": 3, "Whip": 4, "HighAngleFire": 5,
+    "DirectFire": 6, "Bow": 7, "CrossBow": 8, "Pistol": 9, "AssaultRifle": 10,
+    "SniperRifle": 11, "Hammer": 13, "Axe": 14, "OneHandSword": 15,
+    "TwoHandSword": 16, "Polearm": 17, "DualSword": 18, "Spear": 19,
+    "Nunchaku": 20, "Rapier": 21, "Guitar": 22, "Camera": 23, "Arcana": 24,
+    "VFArm": 25,
+}  # fmt: skip
+# Integer stats drawn independently per player, with their mean per game second.
+_STAT_RATES = {
+    "damageToPlayer": 12.0,
+    "damageToPlayer_basic": 5.0,
+    "damageToPlayer_skill": 5.5,
+    "damageToPlayer_itemSkill": 0.8,
+    "damageToPlayer_direct": 0.4,
+    "damageToPlayer_uniqueSkill": 0.3,
+    "damageFromPlayer": 11.0,
+    "damageFromPlayer_basic": 4.5,
+    "damageFromPlayer_skill": 5.0,
+    "damageFromPlayer_itemSkill": 0.7,
+    "damageFromPlayer_direct": 0.4,
+    "damageFromPlayer_uniqueSkill": 0.3,
+    "damageToMonster": 20.0,
+    "damageToMonster_basic": 9.0,
+    "damageToMonster_skill": 9.0,
+    "damageToMonster_itemSkill": 1.0,
+    "damageToMonster_direct": 0.5,
+    "damageToMonster_uniqueSkill": 0.5,
+    "damageFromMonster": 6.0,
+    "healAmount": 3.0,
+    "sumTotalVFCredits": 0.5,
+    "sumUsedVFCredits": 0.4,
+    "monsterKill": 0.02,
+}
+_STATS = tuple(_STAT_RATES)
+_KILLER_ALIASES = tuple(field.alias for field in KillData.model_fields.values())
+
+
+@dataclass
+class GeneratorConfig:
+    """Distributions of the generated games.
+
+    Attributes:
+        season_id (int): Season of every game.
+        match_mode (int): `matchingMode`, e.g. 3 for ranked.
+        team_mode (int): Players per team, `matchingTeamMode`.
+        players_per_game (int): Players per game, a multiple of team_mode.
+        first_game_id (int): ID of game 0; games are numbered consecutively.
+        start (str): ISO start time of game 0.
+        games_per_hour (float): Rate games start at.
+        duration_mean (float): Mean game duration, in seconds.
+        duration_std (float): Standard deviation of the duration.
+        characters (list[int]): Character IDs to pick from.
+        character_skew (float): Zipf exponent of character popularity, 0 for
+            uniform picks; earlier characters are more popular.
+        weapons (list[str]): Weapon names, character i using weapons[i % n];
+            each player also reports the mastery of their weapon.
+        item_pools (list[list[int]]): Final item IDs to pick from per slot.
+        first_item_pools (list[list[int]]): First item IDs per slot.
+        console_items (list[int]): Items purchased from the console.
+        drone_items (list[int]): Items purchased from the drone.
+        mastery_types (list[int]): Non-weapon mastery types reported per player.
+        areas (list[int]): Area codes to start and die in.
+        main_weathers (list[int]): Main weather codes.
+        sub_weathers (list[int]): Sub weather codes.
+        servers (list[str]): Server names.
+        user_pool (int): Distinct user IDs players are drawn from.
+        mmr_mean (float): Mean MMR before the game.
+        mmr_std (float): Standard deviation of the MMR before the game.
+        mmr_gain_per_rank (float): MMR gained per rank above the median rank.
+        chunk_games (int): Games drawn per vectorized chunk and per seed.
+    """
+
+    season_id: int = 25
+    match_mode: int = 3
+    team_mode: int = 3
+    players_per_game: int = 24
+    first_game_id: int = 40_000_000
+    start: str = "2024-07-01T00:00:00+09:00"
+    games_per_hour: float = 600.0
+    duration_mean: float = 1150.0
+    duration_std: float = 240.0
+    characters: list[int] = field(default_factory=lambda: list(range(1, 76)))
+    character_skew: float = 0.8
+    weapons: list[str] = field(
+        default_factory=lambda: [
+            "Glove", "Tonfa", "Bat", "Whip", "HighAngleFire", "DirectFire", "Bow",
+            "CrossBow", "Pistol", "AssaultRifle", "SniperRifle", "Hammer", "Axe",
+            "OneHandSword", "TwoHandSword", "DualSword", "Spear", "Nunchaku",
+            "Rapier", "Guitar", "Camera", "Arcana", "VFArm",
+        ]
+    )  # fmt: skip
+    item_pools: list[list[int]] = field(
+        default_factory=lambda: [
+            list(range(116401, 116421)),
+            list(range(202401, 202421)),
+            list(range(201401, 201421)),
+            list(range(203401, 203421)),
+            list(range(204401, 204421)),
+        ]
+    )
+    first_item_pools: list[list[int]] = field(
+        default_factory=lambda: [
+            list(range(101101, 101106)),
+            list(range(202101, 202106)),
+            list(range(201101, 201106)),
+            list(range(203101, 203106)),
+            list(range(204101, 204106)),
+        ]
+    )
+    console_items: list[int] = field(
+        default_factory=lambda: [301101, 302101, 401101, 401103, 502104]
+    )
+    drone_items: list[int] = field(default_factory=lambda: [205101, 205102, 302102])
+    mastery_types: list[int] = field(
+        default_factory=lambda: [101, 102, 103, 201, 202, 203, 204]
+    )
+    areas: list[int] = field(default_factory=lambda: list(range(10, 200, 10)))
+    main_weathers: list[int] = field(
+        default_factory=lambda: [10001, 10002, 10003, 10004]
+    )
+    sub_weathers: list[int] = field(
+        default_factory=lambda: [10501, 10502, 10503, 10504]
+    )
+    servers: list[str] = field(default_factory=lambda: ["Asia", "NA", "EU"])
+    user_pool: int = 1_000_000
+    mmr_mean: float = 4000.0
+    mmr_std: float = 1500.0
+    mmr_gain_per_rank: float = 12.0
+    chunk_games: int = 256
+
+    def __post_init__(self):
+        if self.players_per_game % self.team_mode:
+            raise ValueError("players_per_game must be a multiple of team_mode")
+        if self.players_per_game // self.team_mode < 2:
+            raise ValueError("A game needs at least two teams")
+        if self.user_pool < self.players_per_game:
+            raise ValueError("user_pool must hold at least one game's players")
+        unknown = set(self.weapons) - set(WEAPON_MASTERY_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown weapons: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def from_json(cls, path: str) -> "GeneratorConfig":
+        """Read a config, the defaults filling in the fields the file omits."""
+        with open(path, "r") as f:
+            values = json.load(f)
+        unknown = set(values) - {config_field.name for config_field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown config fields: {', '.join(sorted(unknown))}")
+        return cls(**values)
+
+
+def _format_start(start: datetime) -> str:
+    # The API's format, e.g. 2024-07-01T13:53:00.000+0900.
+    return start.strftime("%Y-%m-%dT%H:%M:%S.000%z")
+
+
+class _Chunk:
+    """Every random draw of `chunk_games` games, made at once."""
+
+    def __init__(self, config: GeneratorConfig, rng: np.random.Generator, games: int):
+        players = config.players_per_game
+        teams = players // config.team_mode
+        shape = (games, players)
+        self.durations = np.maximum(
+            rng.normal(config.duration_mean, config.duration_std, games), 240
+        ).astype(np.int64)
+        self.start_jitter = rng.uniform(0, 1, games)
+        self.main_weathers = rng.choice(config.main_weathers, games).tolist()
+        self.sub_weathers = rng.choice(config.sub_weathers, games).tolist()
+        self.servers = rng.choice(config.servers, games).tolist()
+        # Teams are eliminated in a random order; the last one standing wins.
+        self.eliminations = np.argsort(rng.random((games, teams)), axis=1).tolist()
+        self.team_numbers = (
+            np.argsort(rng.random((games, teams)), axis=1) + 1
+        ).tolist()
+        self.killer_draws = rng.random((games, players, 2)).tolist()
+
+        users = rng.integers(0, config.user_pool, shape)
+        repeated = (np.diff(np.sort(users, axis=1), axis=1) == 0).any(axis=1)
+        for game in np.flatnonzero(repeated):
+            # Redraw the rare duplicate users of a game.
+            while len(np.unique(users[game])) < players:
+                _, first = np.unique(users[game], return_index=True)
+                duplicate = np.setdiff1d(np.arange(players), first)
+                users[game, duplicate] = rng.integers(
+                    0, config.user_pool, len(duplicate)
+                )
+        self.users = (users + 1).tolist()
+
+        weights = (
+            1.0 / np.arange(1, len(config.characters) + 1) ** config.character_skew
+        )
+        characters = rng.choice(
+            len(config.characters), shape, p=weights / weights.sum()
+        )
+        self.characters = np.asarray(config.characters)[characters].tolist()
+        self.weapons = [
+            [config.weapons[character % len(config.weapons)] for character in row]
+            for row in self.characters
+        ]
+        self.levels = rng.integers(14, 21, shape).tolist()
+        # The API reports areas as strings.
+        self.start_areas = rng.choice(config.areas, shape).astype(str).tolist()
+        self.death_areas = rng.choice(config.areas, shape).astype(str).tolist()
+        self.mmr_before = (
+            np.maximum(rng.normal(config.mmr_mean, config.mmr_std, shape), 0)
+            .astype(np.int64)
+            .tolist()
+        )
+        self.mmr_noise = rng.integers(-6, 7, shape).tolist()
+        self.premade = rng.integers(1, config.team_mode + 1, shape).tolist()
+        self.assist_draws = rng.random(shape).tolist()
+        self.multi_kill_draws = rng.random(shape).tolist()
+
+        seconds = self.durations[:, None].astype(np.float64)
+        rates = np.array([_STAT_RATES[stat] for stat in _STATS])
+        self.stats = (
+            (
+                rng.gamma(4.0, 0.25, (games, players, len(_STATS)))
+                * rates
+                * seconds[:, :, None]
+            )
+            .astype(np.int64)
+            .tolist()
+        )
+        self.play_times = (
+            (seconds * rng.uniform(0.35, 1.0, shape)).astype(np.int64).tolist()
+        )
+
+        self.final_items = np.stack(
+            [rng.choice(pool, shape) for pool in config.item_pools], axis=-1
+        ).tolist()
+        self.first_items = np.stack(
+            [rng.choice(pool, shape) for pool in config.first_item_pools], axis=-1
+        ).tolist()
+        self.mastery_levels = rng.integers(
+            1, 21, (games, players, len(config.mastery_types))
+        ).tolist()
+        self.skill_draws = rng.integers(1, 5, (games, players, 18)).tolist()
+        self.console = _purchases(rng, config.console_items, 6, shape)
+        self.drone = _purchases(rng, config.drone_items, 3, shape)
+        self.weapon_mastery_levels = rng.integers(1, 21, shape).tolist()
+
+
+def _purchases(
+    rng: np.random.Generator, items: list[int], most: int, shape: tuple[int, int]
+) -> list[list[list[int]]]:
+    """Up to `most` items per player, drawn at once and split by player."""
+    counts = rng.integers(0, most + 1, shape)
+    drawn = rng.choice(items, int(counts.sum())).tolist()
+    ends = np.cumsum(counts).reshape(shape).tolist()
+    purchases = []
+    start = 0
+    for row in ends:
+        game = []
+        for end in row:
+            game.append(drawn[start:end])
+            start = end
+        purchases.append(game)
+    return purchases
+
+
+def _game(
+    config: GeneratorConfig, chunk: _Chunk, index: int, game_id: int, start: datetime
+) -> list[Payload]:
+    players = config.players_per_game
+    team_mode = config.team_mode
+    teams = players // team_mode
+    duration = int(chunk.durations[index])
+    elimination = chunk.eliminations[index]
+    killer_draws = chunk.killer_draws[index]
+
+    # Kills follow the elimination order, every dead player's killer being on a
+    # team still alive. Phases split the eliminations in thirds.
+    rank = [0] * teams
+    killer_of = [-1] * players
+    phase_of = [0] * players
+    kills = [[0] * PHASES for _ in range(players)]
+    for step, team in enumerate(elimination):
+        rank[team] = teams - step
+        alive = elimination[step + 1 :]
+        if not alive:
+            break
+        phase = min(step * PHASES // (teams - 1), PHASES - 1)
+        for member in range(team * team_mode, (team + 1) * team_mode):
+            team_draw, member_draw = killer_draws[member]
+            killer = alive[int(team_draw * len(alive))] * team_mode + int(
+                member_draw * team_mode
+            )
+            killer_of[member] = killer
+            phase_of[member] = phase
+            kills[killer][phase] += 1
+    team_kills = [0] * teams
+    for player in range(players):
+        team_kills[player // team_mode] += sum(kills[player])
+
+    users = chunk.users[index]
+    characters = chunk.characters[index]
+    weapons = chunk.weapons[index]
+    stats = chunk.stats[index]
+    levels = chunk.levels[index]
+    mmr_before = chunk.mmr_before[index]
+    mmr_noise = chunk.mmr_noise[index]
+    assist_draws = chunk.assist_draws[index]
+    multi_kill_draws = chunk.multi_kill_draws[index]
+    mastery_levels = chunk.mastery_levels[index]
+    weapon_mastery_levels = chunk.weapon_mastery_levels[index]
+    final_items = chunk.final_items[index]
+    first_items = chunk.first_items[index]
+    skill_draws = chunk.skill_draws[index]
+    play_times = chunk.play_times[index]
+    team_numbers = chunk.team_numbers[index]
+    premade = chunk.premade[index]
+    start_areas = chunk.start_areas[index]
+    death_areas = chunk.death_areas[index]
+    console = chunk.console[index]
+    drone = chunk.drone[index]
+    server = chunk.servers[index]
+    main_weather = chunk.main_weathers[index]
+    sub_weather = chunk.sub_weathers[index]
+    mastery_types = [str(mastery) for mastery in config.mastery_types]
+    weapon_masteries = [str(WEAPON_MASTERY_TYPES[weapon]) for weapon in weapons]
+    slots = [str(slot) for slot in range(len(config.item_pools))]
+    first_slots = [str(slot) for slot in range(len(config.first_item_pools))]
+    skill_levels = [str(level) for level in range(1, 19)]
+    start_dtm = _format_start(start)
+    median_rank = (teams + 1) / 2
+    payloads = []
+    for player in range(players):
+        team = player // team_mode
+        player_kills = sum(kills[player])
+        killer = killer_of[player]
+        dead = killer >= 0
+        gain = int(
+            (median_rank - rank[team]) * config.mmr_gain_per_rank
+            + player_kills * 2
+            + mmr_noise[player]
+        )
+        before = mmr_before[player]
+        multi_kill = multi_kill_draws[player]
+        character = characters[player]
+        skill_base = character * 100_000
+        player_kills_by_phase = kills[player]
+        phase = phase_of[player]
+        payload = dict(zip(_STATS, stats[player]))
+        payload.update(
+            {
+                "userNum": users[player],
+                "nickname": f"user{users[player]}",
+                "gameId": game_id,
+                "seasonId": config.season_id,
+                "matchingMode": config.match_mode,
+                "matchingTeamMode": team_mode,
+                "characterNum": character,
+                "characterLevel": levels[player],
+                "gameRank": rank[team],
+                "playerKill": player_kills,
+                "playerAssistant": int(
+                    assist_draws[player] * (team_kills[team] - player_kills + 1)
+                ),
+                "masteryLevel": {
+                    weapon_masteries[player]: weapon_mastery_levels[player],
+                    **dict(zip(mastery_types, mastery_levels[player])),
+                },
+                "equipment": dict(zip(slots, final_items[player])),
+                "skillOrderInfo": {
+                    level: skill_base + skill * 100
+                    for level, skill in zip(skill_levels, skill_draws[player])
+                },
+                "serverName": server,
+                "startDtm": start_dtm,
+                "duration": duration,
+                "mmrGainInGame": gain,
+                "mmrBefore": before,
+                "mmrGain": gain,
+                "mmrAfter": max(before + gain, 0),
+                "playTime": play_times[player],
+                "botAdded": 0,
+                "teamNumber": team_numbers[team],
+                "preMade": premade[player],
+                "victory": int(rank[team] == 1),
+                "placeOfStart": start_areas[player],
+                "matchSize": players,
+                "teamKill": team_kills[team],
+                "playerDeaths": int(dead),
+                "killsPhaseOne": player_kills_by_phase[0],
+                "killsPhaseTwo": player_kills_by_phase[1],
+                "killsPhaseThree": player_kills_by_phase[2],
+                "deathsPhaseOne": int(dead and phase == 0),
+                "deathsPhaseTwo": int(dead and phase == 1),
+                "deathsPhaseThree": int(dead and phase == 2),
+                "itemTransferredConsole": console[player],
+                "itemTransferredDrone": drone[player],
+                "totalDoubleKill": int(player_kills >= 2 and multi_kill < 0.3),
+                "totalTripleKill": int(player_kills >= 3 and multi_kill < 0.08),
+                "totalQuadraKill": int(player_kills >= 4 and multi_kill < 0.02),
+                "totalExtraKill": int(player_kills >= 5 and multi_kill < 0.005),
+                "equipFirstItemForLog": {
+                    slot: [item] for slot, item in zip(first_slots, first_items[player])
+                },
+                "mainWeather": main_weather,
+                "subWeather": sub_weather,
+            }
+        )
+        if dead:
+            payload.update(
+                zip(
+                    _KILLER_ALIASES,
+                    (
+                        users[killer],
+                        "player",
+                        f"user{users[killer]}",
+                        death_areas[player],
+                        str(characters[killer]),
+                        weapons[killer],
+                    ),
+                )
+            )
+        payloads.append(payload)
+    return payloads
+
+
+def generate(
+    config: GeneratorConfig, seed: int, games: int, first: int = 0
+) -> Iterator[tuple[int, list[Payload]]]:
+    """Generate games `first` to `first + games - 1`.
+
+    Args:
+        config (GeneratorConfig): Distributions of the games.
+        seed (int): Seed; the same seed and config always give the same games.
+        games (int): Number of games to generate.
+        first (int): Index of the first game, to generate a later range.
+
+    Returns:
+        Iterator[tuple[int, list[Payload]]]: Game IDs with their players, each
+        an API payload as in the `userGames` of a `games/{game_id}` response.
+    """
+    start = datetime.fromisoformat(config.start)
+    interval = 3600 / config.games_per_hour
+    end = first + games
+    for chunk_index in range(
+        first // config.chunk_games, -(-end // config.chunk_games)
+    ):
+        chunk_start = chunk_index * config.chunk_games
+        chunk = _Chunk(
+            config, np.random.default_rng([seed, chunk_index]), config.chunk_games
+        )
+        for index in range(max(first - chunk_start, 0), config.chunk_games):
+            game = chunk_start + index
+            if game >= end:
+                return
+            offset = (game + chunk.start_jitter[index]) * interval
+            yield config.first_game_id + game, _game(
+                config,
+                chunk,
+                index,
+                config.first_game_id + game,
+                start + timedelta(seconds=int(offset)),
+            )
+
+
+_FIELD_NAMES = {
+    model_field.alias: name for name, model_field in UserGame.model_fields.items()
+}
+_KILL_FIELD_NAMES = {
+    model_field.alias: name for name, model_field in KillData.model_fields.items()
+}
+
+
+def to_archive_record(payload: Payload) -> dict[str, Any]:
+    """Convert an API payload to the UserGame dump `retrieve-games` archives."""
+    record = {
+        _FIELD_NAMES[alias]: value
+        for alias, value in payload.items()
+        if alias in _FIELD_NAMES
+    }
+    # As `write_teams_to_json` dumps it, with `default=str`.
+    record["game_start_datetime"] = str(
+        datetime.strptime(payload["startDtm"], "%Y-%m-%dT%H:%M:%S.%f%z")
+    )
+    record["victory"] = bool(payload["victory"])
+    record["starting_area"] = int(payload["placeOfStart"])
+    record["killed_by_data"] = (
+        [{_KILL_FIELD_NAMES[alias]: payload[alias] for alias in _KILLER_ALIASES}]
+        if "killer" in payload
+        else []
+    )
+    return record
+
+
+def write_archive(games: Iterator[tuple[int, list[Payload]]], root: str) -> int:
+    """Write games like `retrieve-games`, `<root>/<game_id>/team_<team>.json`.
+
+    Returns:
+        int: Number of players written.
+    """
+    written = 0
+    for game_id, players in games:
+        directory = os.path.join(root, str(game_id))
+        os.makedirs(directory, exist_ok=True)
+        teams: dict[int, list[dict[str, Any]]] = {}
+        for player in players:
+            teams.setdefault(player["teamNumber"], []).append(to_archive_record(player))
+        for team, records in teams.items():
+            with open(os.path.join(directory, f"team_{team}.json"), "w") as f:
+                f.write(json.dumps(records))
+        written += len(players)
+    return written
+
+
+def write_responses(games: Iterator[tuple[int, list[Payload]]], directory: str) -> int:
+    """Write games as `games/{game_id}` responses, `<directory>/<game_id>.json`.
+
+    Returns:
+        int: Number of players written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for game_id, players in games:
+        with open(os.path.join(directory, f"{game_id}.json"), "w") as f:
+            f.write(
+                json.dumps({"code": 200, "message": "Success", "userGames": players})
+            )
+        written += len(players)
+    return written
+
+
+_WRITERS = {"archive": write_archive, "api": write_responses}
+
+
+def _write_range(
+    config: GeneratorConfig, seed: int, first: int, games: int, format: str, output: str
+) -> int:
+    return _WRITERS[format](generate(config, seed, games, first), output)
+
+
+def write_parallel(
+    config: GeneratorConfig,
+    seed: int,
+    games: int,
+    output: str,
+    format: str = "archive",
+    first: int = 0,
+    workers: int = 1,
+) -> int:
+    """Write games with `write_archive` or `write_responses` from several processes.
+
+    Games are split into ranges of whole chunks, so the output is the same
+    whatever the number of workers.
+
+    Returns:
+        int: Number of players written.
+    """
+    step = -(-games // workers)
+    step = -(-step // config.chunk_games) * config.chunk_games
+    ranges = [
+        (start, min(step, first + games - start))
+        for start in range(first, first + games, step)
+    ]
+    if len(ranges) == 1:
+        return _write_range(config, seed, first, games, format, output)
+    with ProcessPoolExecutor(len(ranges)) as pool:
+        futures = [
+            pool.submit(_write_range, config, seed, start, count, format, output)
+            for start, count in ranges
+        ]
+        return sum(future.result() for future in futures)
+
+
+def _config(path: Optional[str]) -> GeneratorConfig:
+    return GeneratorConfig.from_json(path) if path else GeneratorConfig()
+
+
+@app.command("generate")
+def generate_command(
+    games: int = typer.Option(1000, help="Number of games to generate"),
+    seed: int = typer.Option(0, help="Seed of the games"),
+    first: int = typer.Option(0, help="Index of the first game"),
+    config: Optional[str] = typer.Option(None, help="GeneratorConfig JSON file"),
+    output_dir: str = typer.Option("synthetic_archive", help="Directory to write"),
+    format: str = typer.Option(
+        "archive", help="'archive' for retrieve-games files, 'api' for responses"
+    ),
+    workers: int = typer.Option(os.cpu_count() or 1, help="Processes to write from"),
+) -> None:
+    """Write synthetic games as archive files or recorded API responses."""
+    if format not in _WRITERS:
+        raise typer.BadParameter(f"Unknown format: {format}")
+    started = time.perf_counter()
+    players = write_parallel(
+        _config(config), seed, games, output_dir, format, first, max(workers, 1)
+    )
+    seconds = time.perf_counter() - started
+    typer.echo(
+        f"Wrote {games} games, {players} players to {output_dir} in {seconds:.1f}s "
+        f"({players / seconds * 60:,.0f} players/min)"
+    )
+
+
+@app.command()
+def serve(
+    games: int = typer.Option(10_000, help="Number of games to serve"),
+    seed: int = typer.Option(0, help="Seed of the games"),
+    config: Optional[str] = typer.Option(None, help="GeneratorConfig JSON file"),
+    port: int = typer.Option(8765, help="Port to listen on"),
+    latency: float = typer.Option(0.0, help="Seconds every response is delayed by"),
+) -> None:
+    """Serve synthetic games through the mock ER API until interrupted."""
+    api = MockERApi(
+        dict(generate(_config(config), seed, games)), latency=latency, port=port
+    ).start()
+    typer.echo(f"Serving {games} games at {api.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+@app.command()
+def throughput(
+    games: int = typer.Option(20_000, help="Number of games to generate"),
+    seed: int = typer.Option(0, help="Seed of the games"),
+    config: Optional[str] = typer.Option(None, help="GeneratorConfig JSON file"),
+) -> None:
+    """Report player records generated per minute, without writing them."""
+    started = time.perf_counter()
+    players = sum(len(game) for _, game in generate(_config(config), seed, games))
+    seconds = time.perf_counter() - started
+    typer.echo(
+        f"{players} players in {seconds:.2f}s, {players / seconds * 60:,.0f}/min"
+    )
+
+
+@app.command("default-config")
+def default_config() -> None:
+    """Print the default GeneratorConfig as JSON, to edit and pass as --config."""
+    typer.echo(json.dumps(asdict(GeneratorConfig()), indent=2))
+
+
+if __name__ == "__main__":
+    app()
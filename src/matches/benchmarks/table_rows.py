@@ -0,0 +1,252 @@
+"""
+Row-building microbenchmark.
+
+Compares rows/sec of the per-table builders the insertion strategies used before
+the declarative table mappings (kept below as the reference implementation)
+against `build_table_rows`. Run from `src/matches`:
+
+    poetry run python -m benchmarks.table_rows --players 5000
+"""
+
+import random
+import time
+import typer
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable
+from models.game import UserGame, KillData, KillDataList
+from processors.table_mappings import build_table_rows
+
+app = typer.Typer()
+
+
+def _sample_games(count: int, seed: int = 0) -> list[UserGame]:
+    rng = random.Random(seed)
+    start = datetime(2024, 7, 1, tzinfo=timezone(timedelta(hours=9)))
+    games = []
+    for index in range(count):
+        fields = {
+            name: rng.randint(0, 5000)
+            for name, field in UserGame.model_fields.items()
+            if field.annotation is int
+        }
+        fields.update(user_id=index, game_id=35000000 + index // 24)
+        games.append(
+            UserGame.model_construct(
+                **fields,
+                nickname=f"player{index}",
+                server="Asia",
+                victory=rng.random() < 0.125,
+                game_start_datetime=start + timedelta(minutes=index // 24),
+                mmr_change=rng.randint(-50, 50),
+                mmr_before=rng.randint(0, 8000),
+                mmr_gain=rng.randint(-50, 50),
+                mmr_after=rng.randint(0, 8000),
+                main_weather=10001,
+                sub_weather=10501,
+                final_mastery_levels={
+                    str(mastery): rng.randint(1, 20) for mastery in (1, 101, 102, 201)
+                },
+                final_equipment={str(slot): 101101 + slot for slot in range(6)},
+                equipment_first_item={str(slot): [201101] for slot in range(5)},
+                skill_order={str(level): 1000 + level % 4 for level in range(1, 19)},
+                killed_by_data=KillDataList(
+                    root=[
+                        KillData(
+                            killerUserNum=rng.randint(0, 10000),
+                            killer="player",
+                            killDetail="someone",
+                            placeOfDeath=str(rng.randint(1, 19)),
+                            killerCharacter="Jackie",
+                            killerWeapon="Dagger",
+                        )
+                    ]
+                ),
+                items_purchased_from_console=[
+                    rng.choice((301101, 302101, 401101)) for _ in range(4)
+                ],
+                items_purchased_from_drone=[rng.choice((205101, 205102))],
+            )
+        )
+    return games
+
+
+def _unique(rows: list[dict[str, Any]], *key: str) -> list[dict[str, Any]]:
+    rows.sort(key=itemgetter(*key))
+    return [next(group) for _, group in groupby(rows, key=itemgetter(*key))]
+
+
+def _legacy_table_rows(game_data: UserGame) -> dict[str, list[dict[str, Any]]]:
+    """The per-table builders as written before TABLE_MAPPINGS, for comparison."""
+    games = [
+        {
+            "game_id": game_data.game_id,
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "season_id": game_data.season_id,
+            "match_mode": game_data.match_mode,
+            "match_team_mode": game_data.match_team_mode,
+            "server": game_data.server,
+            "duration": game_data.duration,
+            "total_match_players": game_data.total_match_players,
+            "main_weather_code": game_data.main_weather,
+            "sub_weather_code": game_data.sub_weather,
+        }
+    ]
+    player_stats = [
+        {
+            "game_id": game_data.game_id,
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "user_id": game_data.user_id,
+            "nickname": game_data.nickname,
+            "character_id": game_data.character_id,
+            "team_id": game_data.team_id,
+            "game_place_result": game_data.game_place_result,
+            "level": game_data.level,
+            "kills": game_data.kills,
+            "assists": game_data.assists,
+            "monster_kills": game_data.monster_kills,
+            "damage_to_player": game_data.damage_to_player,
+            "damage_to_monster": game_data.damage_to_monster,
+            "tanked_damage": game_data.tanked_damage,
+            "healing": game_data.healing,
+            "victory": game_data.victory,
+            "mmr_change": game_data.mmr_change,
+            "mmr_before": game_data.mmr_before,
+            "mmr_gain": game_data.mmr_gain,
+            "mmr_after": game_data.mmr_after,
+            "starting_area": game_data.starting_area,
+            "deaths": game_data.deaths,
+            "double_kills": game_data.double_kills,
+            "triple_kills": game_data.triple_kills,
+            "quadra_kills": game_data.quadra_kills,
+            "extra_kills": game_data.extra_kills,
+            "possessed_credits": game_data.posessed_credits,
+            "used_credits": game_data.used_credits,
+        }
+    ]
+    mastery = [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "mastery_type": int(mastery_type),
+            "level": level,
+        }
+        for mastery_type, level in game_data.final_mastery_levels.items()
+    ]
+    equipment = [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "slot": int(slot),
+            "item_id": item_id,
+            "type": 2,
+        }
+        for slot, item_id in game_data.final_equipment.items()
+    ] + [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "slot": int(slot),
+            "item_id": item_id[0],
+            "type": 1,
+        }
+        for slot, item_id in game_data.equipment_first_item.items()
+    ]
+    skills = [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "skill_level": int(skill_level),
+            "skill_id": skill_id,
+        }
+        for skill_level, skill_id in game_data.skill_order.items()
+    ]
+    killed_by = [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "killed_by_id": kill_data.killed_by_id,
+            "killed_by_type": kill_data.killed_by_type,
+            "killed_by_name": kill_data.killed_by_name,
+            "died_area": kill_data.died_area,
+            "killed_by_character": kill_data.killed_by_character,
+            "killed_by_character_weapon": kill_data.killed_by_character_weapon,
+        }
+        for kill_data in game_data.killed_by_data.root
+    ]
+    purchases = [
+        {
+            "game_start_time": game_data.game_start_datetime.isoformat(),
+            "game_id": game_data.game_id,
+            "user_id": game_data.user_id,
+            "item_id": item_id,
+            "purchase_type": purchase_type,
+            "quantity": quantity,
+        }
+        for purchase_type, items in (
+            ("console", game_data.items_purchased_from_console),
+            ("drone", game_data.items_purchased_from_drone),
+        )
+        for item_id, quantity in Counter(items).items()
+    ]
+    keys = ("game_start_time", "game_id", "user_id")
+    return {
+        "games": games,
+        "player_game_stats": player_stats,
+        "mastery_levels": _unique(mastery, *keys, "mastery_type"),
+        "equipment": equipment,
+        "skill_order": _unique(skills, *keys, "skill_level"),
+        "killed_by_data": _unique(killed_by, *keys, "killed_by_id"),
+        "items_purchased": _unique(purchases, *keys, "item_id", "purchase_type"),
+    }
+
+
+def _legacy(games: list[UserGame]) -> int:
+    return sum(
+        len(rows)
+        for game_data in games
+        for rows in _legacy_table_rows(game_data).values()
+    )
+
+
+def _mapped(games: list[UserGame]) -> int:
+    return sum(len(rows) for rows in build_table_rows(games).values())
+
+
+def _rows_per_second(
+    builder: Callable[[list[UserGame]], int], games: list[UserGame], repeat: int
+) -> tuple[int, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        row_count = builder(games)
+        best = min(best, time.perf_counter() - started)
+    return row_count, row_count / best
+
+
+@app.command()
+def run(
+    players: int = typer.Option(5000, help="Number of player records to build"),
+    repeat: int = typer.Option(5, help="Timed repetitions; the best is reported"),
+    seed: int = typer.Option(0, help="Seed for the sample data"),
+) -> None:
+    """Report rows/sec of the legacy builders and of build_table_rows."""
+    games = _sample_games(players, seed)
+
+    legacy_rows, legacy_rate = _rows_per_second(_legacy, games, repeat)
+    mapped_rows, mapped_rate = _rows_per_second(_mapped, games, repeat)
+
+    typer.echo(f"legacy builders:  {legacy_rows} rows, {legacy_rate:,.0f} rows/sec")
+    typer.echo(f"table mappings:   {mapped_rows} rows, {mapped_rate:,.0f} rows/sec")
+    typer.echo(f"speedup:          {mapped_rate / legacy_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,130 @@
+"""
+Durable progress checkpoints for long-running crawls.
+
+A checkpoint records the game IDs a run intends to process, the ones it has
+finished, and the pagination cursor of every user being crawled, so an
+interrupted `retrieve-games` or `fetch-user-games` run can pick up where it
+stopped instead of starting over.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+from storage.atomic import atomic_write
+
+
+@dataclass
+class UserCursor:
+    """Pagination state of a single user's game history.
+
+    Attributes:
+        next_id (Optional[int]): The `next` cursor of the next page to fetch.
+        games_processed (int): Games inserted so far for the user.
+    """
+
+    next_id: Optional[int] = None
+    games_processed: int = 0
+
+
+@dataclass
+class Checkpoint:
+    """Progress of a crawl, written atomically every `every` updates.
+
+    Attributes:
+        path (str): Where the checkpoint is stored.
+        every (int): Number of updates between automatic saves.
+        pending (list[int]): Game IDs the run intends to process, in order.
+        completed (set[int]): Game IDs already processed.
+        cursors (dict[int, UserCursor]): Pagination state per user ID.
+    """
+
+    path: str
+    every: int = 10
+    pending: list[int] = field(default_factory=list)
+    completed: set[int] = field(default_factory=set)
+    cursors: dict[int, UserCursor] = field(default_factory=dict)
+    _updates: int = field(default=0, repr=False)
+
+    @classmethod
+    def load(cls, path: str, every: int = 10) -> "Checkpoint":
+        """Load a checkpoint written by `save`.
+
+        Args:
+            path (str): The checkpoint file.
+            every (int): Number of updates between automatic saves.
+
+        Returns:
+            Checkpoint: The restored checkpoint.
+
+        Raises:
+            FileNotFoundError: If no checkpoint exists at `path`.
+        """
+        with open(path, "r") as f:
+            state = json.load(f)
+        return cls(
+            path=path,
+            every=every,
+            pending=state["pending"],
+            completed=set(state["completed"]),
+            cursors={
+                int(user_id): UserCursor(**cursor)
+                for user_id, cursor in state["cursors"].items()
+            },
+        )
+
+    @classmethod
+    def load_or_create(cls, path: str, resume: bool, every: int = 10) -> "Checkpoint":
+        """Restore the checkpoint at `path` when resuming, otherwise start fresh.
+
+        Args:
+            path (str): The checkpoint file.
+            resume (bool): Restore an existing checkpoint if there is one.
+            every (int): Number of updates between automatic saves.
+
+        Returns:
+            Checkpoint: The restored or new checkpoint.
+        """
+        if resume and os.path.exists(path):
+            return cls.load(path, every)
+        return cls(path=path, every=every)
+
+    @property
+    def remaining(self) -> list[int]:
+        """Pending game IDs not completed yet, in their original order."""
+        return [game_id for game_id in self.pending if game_id not in self.completed]
+
+    def save(self) -> None:
+        """Write the checkpoint atomically, replacing the previous one."""
+        state = {
+            "pending": self.pending,
+            "completed": sorted(self.completed),
+            "cursors": {
+                str(user_id): cursor.__dict__
+                for user_id, cursor in self.cursors.items()
+            },
+        }
+        atomic_write(self.path, lambda f: json.dump(state, f), "w")
+        self._updates = 0
+
+    def _tick(self) -> None:
+        self._updates += 1
+        if self._updates >= self.every:
+            self.save()
+
+    def mark_completed(self, game_id: int) -> None:
+        """Record a processed game ID."""
+        self.completed.add(game_id)
+        self._tick()
+
+    def update_cursor(
+        self, user_id: int, next_id: Optional[int], games_processed: int
+    ) -> None:
+        """Record how far a user's game history has been crawled."""
+        self.cursors[user_id] = UserCursor(next_id, games_processed)
+        self._tick()
+
+    def finish_user(self, user_id: int) -> None:
+        """Forget a user's cursor once their crawl is complete, and save."""
+        self.cursors.pop(user_id, None)
+        self.save()
@@ -0,0 +1,348 @@
+"""
+Asynchronous variant of SupabaseDAO for concurrent ingestion.
+
+`AsyncSupabaseDAO` has the same methods as `SupabaseDAO`, as coroutines, so
+many upserts can be in flight at once from one event loop. It talks to
+PostgREST through the async client of `postgrest` and keeps one HTTP client per
+event loop, as an `httpx.AsyncClient` is bound to the loop it was first used in.
+Each client has its own bounded connection pool, kept alive between requests
+and using HTTP/2 when `h2` is installed and the server negotiates it. One DAO
+can therefore be shared by every thread and event loop of a process, with no
+lock held around requests.
+
+Example:
+    dao = AsyncSupabaseDAO()
+
+    async def insert(players):
+        await asyncio.gather(*(dao.insert_player_rows(rows) for rows in players))
+        await dao.aclose()
+"""
+
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+import CONSTS
+import metrics
+import profiling
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from postgrest import AsyncPostgrestClient
+
+Row = dict[str, Any]
+
+
+class _LoopPool:
+    """The PostgREST client of one event loop, and the slots bounding its
+    requests in flight."""
+
+    __slots__ = ("client", "slots")
+
+    def __init__(self, client: "AsyncPostgrestClient", max_connections: int):
+        self.client = client
+        self.slots = asyncio.Semaphore(max_connections)
+
+
+class AsyncSupabaseDAO:
+    """Coroutine DAO over a per-event-loop pool of PostgREST HTTP clients.
+
+    Args:
+        url (Optional[str]): Supabase project URL, CONSTS.SUPABASE_URL if omitted.
+        key (Optional[str]): Supabase API key, CONSTS.SUPABASE_KEY if omitted.
+        max_connections (int): Connections per event loop, and requests in
+            flight; further requests wait for a free slot in FIFO order. A few
+            suffice, as the HTTP client's bookkeeping grows with the pool.
+        http2 (Optional[bool]): Offer HTTP/2, by default when `h2` is installed.
+        timeout (float): Seconds before a request times out.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        max_connections: int = 10,
+        http2: Optional[bool] = None,
+        timeout: float = 120.0,
+    ):
+        self.url = url
+        self.key = key
+        self.max_connections = max_connections
+        self.http2 = (
+            importlib.util.find_spec("h2") is not None if http2 is None else http2
+        )
+        self.timeout = timeout
+        self._pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopPool] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _pool(self) -> _LoopPool:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(loop)
+                if pool is None:
+                    pool = self._pools[loop] = _LoopPool(
+                        self._create_client(), self.max_connections
+                    )
+        return pool
+
+    @property
+    def client(self) -> "AsyncPostgrestClient":
+        """The PostgREST client of the running event loop, created on first use."""
+        return self._pool().client
+
+    def _create_client(self) -> "AsyncPostgrestClient":
+        import httpx
+        from postgrest import AsyncPostgrestClient
+
+        url = self.url or CONSTS.SUPABASE_URL
+        key = self.key or CONSTS.SUPABASE_KEY
+        rest_url = f"{url.rstrip('/')}/rest/v1"
+        client = AsyncPostgrestClient(
+            rest_url, headers={"apikey": key, "Authorization": f"Bearer {key}"}
+        )
+        # Replace the default session to bound and keep alive its connections.
+        client.session = httpx.AsyncClient(
+            base_url=rest_url,
+            headers=client.headers,
+            timeout=self.timeout,
+            follow_redirects=True,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        return client
+
+    async def aclose(self) -> None:
+        """Close the connections of the running event loop's client."""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.client.session.aclose()
+
+    async def __aenter__(self) -> "AsyncSupabaseDAO":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def _execute(
+        self, query: Any, table: str, operation: str, rows: Any = None
+    ) -> Any:
+        """Execute a query, recording its latency and outcome, and the rows and
+        bytes it writes.
+
+        Requests beyond the loop's connections wait on its semaphore rather than
+        in the HTTP client's queue, whose scheduling is quadratic in its length.
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._pool().slots:
+                with profiling.span(operation):
+                    result = await query.execute()
+            outcome = "ok"
+            return result
+        finally:
+            metrics.inc("db_requests_total", table, operation, outcome)
+            metrics.observe(
+                "db_request_seconds", time.perf_counter() - start, table, operation
+            )
+            if rows is not None and outcome == "ok":
+                count = len(rows) if isinstance(rows, list) else 1
+                metrics.inc("db_rows_written_total", table, amount=count)
+                metrics.inc(
+                    "db_bytes_written_total",
+                    table,
+                    amount=metrics.payload_bytes(rows),
+                )
+
+    # Game-related methods
+    async def insert_game(self, game_data: Row) -> Any:
+        return await self._execute(
+            self.client.table("games").upsert(game_data), "games", "upsert", game_data
+        )
+
+    async def game_exists(self, game_id: int) -> bool:
+        result = await self._execute(
+            self.client.table("games").select("game_id").eq("game_id", game_id),
+            "games",
+            "select",
+        )
+        return bool(result.data)
+
+    # Player game stats methods
+    async def insert_player_stats(self, player_stats: Row) -> Any:
+        return await self._execute(
+            self.client.table("player_game_stats").upsert(player_stats),
+            "player_game_stats",
+            "upsert",
+            player_stats,
+        )
+
+    async def player_game_stats_exist(self, game_id: int, user_id: int) -> bool:
+        result = await self._execute(
+            self.client.table("player_game_stats")
+            .select("game_id")
+            .eq("game_id", game_id)
+            .eq("user_id", user_id),
+            "player_game_stats",
+            "select",
+        )
+        return bool(result.data)
+
+    # Child table methods, with the same conflict keys as SupabaseDAO
+    async def insert_mastery_levels(self, mastery_inserts: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table("mastery_levels").upsert(
+                mastery_inserts,
+                on_conflict="game_start_time,game_id,user_id,mastery_type",
+            ),
+            "mastery_levels",
+            "upsert",
+            mastery_inserts,
+        )
+
+    async def insert_equipment(self, equipment_inserts: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table("equipment").upsert(
+                equipment_inserts, on_conflict="game_start_time,game_id,user_id,slot"
+            ),
+            "equipment",
+            "upsert",
+            equipment_inserts,
+        )
+
+    async def insert_skill_order(self, skill_inserts: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table("skill_order").upsert(
+                skill_inserts, on_conflict="game_start_time,game_id,user_id,skill_level"
+            ),
+            "skill_order",
+            "upsert",
+            skill_inserts,
+        )
+
+    async def insert_killed_by_data(self, killed_by_inserts: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table("killed_by_data").upsert(
+                killed_by_inserts,
+                on_conflict="game_start_time,game_id,user_id,killed_by_id",
+            ),
+            "killed_by_data",
+            "upsert",
+            killed_by_inserts,
+        )
+
+    async def insert_items_purchased(self, item_purchases: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table("items_purchased").upsert(
+                item_purchases,
+                on_conflict="game_start_time,game_id,user_id,item_id,purchase_type",
+            ),
+            "items_purchased",
+            "upsert",
+            item_purchases,
+        )
+
+    async def insert_player_rows(self, table_rows: dict[str, list[Row]]) -> None:
+        """Write the rows of one player, as built by `build_table_rows`.
+
+        The `games` row is written first, as the other tables reference it; the
+        other tables are then upserted concurrently, like
+        AllDataInsertionStrategy does on threads. Tables without rows are
+        skipped.
+
+        Raises:
+            Exception: The first failed write, once every write has finished.
+        """
+        if table_rows.get("games"):
+            await self.insert_game(table_rows["games"][0])
+        writes = []
+        if table_rows.get("player_game_stats"):
+            writes.append(self.insert_player_stats(table_rows["player_game_stats"][0]))
+        # Final and first equipment share the slot conflict key, so they are
+        # upserted separately.
+        for equipment_type in (2, 1):
+            equipment = [
+                row
+                for row in table_rows.get("equipment", ())
+                if row["type"] == equipment_type
+            ]
+            if equipment:
+                writes.append(self.insert_equipment(equipment))
+        for table, insert in (
+            ("mastery_levels", self.insert_mastery_levels),
+            ("skill_order", self.insert_skill_order),
+            ("killed_by_data", self.insert_killed_by_data),
+            ("items_purchased", self.insert_items_purchased),
+        ):
+            if table_rows.get(table):
+                writes.append(insert(table_rows[table]))
+        for result in await asyncio.gather(*writes, return_exceptions=True):
+            if isinstance(result, BaseException):
+                raise result
+
+    # User-related methods
+    async def insert_user(self, user_data: Row) -> Any:
+        return await self._execute(
+            self.client.table("users").upsert(user_data), "users", "upsert", user_data
+        )
+
+    async def get_user_by_nickname(self, nickname: str) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("users").select("*").eq("nickname", nickname),
+            "users",
+            "select",
+        )
+        return result.data[0] if result.data else None
+
+    async def get_user_by_id(self, user_id: int) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("users").select("*").eq("user_id", user_id),
+            "users",
+            "select",
+        )
+        return result.data[0] if result.data else None
+
+    async def update_user_watermark(
+        self,
+        user_id: int,
+        last_game_id: int,
+        last_game_start_time: str,
+        last_retrieval: str,
+    ) -> Any:
+        watermark = {
+            "last_game_id": last_game_id,
+            "last_game_start_time": last_game_start_time,
+            "last_retrieval": last_retrieval,
+        }
+        return await self._execute(
+            self.client.table("users").update(watermark).eq("user_id", user_id),
+            "users",
+            "update",
+            watermark,
+        )
+
+    # Generic methods
+    async def select(self, table: str, columns: str = "*", **filters: Any) -> list[Row]:
+        query = self.client.table(table).select(columns)
+        for key, value in filters.items():
+            query = query.eq(key, value)
+        result = await self._execute(query, table, "select")
+        return result.data
+
+    async def upsert(self, table: str, data: Row) -> Any:
+        return await self._execute(
+            self.client.table(table).upsert(data), table, "upsert", data
+        )
+
+    async def batch_insert(self, table: str, data_list: list[Row]) -> Any:
+        return await self._execute(
+            self.client.table(table).upsert(data_list), table, "upsert", data_list
+        )
@@ -1,48 +1,247 @@
+import queue
 import threading
-from supabase import create_client, Client
-from CONSTS import SUPABASE_URL, SUPABASE_KEY
-from typing import Optional, Any
+import time
+import CONSTS
+import metrics
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, Any, Sequence
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+Row = dict[str, Any]
+# Fetch one page of a key range: the rows after a key (or from the start of the
+# range when None), in key order.
+PageFetcher = Callable[[Optional[tuple[int, int]], Optional[tuple]], list[Row]]
+
+
+def with_key_columns(columns: str, key: Sequence[str]) -> str:
+    """A select list including the key columns, which keyset paging reads."""
+    if columns.strip() == "*":
+        return columns
+    names = [name.strip() for name in columns.split(",")]
+    return ",".join([*names, *(column for column in key if column not in names)])
+
+
+def _filter_value(value: Any) -> str:
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return str(value)
+
+
+def keyset_filter(key: Sequence[str], after: Sequence[Any]) -> str:
+    """The PostgREST `or` filter of the rows whose key sorts after `after`.
+
+    PostgREST has no row comparison, so `(a, b) > (x, y)` is expanded to
+    `a > x or (a = x and b > y)`.
+
+    Example:
+        >>> keyset_filter(("game_id", "user_id"), (7, 3))
+        'game_id.gt.7,and(game_id.eq.7,user_id.gt.3)'
+    """
+    clauses = []
+    for index, column in enumerate(key):
+        terms = [f"{name}.eq.{_filter_value(v)}" for name, v in zip(key, after[:index])]
+        terms.append(f"{column}.gt.{_filter_value(after[index])}")
+        clauses.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return ",".join(clauses)
+
+
+def split_key_range(lower: Any, upper: Any, parts: int) -> list[tuple[int, int]]:
+    """Split the integer keys from `lower` to `upper` inclusive into at most
+    `parts` half-open ranges of equal width."""
+    width = upper - lower + 1
+    parts = max(1, min(parts, width))
+    bounds = [lower + width * index // parts for index in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def keyset_pages(
+    fetch_page: PageFetcher,
+    key: Sequence[str],
+    key_range: Optional[tuple[int, int]] = None,
+) -> Iterator[list[Row]]:
+    """Page through a key range, each page starting after the previous one's
+    last key, so every page costs an index range scan whatever its depth.
+
+    Paging only stops at an empty page: PostgREST silently caps a response at
+    its `max-rows` setting, so a page shorter than requested does not mean the
+    range is exhausted.
+    """
+    after = None
+    while True:
+        rows = fetch_page(key_range, after)
+        if not rows:
+            return
+        yield rows
+        after = tuple(rows[-1][column] for column in key)
+
+
+def stream_pages(
+    fetch_page: PageFetcher,
+    key_bounds: Callable[[], Optional[tuple[Any, Any]]],
+    key: Sequence[str],
+    workers: int = 1,
+) -> Iterator[list[Row]]:
+    """Stream the pages of a table, over parallel ranges of its leading key.
+
+    With several workers, the leading key's bounds are split into
+    `4 * workers` ranges read concurrently; pages then arrive in key order
+    within a range, but interleaved across ranges. At most `2 * workers` pages
+    are buffered, so memory stays bounded however large the table. A leading
+    key that is not an integer is read as a single range.
+
+    Args:
+        fetch_page (PageFetcher): Reads one page of a range after a key.
+        key_bounds (Callable): Returns the smallest and largest leading key, or
+            None for an empty table.
+        key (Sequence[str]): Columns identifying a row, in sort order.
+        workers (int): Ranges read concurrently.
+
+    Returns:
+        Iterator[list[Row]]: The table's rows, one list per page.
+
+    Raises:
+        Exception: The first error of a range, once the iterator reaches it.
+    """
+    if workers <= 1:
+        yield from keyset_pages(fetch_page, key)
+        return
+    bounds = key_bounds()
+    if bounds is None:
+        return
+    if not all(isinstance(bound, int) for bound in bounds):
+        yield from keyset_pages(fetch_page, key)
+        return
+    ranges = split_key_range(*bounds, workers * 4)
+    pages: queue.Queue = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(key_range: tuple[int, int]) -> None:
+        try:
+            for page in keyset_pages(fetch_page, key, key_range):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stream")
+    try:
+        for key_range in ranges:
+            executor.submit(read, key_range)
+        remaining = len(ranges)
+        while remaining:
+            item = pages.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 class SupabaseDAO:
     _instance: Optional["SupabaseDAO"] = None
     _lock = threading.Lock()
+    _client: Optional["Client"] = None
 
     def __new__(cls) -> "SupabaseDAO":
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super().__new__(cls)
-                    cls._instance.__initialize()
         return cls._instance
 
-    def __initialize(self) -> None:
-        self.client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    @property
+    def client(self) -> "Client":
+        """The Supabase client, created on first use so that building the DAO
+        needs neither credentials nor the supabase import."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+
+                    self._client = create_client(
+                        CONSTS.SUPABASE_URL, CONSTS.SUPABASE_KEY
+                    )
+        return self._client
+
+    @client.setter
+    def client(self, client: "Client") -> None:
+        self._client = client
+
+    def _execute(self, query: Any, table: str, operation: str, rows: Any = None) -> Any:
+        """Execute a query, recording its latency and outcome, and the rows and
+        bytes it writes."""
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with profiling.span(operation):
+                result = query.execute()
+            outcome = "ok"
+            return result
+        finally:
+            metrics.inc("db_requests_total", table, operation, outcome)
+            metrics.observe(
+                "db_request_seconds", time.perf_counter() - start, table, operation
+            )
+            if rows is not None and outcome == "ok":
+                count = len(rows) if isinstance(rows, list) else 1
+                metrics.inc("db_rows_written_total", table, amount=count)
+                metrics.inc(
+                    "db_bytes_written_total",
+                    table,
+                    amount=metrics.payload_bytes(rows),
+                )
 
     # Game-related methods
     def insert_game(self, game_data: dict[str, Any]) -> dict[str, Any]:
-        return self.client.table("games").upsert(game_data).execute()
+        return self._execute(
+            self.client.table("games").upsert(game_data), "games", "upsert", game_data
+        )
 
     def game_exists(self, game_id: int) -> bool:
-        result = (
-            self.client.table("games")
-            .select("game_id")
-            .eq("game_id", game_id)
-            .execute()
+        result = self._execute(
+            self.client.table("games").select("game_id").eq("game_id", game_id),
+            "games",
+            "select",
         )
         return bool(result.data)
 
     # Player game stats methods
     def insert_player_stats(self, player_stats: dict[str, Any]) -> dict[str, Any]:
-        return self.client.table("player_game_stats").upsert(player_stats).execute()
+        return self._execute(
+            self.client.table("player_game_stats").upsert(player_stats),
+            "player_game_stats",
+            "upsert",
+            player_stats,
+        )
 
     def player_game_stats_exist(self, game_id: int, user_id: int) -> bool:
-        result = (
+        result = self._execute(
             self.client.table("player_game_stats")
             .select("game_id")
             .eq("game_id", game_id)
-            .eq("user_id", user_id)
-            .execute()
+            .eq("user_id", user_id),
+            "player_game_stats",
+            "select",
         )
         return bool(result.data)
 
@@ -50,91 +249,201 @@ class SupabaseDAO:
     def insert_mastery_levels(
         self, mastery_inserts: list[dict[str, Any]]
     ) -> dict[str, Any]:
-        return (
-            self.client.table("mastery_levels")
-            .upsert(
+        return self._execute(
+            self.client.table("mastery_levels").upsert(
                 mastery_inserts,
                 on_conflict="game_start_time,game_id,user_id,mastery_type",
-            )
-            .execute()
+            ),
+            "mastery_levels",
+            "upsert",
+            mastery_inserts,
         )
 
     # Equipment methods
     def insert_equipment(
         self, equipment_inserts: list[dict[str, Any]]
     ) -> dict[str, Any]:
-        return (
-            self.client.table("equipment")
-            .upsert(
+        return self._execute(
+            self.client.table("equipment").upsert(
                 equipment_inserts, on_conflict="game_start_time,game_id,user_id,slot"
-            )
-            .execute()
+            ),
+            "equipment",
+            "upsert",
+            equipment_inserts,
         )
 
     # Skill order methods
     def insert_skill_order(self, skill_inserts: list[dict[str, Any]]) -> dict[str, Any]:
-        return (
-            self.client.table("skill_order")
-            .upsert(
+        return self._execute(
+            self.client.table("skill_order").upsert(
                 skill_inserts, on_conflict="game_start_time,game_id,user_id,skill_level"
-            )
-            .execute()
+            ),
+            "skill_order",
+            "upsert",
+            skill_inserts,
         )
 
     # Killed by data methods
     def insert_killed_by_data(
         self, killed_by_inserts: list[dict[str, Any]]
     ) -> dict[str, Any]:
-        return (
-            self.client.table("killed_by_data")
-            .upsert(
+        return self._execute(
+            self.client.table("killed_by_data").upsert(
                 killed_by_inserts,
                 on_conflict="game_start_time,game_id,user_id,killed_by_id",
-            )
-            .execute()
+            ),
+            "killed_by_data",
+            "upsert",
+            killed_by_inserts,
         )
 
     # Items purchased methods
     def insert_items_purchased(
         self, item_purchases: list[dict[str, Any]]
     ) -> dict[str, Any]:
-        return (
-            self.client.table("items_purchased")
-            .upsert(
+        return self._execute(
+            self.client.table("items_purchased").upsert(
                 item_purchases,
                 on_conflict="game_start_time,game_id,user_id,item_id,purchase_type",
-            )
-            .execute()
+            ),
+            "items_purchased",
+            "upsert",
+            item_purchases,
         )
 
     # User-related methods
     def insert_user(self, user_data: dict[str, Any]) -> dict[str, Any]:
-        return self.client.table("users").upsert(user_data).execute()
+        return self._execute(
+            self.client.table("users").upsert(user_data), "users", "upsert", user_data
+        )
 
     def get_user_by_nickname(self, nickname: str) -> Optional[dict[str, Any]]:
-        result = (
-            self.client.table("users").select("*").eq("nickname", nickname).execute()
+        result = self._execute(
+            self.client.table("users").select("*").eq("nickname", nickname),
+            "users",
+            "select",
         )
         return result.data[0] if result.data else None
 
     def get_user_by_id(self, user_id: int) -> Optional[dict[str, Any]]:
-        result = self.client.table("users").select("*").eq("user_id", user_id).execute()
+        result = self._execute(
+            self.client.table("users").select("*").eq("user_id", user_id),
+            "users",
+            "select",
+        )
         return result.data[0] if result.data else None
 
+    def get_tracked_users(self, page_size: int = 1000) -> list[dict[str, Any]]:
+        return [
+            user
+            for page in self.stream("users", ("user_id",), page_size=page_size)
+            for user in page
+        ]
+
+    def update_user_watermark(
+        self,
+        user_id: int,
+        last_game_id: int,
+        last_game_start_time: str,
+        last_retrieval: str,
+    ) -> dict[str, Any]:
+        watermark = {
+            "last_game_id": last_game_id,
+            "last_game_start_time": last_game_start_time,
+            "last_retrieval": last_retrieval,
+        }
+        return self._execute(
+            self.client.table("users").update(watermark).eq("user_id", user_id),
+            "users",
+            "update",
+            watermark,
+        )
+
     # Generic select method for flexibility
     def select(self, table: str, columns: str = "*", **filters) -> list[dict[str, Any]]:
         query = self.client.table(table).select(columns)
         for key, value in filters.items():
             query = query.eq(key, value)
-        result = query.execute()
+        result = self._execute(query, table, "select")
         return result.data
 
+    def stream(
+        self,
+        table: str,
+        key: Sequence[str],
+        columns: str = "*",
+        page_size: int = 1000,
+        since: Optional[str] = None,
+        workers: int = 1,
+    ) -> Iterator[list[dict[str, Any]]]:
+        """Read a whole table with bounded memory, in pages of keyset ranges.
+
+        Each page is the rows after the previous page's last key, rather than
+        an offset, so pages cost the same at any depth and never skip or
+        repeat rows. Reading stops at the first empty page, so a `page_size`
+        above the server's `max-rows` only makes pages smaller.
+
+        Args:
+            table (str): The table.
+            key (Sequence[str]): Columns identifying a row, in sort order, e.g.
+                `("game_id", "user_id")`. The leading column is split into
+                ranges when reading in parallel.
+            columns (str): Columns to read; the key columns are always read.
+            page_size (int): Rows per page.
+            since (Optional[str]): Only read rows whose game started on or
+                after this ISO timestamp.
+            workers (int): Key ranges read concurrently; pages then arrive in
+                key order within a range only.
+
+        Returns:
+            Iterator[list[dict[str, Any]]]: The rows, one list per page.
+        """
+        columns = with_key_columns(columns, key)
+
+        def query(select: str) -> Any:
+            query = self.client.table(table).select(select)
+            if since is not None:
+                query = query.gte("game_start_time", since)
+            return query
+
+        def fetch_page(
+            key_range: Optional[tuple[int, int]], after: Optional[tuple]
+        ) -> list[dict[str, Any]]:
+            page = query(columns)
+            if key_range is not None:
+                page = page.gte(key[0], key_range[0]).lt(key[0], key_range[1])
+            if after is not None:
+                # The leading column's bound lets the database seek the index.
+                page = page.gte(key[0], after[0]).or_(keyset_filter(key, after))
+            for column in key:
+                page = page.order(column)
+            return self._execute(page.limit(page_size), table, "select").data
+
+        def key_bounds() -> Optional[tuple[Any, Any]]:
+            bounds = []
+            for descending in (False, True):
+                result = self._execute(
+                    query(key[0]).order(key[0], desc=descending).limit(1),
+                    table,
+                    "select",
+                )
+                if not result.data:
+                    return None
+                bounds.append(result.data[0][key[0]])
+            return bounds[0], bounds[1]
+
+        return stream_pages(fetch_page, key_bounds, key, workers)
+
     # Generic upsert method for flexibility
     def upsert(self, table: str, data: dict[str, Any]) -> dict[str, Any]:
-        return self.client.table(table).upsert(data).execute()
+        return self._execute(
+            self.client.table(table).upsert(data), table, "upsert", data
+        )
 
     # Method to handle batch operations
     def batch_insert(
         self, table: str, data_list: list[dict[str, Any]]
     ) -> dict[str, Any]:
-        return self.client.table(table).upsert(data_list).execute()
+        return self._execute(
+            self.client.table(table).upsert(data_list), table, "upsert", data_list
+        )
@@ -7,34 +7,134 @@ game data, and file processing.
 
 The module uses Typer for creating the CLI, and interacts with external APIs and
 a Supabase database for data storage and retrieval.
+
+Only light modules are imported here: the API client, pydantic models, numpy,
+pyarrow and the storage and analytics modules are imported by the commands that
+use them, and the Supabase client is created on first use, so `--help` and
+local-only commands start fast and need no credentials.
 """
 
 import typer
-from typing import Optional
-from models.game import UserGame
+import metrics
+import profiling
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Optional
 from data_access.supabase import SupabaseDAO
-from processors.prepare_processors import GameDataService
-from processors.insertion_processors import (
-    DataInsertionContext,
-    AllDataInsertionStrategy,
-)
 from CONSTS import (
     MATCHES_PATH,
     ARCHIVE_PATH,
     ERROR_PATH,
+    CHECKPOINT_PATH,
+    EXPORT_PATH,
+    ARROW_CACHE_PATH,
+    AGGREGATES_PATH,
+    BUILD_INDEX_PATH,
+    KILL_GRAPH_PATH,
+    TEAM_SYNERGY_PATH,
+    MMR_SERIES_PATH,
+    L10N_PATH,
     CURRENT_SEASON,
 )
 import os
 import shutil
 import json
+import itertools
 import random
 from time import sleep
 from collections import defaultdict
-from getter import _fetch_by_game_id, _fetch_user_id_by_username, _fetch_by_user_id
+from checkpoint import Checkpoint
+from archive import iter_archive_files
+
+if TYPE_CHECKING:
+    from models.game import UserGame
+    from models.user import UserWatermark
+    from processors.insertion_processors import DataInsertionContext
 
 app = typer.Typer()
 dao = SupabaseDAO()
-game_service = GameDataService()
+
+
+def __getattr__(name: str) -> Any:
+    """Build `game_service` on first access, keeping its imports off startup."""
+    if name == "game_service":
+        from processors.prepare_processors import GameDataService
+
+        globals()[name] = GameDataService()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    metrics_port: Optional[int] = typer.Option(
+        None, help="Serve Prometheus metrics on this local port while running"
+    ),
+    metrics_summary: Optional[str] = typer.Option(
+        None, help="Write a JSON summary of the metrics to this file periodically"
+    ),
+    metrics_interval: float = typer.Option(
+        30.0, help="Seconds between metrics summary writes"
+    ),
+    profile: Optional[str] = typer.Option(
+        None,
+        help="Profile the command: cpu (cProfile), sample (stack sampling), "
+        "memory (tracemalloc) or spans (wall time per pipeline stage only)",
+    ),
+    profile_dir: str = typer.Option(
+        profiling.DEFAULT_OUTPUT_DIR, help="Directory to write profiles to"
+    ),
+    profile_interval: float = typer.Option(
+        0.005, help="Seconds between stack samples in sample mode"
+    ),
+) -> None:
+    """Fetch, store and analyze ER game data.
+
+    Per-stage metrics (API requests, validation, table writes) are recorded only
+    when --metrics-port or --metrics-summary is given. --profile writes a profile
+    of the command and a wall time breakdown of its stages to --profile-dir.
+    """
+    if profile is not None:
+        if profile not in profiling.MODES:
+            raise typer.BadParameter(
+                f"Use one of {', '.join(profiling.MODES)}", param_hint="--profile"
+            )
+        session = profiling.Session(
+            profile, profile_dir, ctx.invoked_subcommand or "cli", profile_interval
+        ).start()
+        ctx.call_on_close(lambda: typer.echo(session.stop(), err=True))
+    if metrics_port is not None:
+        server = metrics.serve(metrics_port)
+        typer.echo(
+            f"Serving metrics at http://127.0.0.1:{server.server_address[1]}/metrics"
+        )
+        ctx.call_on_close(server.shutdown)
+    if metrics_summary:
+        writer = metrics.SummaryWriter(metrics_summary, metrics_interval).start()
+        ctx.call_on_close(writer.stop)
+
+
+def new_insertion_context() -> "DataInsertionContext":
+    """Create the context every insert command writes with.
+
+    Returns:
+        DataInsertionContext: A context writing all tables and updating the
+        materialized aggregates at AGGREGATES_PATH and the MMR time series at
+        MMR_SERIES_PATH.
+    """
+    from processors.insertion_processors import (
+        DataInsertionContext,
+        AllDataInsertionStrategy,
+    )
+    from storage.aggregates import AggregateStore
+    from storage.mmr_series import MMRSeriesStore
+
+    return DataInsertionContext(
+        AllDataInsertionStrategy(
+            aggregates=AggregateStore(AGGREGATES_PATH),
+            mmr_series=MMRSeriesStore(MMR_SERIES_PATH),
+        )
+    )
 
 
 def get_user_id(username: str) -> Optional[int]:
@@ -56,6 +156,7 @@ def get_user_id(username: str) -> Optional[int]:
         return user["user_id"]
 
     # If not found, fetch from API and insert
+    from getter import _fetch_user_id_by_username
 
     user = _fetch_user_id_by_username(username)
     if user:
@@ -66,7 +167,7 @@ def get_user_id(username: str) -> Optional[int]:
     return None
 
 
-def group_by_team(user_games: list[UserGame]) -> dict[int, list[UserGame]]:
+def group_by_team(user_games: list["UserGame"]) -> dict[int, list["UserGame"]]:
     """Group UserGame objects by team_id.
 
     Args:
@@ -86,7 +187,7 @@ def group_by_team(user_games: list[UserGame]) -> dict[int, list[UserGame]]:
 
 
 def write_teams_to_json(
-    grouped_teams: dict[int, list[UserGame]], output_dir: str, game_id: int
+    grouped_teams: dict[int, list["UserGame"]], output_dir: str, game_id: int
 ) -> None:
     """Write grouped team data to JSON files.
 
@@ -143,7 +244,7 @@ def generate_game_ids(count: int) -> list[int]:
     return game_ids
 
 
-def process_game(game_id: int) -> Optional[list[UserGame]]:
+def process_game(game_id: int) -> Optional[list["UserGame"]]:
     """Process a single game by ID.
 
     Args:
@@ -151,14 +252,18 @@ def process_game(game_id: int) -> Optional[list[UserGame]]:
 
     Returns:
         Optional[list[UserGame]]: A list of UserGame objects if the game is processed
-        successfully, otherwise None.
+        successfully, otherwise None: the game does not exist, or is skipped for
+        being from another season or having no weather data.
 
     Raises:
-        Exception: If the game is not from the current season or season 0.
+        Exception: If the game could not be fetched or processed, so the caller
+            can retry it.
     """
+    from getter import _fetch_by_game_id
+
     response = None
     try:
-        response = _fetch_by_game_id(game_id)
+        response = _fetch_by_game_id(game_id, raise_errors=True)
 
         if isinstance(response, dict):
             if "userGames" not in response:
@@ -172,10 +277,12 @@ def process_game(game_id: int) -> Optional[list[UserGame]]:
             games = response
 
         if not games:
+            metrics.inc("games_processed_total", "empty")
             typer.echo(f"No data found for game ID {game_id}, skipping...")
             return None
 
         if games[0].season_id != CURRENT_SEASON and games[0].season_id != 0:
+            metrics.inc("games_processed_total", "other_season")
             typer.echo(
                 f"Game with ID {game_id} is not from the current season or season 0. From season ID {games[0].season_id}, skipping..."
             )
@@ -187,18 +294,97 @@ def process_game(game_id: int) -> Optional[list[UserGame]]:
             for game in games
         )
         if not has_weather_data:
+            metrics.inc("games_processed_total", "no_weather")
             typer.echo(f"Game with ID {game_id} has no weather data, skipping...")
             return None
 
+        metrics.inc("games_processed_total", "ok")
         return games
 
     except Exception as e:
+        metrics.inc("games_processed_total", "error")
         typer.echo(f"Error processing game with ID {game_id}: {str(e)}")
         if response is not None:
             typer.echo(f"Response content: {json.dumps(response, indent=2)}")
         else:
             typer.echo("No response received from API.")
-        return None
+        raise
+
+
+def sync_user(
+    watermark: "UserWatermark",
+    insertion_context: "DataInsertionContext",
+    max_pages: int,
+) -> int:
+    """Insert a user's games played since their watermark, newest first.
+
+    Pages through the user's history until reaching a game at or before the
+    watermark, so an up-to-date user costs a single request. Games are inserted
+    without checking the database first, since every table write is an upsert.
+    The watermark only moves once every new game has been inserted, so a failed
+    sync is retried in full on the next run. Likewise it stays put when
+    `max_pages` runs out before reaching it, as moving it would skip the games
+    between the last page fetched and the old watermark for good; the next run
+    starts over from the newest game.
+
+    Args:
+        watermark (UserWatermark): The newest game already ingested for the user.
+        insertion_context (DataInsertionContext): The context to insert games with.
+        max_pages (int): Maximum number of pages to fetch. For a user without a
+            watermark, it bounds how far back the first sync reaches.
+
+    Returns:
+        int: The number of games inserted.
+
+    Raises:
+        requests.RequestException: If a page cannot be fetched.
+    """
+    import pendulum
+    from getter import _fetch_by_user_id
+
+    newest: Optional["UserGame"] = None
+    games_inserted = 0
+    next_id = None
+    caught_up = False
+    for _ in range(max_pages):
+        games, next_id = _fetch_by_user_id(
+            watermark.user_id,
+            next_id,
+            tables=insertion_context.tables,
+            raise_errors=True,
+        )
+        new_games = [
+            game
+            for game in games
+            if not watermark.covers(game.game_start_datetime, game.game_id)
+        ]
+        for game in new_games:
+            insertion_context.insert_data(game, dao)
+            games_inserted += 1
+            if newest is None or (game.game_start_datetime, game.game_id) > (
+                newest.game_start_datetime,
+                newest.game_id,
+            ):
+                newest = game
+
+        if len(new_games) < len(games) or not next_id:
+            caught_up = True
+            break
+
+    if not caught_up and watermark.last_game_start_time is not None:
+        typer.echo(
+            f"Sync of user {watermark.user_id} stopped after {max_pages} pages "
+            "before reaching its watermark; keeping the watermark, rerun with a "
+            "larger --max-pages to catch up"
+        )
+    elif newest is not None:
+        dao.update_user_watermark(
+            watermark.user_id,
+            newest.game_id,
+            newest.game_start_datetime.isoformat(),
+            pendulum.now().isoformat(),
+        )
+    return games_inserted
 
 
 @app.command()
@@ -222,6 +408,8 @@ def insert_users(
         Exception: If the user data cannot be inserted into the database.
         Exception: If the user already exists in the database and force is not set.
     """
+    from getter import _fetch_user_id_by_username
+
     for username in usernames:
         user = dao.get_user_by_nickname(username)
         if user and not force:
@@ -244,12 +432,25 @@ def insert_users(
 def fetch_user_games(
     username: str = typer.Argument(..., help="Username to fetch games for"),
     limit: int = typer.Option(10, help="Maximum number of games to fetch"),
+    resume: bool = typer.Option(
+        False, "--resume", help="Resume from the user's saved pagination cursor"
+    ),
+    checkpoint_path: str = typer.Option(
+        os.path.join(CHECKPOINT_PATH, "fetch_user_games.json"),
+        help="File to store pagination checkpoints in",
+    ),
+    checkpoint_every: int = typer.Option(
+        10, help="Number of pages between checkpoint writes"
+    ),
 ) -> None:
     """Fetch and insert user games data for a given username.
 
     Args:
         username (str): The username to fetch games for.
         limit (int): The maximum number of games to fetch.
+        resume (bool): Resume from the user's saved pagination cursor.
+        checkpoint_path (str): File to store pagination checkpoints in.
+        checkpoint_every (int): Number of pages between checkpoint writes.
 
     Returns:
         None, fetches and inserts user games data into the database.
@@ -259,39 +460,116 @@ def fetch_user_games(
         Exception: If the user games data cannot be fetched.
         Exception: If the user games data cannot be inserted into the database.
     """
+    from getter import _fetch_by_user_id
+
     user_id = get_user_id(username)
     if not user_id:
         typer.echo(f"Failed to find or fetch user ID for username: {username}")
         return
 
-    next_id = None
-    games_processed = 0
-    insertion_context = DataInsertionContext(AllDataInsertionStrategy())
-
-    while games_processed < limit:
-        games, next_id = _fetch_by_user_id(user_id, next_id)
+    # The file holds every user's cursor, so it is always loaded to keep the
+    # others; `resume` only decides whether this user's cursor is used.
+    checkpoint = Checkpoint.load_or_create(checkpoint_path, True, checkpoint_every)
+    cursor = checkpoint.cursors.get(user_id) if resume else None
+    if not resume:
+        checkpoint.cursors.pop(user_id, None)
+    next_id = cursor.next_id if cursor else None
+    games_processed = cursor.games_processed if cursor else 0
+    if cursor:
+        typer.echo(
+            f"Resuming {username} at cursor {next_id} "
+            f"with {games_processed} games already processed"
+        )
+    insertion_context = new_insertion_context()
 
-        for game in games:
-            if not dao.game_exists(game.game_id) or not dao.player_game_stats_exist(
-                game.game_id, user_id
-            ):
-                insertion_context.insert_data(game, dao)
-                games_processed += 1
-                typer.echo(f"Inserted game data for game ID: {game.game_id}")
-            else:
+    try:
+        while games_processed < limit:
+            try:
+                games, next_id = _fetch_by_user_id(
+                    user_id, next_id, tables=insertion_context.tables, raise_errors=True
+                )
+            except Exception:
+                # The error is printed by the fetch; an empty page would look like
+                # the end of the history and drop the cursor, so keep it instead.
                 typer.echo(
-                    f"Game {game.game_id} already exists for user {username}. Skipping."
+                    f"Stopped fetching games of {username} at cursor {next_id}; "
+                    "rerun with --resume to continue from there"
                 )
-
-            if games_processed >= limit:
+                raise typer.Exit(1)
+
+            for game in games:
+                if not dao.game_exists(game.game_id) or not dao.player_game_stats_exist(
+                    game.game_id, user_id
+                ):
+                    insertion_context.insert_data(game, dao)
+                    games_processed += 1
+                    typer.echo(f"Inserted game data for game ID: {game.game_id}")
+                else:
+                    typer.echo(
+                        f"Game {game.game_id} already exists for user {username}. Skipping."
+                    )
+
+                if games_processed >= limit:
+                    break
+
+            if not next_id:
                 break
+            checkpoint.update_cursor(user_id, next_id, games_processed)
+    finally:
+        checkpoint.save()
 
-        if not next_id:
-            break
-
+    checkpoint.finish_user(user_id)
     typer.echo(f"Processed {games_processed} games for user {username}")
 
 
+@app.command()
+def sync_users(
+    workers: int = typer.Option(4, help="Number of users synced concurrently"),
+    max_pages: int = typer.Option(
+        10, help="Maximum pages fetched per user, bounding first-time syncs"
+    ),
+) -> None:
+    """Insert the games every tracked user played since their last sync.
+
+    Args:
+        workers (int): Number of users synced concurrently.
+        max_pages (int): Maximum pages fetched per user.
+
+    Returns:
+        None, inserts new games into the database and advances user watermarks.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from models.user import UserWatermark
+
+    watermarks = [
+        UserWatermark.model_validate(user) for user in dao.get_tracked_users()
+    ]
+    insertion_context = new_insertion_context()
+    games_inserted = 0
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync") as pool:
+        futures = {
+            pool.submit(sync_user, watermark, insertion_context, max_pages): watermark
+            for watermark in watermarks
+        }
+        for future in as_completed(futures):
+            user_id = futures[future].user_id
+            try:
+                inserted = future.result()
+            except Exception as e:
+                failures += 1
+                typer.echo(f"Failed to sync user {user_id}: {str(e)}")
+                continue
+            games_inserted += inserted
+            if inserted:
+                typer.echo(f"Inserted {inserted} new games for user {user_id}")
+
+    typer.echo(
+        f"Synced {len(watermarks) - failures} of {len(watermarks)} users, "
+        f"inserted {games_inserted} games"
+    )
+
+
 @app.command()
 def process_json_files(
     directory: str = typer.Option(
@@ -317,7 +595,10 @@ def process_json_files(
     Raises:
         Exception: If an error occurs while processing a file.
     """
-    insertion_context = DataInsertionContext(AllDataInsertionStrategy())
+    from models.projection import projection_model
+
+    insertion_context = new_insertion_context()
+    game_model = projection_model(insertion_context.tables)
 
     for root, _, files in os.walk(directory):
         for file in files:
@@ -327,7 +608,7 @@ def process_json_files(
                     with open(file_path, "r") as f:
                         game_data = json.load(f)
                     for player_data in game_data:
-                        game = UserGame(**player_data)
+                        game = game_model.from_raw(player_data)
                         insertion_context.insert_data(game, dao)
                     shutil.move(file_path, os.path.join(archive_dir, file))
                     typer.echo(f"Processed and archived: {file}")
@@ -358,13 +639,16 @@ def process_single_file(
     Raises:
         Exception: If an error occurs while processing the file.
     """
-    insertion_context = DataInsertionContext(AllDataInsertionStrategy())
+    from models.projection import projection_model
+
+    insertion_context = new_insertion_context()
+    game_model = projection_model(insertion_context.tables)
 
     try:
         with open(file_path, "r") as f:
             game_data = json.load(f)
         for player_data in game_data:
-            game = UserGame(**player_data)
+            game = game_model.from_raw(player_data)
             insertion_context.insert_data(game, dao)
         shutil.move(file_path, os.path.join(archive_dir, os.path.basename(file_path)))
         typer.echo(f"Processed and archived: {file_path}")
@@ -382,6 +666,19 @@ def retrieve_games(
     delay: float = typer.Option(
         1.33, help="Delay in seconds between processing each game"
     ),
+    resume: bool = typer.Option(
+        False, "--resume", help="Resume the game IDs of the last interrupted run"
+    ),
+    checkpoint_path: str = typer.Option(
+        os.path.join(CHECKPOINT_PATH, "retrieve_games.json"),
+        help="File to store the run's checkpoint in",
+    ),
+    checkpoint_every: int = typer.Option(
+        10, help="Number of games between checkpoint writes"
+    ),
+    synergy_path: str = typer.Option(
+        TEAM_SYNERGY_PATH, help="Team synergy index to add the games' teams to"
+    ),
 ) -> None:
     """Generate game IDs, process games, and write team data to JSON files.
 
@@ -389,6 +686,11 @@ def retrieve_games(
         count (int): Number of game IDs to generate and process.
         output_dir (str): Directory to write output JSON files.
         delay (float): Delay in seconds between processing each game.
+        resume (bool): Resume the game IDs of the last interrupted run instead of
+            generating new ones.
+        checkpoint_path (str): File to store the run's checkpoint in.
+        checkpoint_every (int): Number of games between checkpoint writes.
+        synergy_path (str): Team synergy index to add the games' teams to.
 
     Returns:
         None, generates game IDs, processes games, and writes team data to JSON files.
@@ -396,16 +698,715 @@ def retrieve_games(
     Raises:
         Exception: If an error occurs while processing a game.
     """
-    game_ids = generate_game_ids(count)
-
-    for i, game_id in enumerate(game_ids, 1):
-        typer.echo(f"Processing game number {i} of {len(game_ids)}")
-        typer.echo(f"Processing game ID: {game_id}")
-        games = process_game(game_id)
-        if games:
-            grouped_teams = group_by_team(games)
-            write_teams_to_json(grouped_teams, output_dir, game_id)
-            sleep(delay)
+    checkpoint = Checkpoint.load_or_create(checkpoint_path, resume, checkpoint_every)
+    if checkpoint.remaining:
+        typer.echo(
+            f"Resuming: {len(checkpoint.remaining)} of {len(checkpoint.pending)} "
+            "games left"
+        )
+    else:
+        checkpoint.pending = generate_game_ids(count)
+        checkpoint.completed = set()
+        checkpoint.save()
+
+    from analytics.team_synergy import TeamSynergyIndex
+
+    game_ids = checkpoint.remaining
+    synergy = TeamSynergyIndex.load_or_create(synergy_path)
+    try:
+        for i, game_id in enumerate(game_ids, 1):
+            typer.echo(f"Processing game number {i} of {len(game_ids)}")
+            typer.echo(f"Processing game ID: {game_id}")
+            try:
+                games = process_game(game_id)
+            except Exception:
+                # Left pending, so a resumed run retries it.
+                sleep(delay)
+                continue
+            if games:
+                grouped_teams = group_by_team(games)
+                write_teams_to_json(grouped_teams, output_dir, game_id)
+                synergy.add_teams(grouped_teams)
+            checkpoint.mark_completed(game_id)
+            if games:
+                sleep(delay)
+    finally:
+        checkpoint.save()
+        synergy.save(synergy_path)
+
+
+@app.command()
+def export_parquet(
+    output_dir: str = typer.Option(
+        EXPORT_PATH, help="Root directory of the Parquet datasets"
+    ),
+    source: str = typer.Option(
+        "archive", help="Where to read players from: 'archive' or 'db'"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to read"),
+    tables: Optional[list[str]] = typer.Option(
+        None, "--table", help="Table to export, repeatable; all tables by default"
+    ),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Rewrite every partition instead of only those new rows fall into",
+    ),
+    row_group_size: int = typer.Option(131_072, help="Rows per Parquet row group"),
+    max_buffered_rows: int = typer.Option(
+        1_000_000, help="Rows held in memory before writing files"
+    ),
+    languages: Optional[list[str]] = typer.Option(
+        None,
+        "--labels",
+        help="Add name columns for IDs in this language, e.g. English; repeatable",
+    ),
+    l10n_dir: str = typer.Option(L10N_PATH, help="l10n data directory to label from"),
+    db_workers: int = typer.Option(
+        1, help="Key ranges of each table read from the database concurrently"
+    ),
+) -> None:
+    """Export the match tables as Parquet datasets partitioned by season and date.
+
+    Args:
+        output_dir (str): Root directory of the Parquet datasets.
+        source (str): Where to read players from, the JSON archive or the database.
+        archive_dir (str): Archive directory to read when the source is 'archive'.
+        tables (Optional[list[str]]): Tables to export, all tables when omitted.
+        full (bool): Rewrite every partition instead of only the ones the rows
+            new since the last export fall into.
+        row_group_size (int): Rows per Parquet row group.
+        max_buffered_rows (int): Rows held in memory before writing files.
+        languages (Optional[list[str]]): Languages to add name columns in, e.g.
+            `character_name` next to `character_id`; none when omitted.
+        l10n_dir (str): The l10n data directory holding the names.
+        db_workers (int): Key ranges of each table read concurrently from the
+            database.
+
+    Returns:
+        None, writes one hive-partitioned dataset per table under output_dir.
+
+    Raises:
+        typer.BadParameter: If the source or a table name is unknown.
+    """
+    from processors.table_mappings import TABLE_MAPPINGS
+    from analytics.enrichment import Enricher
+    from storage.parquet_export import (
+        PartitionedParquetWriter,
+        export_archive,
+        export_database,
+        load_state,
+        save_state,
+    )
+
+    if source not in ("archive", "db"):
+        raise typer.BadParameter(f"Unknown source: {source}")
+    tables = tables or list(TABLE_MAPPINGS)
+    unknown = [table for table in tables if table not in TABLE_MAPPINGS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown tables: {', '.join(unknown)}")
+
+    origin = os.path.abspath(archive_dir) if source == "archive" else "db"
+    state = {} if full else load_state(output_dir)
+    # The state only covers the tables and the source it was written for.
+    incremental = state.get("source") == origin and set(tables) <= set(
+        state.get("tables", ())
+    )
+    if incremental:
+        typer.echo("Exporting the rows new since the last export")
+    writer = PartitionedParquetWriter(
+        output_dir,
+        row_group_size=row_group_size,
+        max_buffered_rows=max_buffered_rows,
+        enricher=Enricher(l10n_dir, languages) if languages else None,
+    )
+    if source == "archive":
+        files = export_archive(
+            writer, archive_dir, tables, state["files"] if incremental else None
+        )
+        state = {"files": files}
+    else:
+        partitions = export_database(
+            writer,
+            dao,
+            tables,
+            state["partitions"] if incremental else None,
+            workers=db_workers,
+        )
+        state = {"partitions": partitions}
+    summary = writer.close()
+
+    save_state(output_dir, {"source": origin, "tables": tables, **state})
+    for table, rows in summary.rows.items():
+        typer.echo(f"{table}: {rows} rows")
+    typer.echo(
+        f"Wrote {summary.files} files across {summary.partitions} partitions, "
+        f"skipped {summary.skipped_rows} rows of unchanged partitions"
+    )
+
+
+@app.command()
+def refresh_arrow_cache(
+    cache_dir: str = typer.Option(
+        ARROW_CACHE_PATH, help="Directory of the Arrow IPC cache"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to cache"),
+    rebuild: bool = typer.Option(
+        False, "--rebuild", help="Rebuild the whole cache instead of changed games"
+    ),
+) -> None:
+    """Update the Arrow IPC cache of the archive for memory-mapped loading.
+
+    Args:
+        cache_dir (str): Directory of the Arrow IPC cache.
+        archive_dir (str): Archive directory to cache.
+        rebuild (bool): Rebuild the whole cache instead of adding new archive
+            files and rebuilding the segments of changed games.
+
+    Returns:
+        None, writes Arrow IPC files per season, table and segment under
+        cache_dir.
+    """
+    from storage.arrow_cache import ArrowCache
+
+    result = ArrowCache(cache_dir, archive_dir).refresh(rebuild=rebuild)
+    if not result.changed:
+        typer.echo("Arrow cache is up to date")
+        return
+    if result.updated:
+        typer.echo(f"Updated seasons: {', '.join(map(str, sorted(result.updated)))}")
+    if result.removed:
+        typer.echo(f"Removed seasons: {', '.join(map(str, sorted(result.removed)))}")
+    if result.merged:
+        typer.echo(f"Merged {result.merged} segments")
+    typer.echo(f"Read {result.files_read} archive files")
+
+
+@app.command()
+def character_stats(
+    seasons: Optional[list[int]] = typer.Option(
+        None, "--season", help="Season to include, repeatable; all cached by default"
+    ),
+    by: Optional[list[str]] = typer.Option(
+        None,
+        "--by",
+        help="Group key, repeatable: character_id, weapon, match_mode, "
+        "mmr_bracket; all by default",
+    ),
+    bracket_size: int = typer.Option(1000, help="Width of the MMR brackets"),
+    min_games: int = typer.Option(30, help="Minimum players per reported group"),
+    confidence: float = typer.Option(0.95, help="Confidence level of the intervals"),
+    sort: str = typer.Option("win_rate", help="Column to sort the groups by"),
+    limit: int = typer.Option(20, help="Number of groups to print"),
+    output: Optional[str] = typer.Option(None, help="CSV file to write every group to"),
+    cache_dir: str = typer.Option(
+        ARROW_CACHE_PATH, help="Directory of the Arrow IPC cache"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to cache"),
+) -> None:
+    """Compute win rate, placement, kills, damage and MMR gain per character group.
+
+    Args:
+        seasons (Optional[list[int]]): Seasons to include, all cached seasons when
+            omitted.
+        by (Optional[list[str]]): Group keys, all of GROUP_KEYS when omitted.
+        bracket_size (int): Width of the MMR brackets.
+        min_games (int): Minimum players per reported group.
+        confidence (float): Confidence level of the intervals.
+        sort (str): Column to sort the groups by.
+        limit (int): Number of groups to print.
+        output (Optional[str]): CSV file to write every group to.
+        cache_dir (str): Directory of the Arrow IPC cache, refreshed first.
+        archive_dir (str): Archive directory the cache is built from.
+
+    Returns:
+        None, prints the top groups and optionally writes all of them to CSV.
+
+    Raises:
+        typer.BadParameter: If a group key or the sort column is unknown.
+    """
+    from storage.arrow_cache import ArrowCache
+    from analytics.character_stats import GROUP_KEYS, columns_from_tables, group_stats
+
+    cache = ArrowCache(cache_dir, archive_dir)
+    cache.refresh()
+    tables = cache.load(seasons, ("games", "player_game_stats", "mastery_levels"))
+    try:
+        stats = group_stats(
+            columns_from_tables(tables),
+            by=by or GROUP_KEYS,
+            bracket_size=bracket_size,
+            min_games=min_games,
+            confidence=confidence,
+        )
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if sort not in stats.columns:
+        raise typer.BadParameter(f"Unknown sort column: {sort}")
+    stats = stats.sort(sort)
+
+    if output:
+        stats.to_csv(output)
+        typer.echo(f"Wrote {len(stats)} groups to {output}")
+    for record in itertools.islice(stats.records(), limit):
+        keys = ", ".join(f"{key}={record[key]}" for key in stats.keys)
+        typer.echo(
+            f"{keys}: {record['games']} games, "
+            f"win rate {record['win_rate']:.1%} "
+            f"[{record['win_rate_low']:.1%}, {record['win_rate_high']:.1%}], "
+            f"place {record['avg_place']:.2f}, kills {record['avg_kills']:.2f}, "
+            f"damage {record['avg_damage']:.0f}, "
+            f"MMR gain {record['avg_mmr_gain']:.1f} ± {record['avg_mmr_gain_ci']:.1f}"
+        )
+
+
+@app.command("rebuild-aggregates")
+def rebuild_aggregates_command(
+    source: str = typer.Option(
+        "db", help="Where to read players from: 'db' or 'archive'"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to read"),
+    path: str = typer.Option(AGGREGATES_PATH, help="Aggregate database to rebuild"),
+    db_workers: int = typer.Option(
+        1, help="Key ranges of each table read from the database concurrently"
+    ),
+) -> None:
+    """Recompute the materialized aggregates from scratch.
+
+    Args:
+        source (str): Where to read players from, the database or the archive.
+        archive_dir (str): Archive directory to read when the source is 'archive'.
+        path (str): Aggregate database to rebuild, replaced once complete.
+        db_workers (int): Key ranges of each table read concurrently from the
+            database.
+
+    Returns:
+        None, replaces the aggregate database.
+
+    Raises:
+        typer.BadParameter: If the source is unknown.
+    """
+    from storage.aggregates import AggregateStore, SOURCE_TABLES, rebuild_aggregates
+    from storage.parquet_export import iter_table_pages
+
+    if source == "db":
+        batches = (
+            {table: rows}
+            for table in SOURCE_TABLES
+            for rows in iter_table_pages(dao, table, workers=db_workers)
+        )
+    elif source == "archive":
+        from models.batch import UserGameBatch
+        from processors.table_mappings import build_table_rows
+
+        file_paths = list(iter_archive_files(archive_dir))
+        batches = (
+            build_table_rows(
+                UserGameBatch.from_json_files(
+                    file_paths[start : start + 500]
+                ).to_user_games(),
+                SOURCE_TABLES,
+            )
+            for start in range(0, len(file_paths), 500)
+        )
+    else:
+        raise typer.BadParameter(f"Unknown source: {source}")
+
+    rebuild_aggregates(path, batches)
+    store = AggregateStore(path)
+    for table in ("character_aggregates", "item_aggregates", "weather_aggregates"):
+        typer.echo(f"{table}: {len(store.rows(table))} rows")
+    store.close()
+
+
+def _echo_build(record: dict) -> None:
+    typer.echo(
+        f"{' '.join(map(str, record['items']))}: {record['games']} games, "
+        f"win rate {record['win_rate']:.1%}"
+    )
+
+
+@app.command()
+def update_build_index(
+    path: str = typer.Option(BUILD_INDEX_PATH, help="Build index file to update"),
+    seasons: Optional[list[int]] = typer.Option(
+        None, "--season", help="Season to index, repeatable; all cached by default"
+    ),
+    cache_dir: str = typer.Option(
+        ARROW_CACHE_PATH, help="Directory of the Arrow IPC cache"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to cache"),
+) -> None:
+    """Add the archived players not yet in the item build index.
+
+    Args:
+        path (str): Build index file to update, created if missing.
+        seasons (Optional[list[int]]): Seasons to index, all cached seasons when
+            omitted.
+        cache_dir (str): Directory of the Arrow IPC cache, refreshed first.
+        archive_dir (str): Archive directory the cache is built from.
+
+    Returns:
+        None, writes the updated index to path.
+    """
+    from storage.arrow_cache import ArrowCache
+    from analytics.build_index import BuildIndex
+
+    cache = ArrowCache(cache_dir, archive_dir)
+    cache.refresh()
+    index = BuildIndex.load_or_create(path)
+    added = index.add_tables(cache.load(seasons, ("player_game_stats", "equipment")))
+    index.save(path)
+    typer.echo(f"Indexed {added} new players, {len(index.players)} in total")
+
+
+@app.command()
+def top_builds(
+    character_id: int = typer.Option(..., "--character", help="Character ID"),
+    limit: int = typer.Option(10, help="Number of builds to print"),
+    min_games: int = typer.Option(30, help="Minimum players per build"),
+    sort: str = typer.Option("count", help="Rank by 'count' or 'win_rate'"),
+    path: str = typer.Option(BUILD_INDEX_PATH, help="Build index file to query"),
+) -> None:
+    """Print the most picked or most winning final builds of a character.
+
+    Args:
+        character_id (int): Character ID.
+        limit (int): Number of builds to print.
+        min_games (int): Minimum players per build.
+        sort (str): Rank by 'count' or 'win_rate'.
+        path (str): Build index file to query.
+
+    Returns:
+        None, prints one build per line as its item IDs by slot.
+
+    Raises:
+        typer.BadParameter: If the sort is unknown.
+    """
+    from analytics.build_index import BuildIndex
+
+    index = BuildIndex.load(path)
+    try:
+        builds = index.top_builds(character_id, limit, min_games, sort)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    for record in builds:
+        _echo_build(record)
+
+
+@app.command()
+def complete_build(
+    character_id: int = typer.Option(..., "--character", help="Character ID"),
+    items: list[str] = typer.Option(
+        ..., "--item", help="Chosen item as SLOT:ITEM_ID, repeatable"
+    ),
+    limit: int = typer.Option(5, help="Number of builds and items per slot to print"),
+    min_games: int = typer.Option(10, help="Minimum players per build or item"),
+    sort: str = typer.Option("count", help="Rank by 'count' or 'win_rate'"),
+    path: str = typer.Option(BUILD_INDEX_PATH, help="Build index file to query"),
+) -> None:
+    """Print how players of a character usually complete a partial build.
+
+    Args:
+        character_id (int): Character ID.
+        items (list[str]): Chosen items as SLOT:ITEM_ID.
+        limit (int): Number of builds and items per open slot to print.
+        min_games (int): Minimum players per build or item.
+        sort (str): Rank by 'count' or 'win_rate'.
+        path (str): Build index file to query.
+
+    Returns:
+        None, prints the matching builds and the best items per open slot.
+
+    Raises:
+        typer.BadParameter: If an item is not SLOT:ITEM_ID or the sort is unknown.
+    """
+    try:
+        partial = dict(tuple(map(int, item.split(":"))) for item in items)
+    except ValueError:
+        raise typer.BadParameter("Items must be given as SLOT:ITEM_ID")
+    from analytics.build_index import BuildIndex
+
+    index = BuildIndex.load(path)
+    try:
+        completion = index.complete_build(character_id, partial, limit, min_games, sort)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    for record in completion["builds"]:
+        _echo_build(record)
+    for slot, candidates in completion["slots"].items():
+        suggestions = ", ".join(
+            f"{record['item_id']} ({record['games']} games, "
+            f"{record['win_rate']:.1%})"
+            for record in candidates
+        )
+        typer.echo(f"Slot {slot}: {suggestions or '-'}")
+
+
+@app.command()
+def update_kill_graph(
+    path: str = typer.Option(KILL_GRAPH_PATH, help="Kill graph file to update"),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to read"),
+) -> None:
+    """Add the deaths and phase kills of new archive files to the kill graph.
+
+    Args:
+        path (str): Kill graph file to update, created if missing.
+        archive_dir (str): Archive directory to read.
+
+    Returns:
+        None, writes the updated graph to path.
+    """
+    from analytics.kill_graph import KillGraph
+
+    graph = KillGraph.load_or_create(path)
+    added = graph.add_archive(archive_dir)
+    graph.save(path)
+    typer.echo(f"Indexed {added} new players, {len(graph.players)} in total")
+
+
+@app.command()
+def kill_stats(
+    character_id: int = typer.Option(..., "--character", help="Character ID"),
+    limit: int = typer.Option(5, help="Number of killers and areas to print"),
+    path: str = typer.Option(KILL_GRAPH_PATH, help="Kill graph file to query"),
+) -> None:
+    """Print who kills a character, where it dies and when it scores kills.
+
+    Args:
+        character_id (int): Character ID.
+        limit (int): Number of killer characters, weapons and areas to print.
+        path (str): Kill graph file to query.
+
+    Returns:
+        None, prints the top killers, death areas and the kill phase shares.
+    """
+    from analytics.kill_graph import KillGraph
+
+    graph = KillGraph.load(path)
+    for by in ("character", "weapon"):
+        killers = ", ".join(
+            f"{record[by]} ({record['count']}, {record['share']:.1%})"
+            for record in graph.killers_of(character_id, limit, by)
+        )
+        typer.echo(f"Killed by {by}: {killers or '-'}")
+    areas = ", ".join(
+        f"{record['area']} ({record['count']}, {record['share']:.1%})"
+        for record in graph.area_heatmap(character_id, limit)
+    )
+    typer.echo(f"Death areas: {areas or '-'}")
+    phases = ", ".join(
+        f"{phase} {share:.1%}"
+        for phase, share in graph.phase_distribution(character_id).items()
+    )
+    typer.echo(f"Kills by phase: {phases}")
+
+
+@app.command()
+def update_team_synergy(
+    path: str = typer.Option(TEAM_SYNERGY_PATH, help="Team synergy index to update"),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to read"),
+) -> None:
+    """Add the complete teams of new archive files to the team synergy index.
+
+    Args:
+        path (str): Team synergy index to update, created if missing.
+        archive_dir (str): Archive directory to read.
+
+    Returns:
+        None, writes the updated index to path.
+    """
+    from analytics.team_synergy import TeamSynergyIndex
+
+    synergy = TeamSynergyIndex.load_or_create(path)
+    added = synergy.add_archive(archive_dir)
+    synergy.save(path)
+    typer.echo(f"Counted {added} new teams, {len(synergy.teams)} in total")
+
+
+@app.command()
+def top_teams(
+    kind: str = typer.Option("composition", help="'composition' or 'pair'"),
+    character_id: Optional[int] = typer.Option(
+        None, "--character", help="Only teams including this character"
+    ),
+    limit: int = typer.Option(10, help="Number of teams to print"),
+    min_games: int = typer.Option(30, help="Minimum team games"),
+    confidence: float = typer.Option(0.95, help="Confidence level of the ranking"),
+    path: str = typer.Option(TEAM_SYNERGY_PATH, help="Team synergy index to query"),
+) -> None:
+    """Print the best team compositions or character pairs by adjusted win rate.
+
+    Args:
+        kind (str): Rank 'composition' (duos and trios) or 'pair'.
+        character_id (Optional[int]): Only teams including this character.
+        limit (int): Number of teams to print.
+        min_games (int): Minimum team games.
+        confidence (float): Confidence level of the lower win rate bound ranked by.
+        path (str): Team synergy index to query.
+
+    Returns:
+        None, prints one team per line.
+
+    Raises:
+        typer.BadParameter: If the kind is unknown.
+    """
+    from analytics.team_synergy import TeamSynergyIndex
+
+    synergy = TeamSynergyIndex.load(path)
+    try:
+        teams = synergy.top(kind, limit, min_games, character_id, confidence)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    for record in teams:
+        mmr_gain = (
+            "-" if record["avg_mmr_gain"] is None else f"{record['avg_mmr_gain']:.1f}"
+        )
+        typer.echo(
+            f"{' + '.join(map(str, record['characters']))}: {record['games']} games, "
+            f"win rate {record['win_rate']:.1%} (low {record['win_rate_low']:.1%}), "
+            f"place {record['avg_place']:.2f}, MMR gain {mmr_gain}"
+        )
+
+
+@app.command()
+def mmr_history(
+    username: Optional[str] = typer.Option(None, help="Username to look up"),
+    user_id: Optional[int] = typer.Option(None, help="User ID to look up"),
+    start: Optional[datetime] = typer.Option(None, help="First game start to show"),
+    end: Optional[datetime] = typer.Option(None, help="Game start to stop before"),
+    interval_days: Optional[float] = typer.Option(
+        None, help="Downsample to the last MMR of every interval of this many days"
+    ),
+    path: str = typer.Option(MMR_SERIES_PATH, help="MMR time series directory"),
+) -> None:
+    """Print the MMR history of a user from the local time series.
+
+    Args:
+        username (Optional[str]): Username to look up, resolved to a user ID.
+        user_id (Optional[int]): User ID to look up.
+        start (Optional[datetime]): First game start time to show, UTC if naive.
+        end (Optional[datetime]): Game start time to stop before, UTC if naive.
+        interval_days (Optional[float]): Downsample to one point per interval.
+        path (str): MMR time series directory.
+
+    Returns:
+        None, prints one line per game or interval.
+
+    Raises:
+        typer.BadParameter: If neither a username nor a user ID is given.
+    """
+    if user_id is None:
+        if username is None:
+            raise typer.BadParameter("Provide --username or --user-id")
+        user_id = get_user_id(username)
+        if user_id is None:
+            return
+    from storage.mmr_series import MMRSeriesStore
+
+    store = MMRSeriesStore(path)
+    if interval_days:
+        points = store.downsample(user_id, timedelta(days=interval_days), start, end)
+        for moment, mmr, games in zip(points["time"], points["mmr"], points["games"]):
+            typer.echo(f"{moment}: {mmr} ({games} games)")
+    else:
+        points = store.history(user_id, start, end)
+        for moment, game_id, mmr in zip(
+            points["time"], points["game_id"], points["mmr"]
+        ):
+            typer.echo(f"{moment}: {mmr} (game {game_id})")
+
+
+@app.command()
+def mmr_percentiles(
+    dates: list[datetime] = typer.Option(
+        ..., "--date", help="Date to take a snapshot at, repeatable"
+    ),
+    percentiles: Optional[list[float]] = typer.Option(
+        None, "--percentile", help="Percentile to report, repeatable"
+    ),
+    active_days: Optional[float] = typer.Option(
+        None, help="Only count users who played within this many days"
+    ),
+    path: str = typer.Option(MMR_SERIES_PATH, help="MMR time series directory"),
+) -> None:
+    """Print MMR percentiles over all users as of each date.
+
+    Args:
+        dates (list[datetime]): Dates to take snapshots at, UTC if naive.
+        percentiles (Optional[list[float]]): Percentiles to report, 10, 25, 50, 75
+            and 90 by default.
+        active_days (Optional[float]): Only count users whose last game before the
+            date is at most this many days old.
+        path (str): MMR time series directory.
+
+    Returns:
+        None, prints one line per date.
+    """
+    from storage.mmr_series import MMRSeriesStore
+
+    snapshots = MMRSeriesStore(path).snapshots(
+        dates,
+        percentiles or (10, 25, 50, 75, 90),
+        timedelta(days=active_days) if active_days else None,
+    )
+    for moment, snapshot in zip(dates, snapshots):
+        values = ", ".join(
+            f"{key} {value:.0f}" for key, value in snapshot.items() if key != "users"
+        )
+        typer.echo(f"{moment:%Y-%m-%d}: {snapshot['users']} users, {values}")
+
+
+@app.command("rebuild-mmr-series")
+def rebuild_mmr_series_command(
+    source: str = typer.Option(
+        "db", help="Where to read players from: 'db' or 'archive'"
+    ),
+    archive_dir: str = typer.Option(ARCHIVE_PATH, help="Archive directory to read"),
+    path: str = typer.Option(MMR_SERIES_PATH, help="MMR time series directory"),
+    db_workers: int = typer.Option(
+        1, help="Key ranges of each table read from the database concurrently"
+    ),
+) -> None:
+    """Add every ranked player of the database or archive to the MMR time series.
+
+    Points already in the series are kept once, so the rebuild can run on top of
+    an existing series.
+
+    Args:
+        source (str): Where to read players from, the database or the archive.
+        archive_dir (str): Archive directory to read when the source is 'archive'.
+        path (str): MMR time series directory.
+        db_workers (int): Key ranges of each table read concurrently from the
+            database.
+
+    Returns:
+        None, compacts the updated series.
+
+    Raises:
+        typer.BadParameter: If the source is unknown.
+    """
+    from storage.mmr_series import MMRSeriesStore
+    from storage.parquet_export import iter_table_pages
+
+    store = MMRSeriesStore(path)
+    if source == "db":
+        for rows in iter_table_pages(dao, "player_game_stats", workers=db_workers):
+            store.append_rows(rows)
+    elif source == "archive":
+        from models.batch import UserGameBatch
+
+        file_paths = list(iter_archive_files(archive_dir))
+        for start in range(0, len(file_paths), 500):
+            store.append_games(
+                UserGameBatch.from_json_files(
+                    file_paths[start : start + 500]
+                ).to_user_games()
+            )
+    else:
+        raise typer.BadParameter(f"Unknown source: {source}")
+    store.compact()
+    typer.echo(f"{len(store.users)} users in the MMR time series")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,126 @@
+import time
 import requests
 import CONSTS
-from models.game import UserGame, KillData, KillDataList
+import metrics
+import profiling
+from models.game import UserGame, KillDataList
+from models.projection import ProjectedUserGame, projection_model
 from models.user import User
 from datetime import datetime
-from typing import Optional
+from typing import Any, Iterable, Optional
+
+
+def _normalize_player_data(player_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Normalize a raw API player payload in place so it validates as a UserGame.
+
+    Collects the flattened killer fields into `killerList`, converts the start
+    datetime and fills in missing equipment maps.
+
+    :param player_data: dict of a single player's game data, keyed by API alias
+    :return: the same dict, normalized
+    """
+    player_data["killerList"] = KillDataList.from_flattened(player_data)
+
+    # Convert game_start_datetime to datetime object
+    player_data["startDtm"] = datetime.fromisoformat(
+        player_data["startDtm"].replace("+0900", "+09:00")
+    )
+
+    # Ensure equipment data is present
+    if "equipment" not in player_data:
+        player_data["equipment"] = {}
+    if "equipFirstItemForLog" not in player_data:
+        player_data["equipFirstItemForLog"] = {}
+
+    return player_data
+
+
+def _parse_player_data(
+    player_data: dict[str, Any], tables: Optional[Iterable[str]] = None
+) -> UserGame | ProjectedUserGame:
+    """
+    Normalize and validate a raw API player payload.
+
+    :param player_data: dict of a single player's game data, keyed by API alias
+    :param tables: destination tables to validate fields for, or None to validate
+        the full UserGame
+    :return: UserGame, or a ProjectedUserGame when tables are given
+    """
+    player_data = _normalize_player_data(player_data)
+    if tables is None:
+        return UserGame(**player_data)
+    return projection_model(tables).from_raw(player_data)
+
+
+def _get(endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    GET an ER API URL, recording the request count and latency by status.
+
+    :param endpoint: name of the endpoint, labelling the metrics
+    :param url: full URL to request
+    :param kwargs: passed on to requests.get
+    :return: the response; request errors are raised after being recorded
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with profiling.span("fetch"):
+            response = requests.get(url, headers=CONSTS.HEADERS, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.inc("api_requests_total", endpoint, status)
+        metrics.observe(
+            "api_request_seconds", time.perf_counter() - start, endpoint, status
+        )
+
+
+def _parse_players(
+    players: list[dict[str, Any]], tables: Optional[Iterable[str]] = None
+) -> list[UserGame | ProjectedUserGame]:
+    """
+    Parse the players of a response, recording the validation time per record.
+
+    :param players: raw API player payloads
+    :param tables: destination tables to validate fields for, or None to validate
+        the full UserGame
+    :return: the parsed players, in order
+    """
+    start = time.perf_counter()
+    with profiling.span("validate"):
+        user_games = [
+            _parse_player_data(player_data, tables) for player_data in players
+        ]
+    if user_games:
+        model = "UserGame" if tables is None else "ProjectedUserGame"
+        metrics.inc("validation_records_total", model, amount=len(user_games))
+        metrics.observe(
+            "validation_seconds_per_record",
+            (time.perf_counter() - start) / len(user_games),
+            model,
+            count=len(user_games),
+        )
+    return user_games
 
 
 def _fetch_by_user_id(
-    user_id: int, next_id: Optional[int] = None
+    user_id: int,
+    next_id: Optional[int] = None,
+    tables: Optional[Iterable[str]] = None,
+    raise_errors: bool = False,
 ) -> tuple[list[UserGame], Optional[int]]:
+    """
+    Fetch one page of a user's games, newest first.
+
+    :param user_id: int
+    :param next_id: the `next` cursor of the page to fetch, None for the newest
+    :param tables: destination tables to validate fields for, or None to validate
+        the full UserGame
+    :param raise_errors: re-raise request and parsing errors instead of returning
+        an empty page
+    :return: the page's games and the cursor of the next page, if any
+    """
     try:
         endpoint = CONSTS.endpoints.user.value["fetch_user_games"].format(
             user_id=user_id
@@ -17,130 +129,75 @@ def _fetch_by_user_id(
         if next_id:
             url += f"?next={next_id}"
 
-        response = requests.get(url, headers=CONSTS.HEADERS)
+        response = _get("fetch_user_games", url)
         response.raise_for_status()
         game_data = response.json()
 
-        user_games: list[UserGame] = []
-
-        for game in game_data["userGames"]:
-            # Create KillData objects
-            kill_data_list = []
-            for i in range(1, 4):  # Up to 3 sets of kill data
-                killer_prefix = "" if i == 1 else f"{i}"
-                if f"killer{killer_prefix}" in game:
-                    kill_data = KillData(
-                        killerUserNum=game.get(f"killerUserNum{killer_prefix}", 0),
-                        killer=game.get(f"killer{killer_prefix}", ""),
-                        killDetail=game.get(f"killDetail{killer_prefix}", ""),
-                        placeOfDeath=game.get(f"placeOfDeath{killer_prefix}", ""),
-                        killerCharacter=game.get(f"killerCharacter{killer_prefix}", ""),
-                        killerWeapon=game.get(f"killerWeapon{killer_prefix}", ""),
-                    )
-                    kill_data_list.append(kill_data)
-                    # Convert game_start_datetime to datetime object
-            game["startDtm"] = datetime.fromisoformat(
-                game["startDtm"].replace("+0900", "+09:00")
-            )
-
-            # Ensure equipment data is present
-            if "equipment" not in game:
-                game["equipment"] = {}
-            if "equipFirstItemForLog" not in game:
-                game["equipFirstItemForLog"] = {}
-
-            # Create UserGame object
-            user_game = UserGame(
-                **game,
-                killerList=KillDataList(root=kill_data_list),
-                # equipment=player_data["equipment"],
-                # equipFirstItemForLog=player_data["equipFirstItemForLog"]
-            )
-            user_games.append(user_game)
+        user_games = _parse_players(game_data["userGames"], tables)
 
-            return user_games, game_data.get("next", None)
+        return user_games, game_data.get("next", None)
     except requests.RequestException as e:
         print(f"Error fetching game data for user ID {user_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list(), None
     except KeyError as e:
         print(f"Unexpected response format for user ID {user_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list(), None
     except Exception as e:
         print(f"Unexpected error processing user ID {user_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list(), None
 
 
-def _fetch_by_game_id(game_id: int) -> list[UserGame]:
+def _fetch_by_game_id(
+    game_id: int,
+    tables: Optional[Iterable[str]] = None,
+    raise_errors: bool = False,
+) -> list[UserGame]:
     """
     Internal function to fetch game data by game id and convert to UserGame objects.
 
     :param game_id: int
+    :param tables: destination tables to validate fields for, or None to validate
+        the full UserGame
+    :param raise_errors: re-raise request and parsing errors instead of returning
+        an empty list; a game that does not exist (404) is still an empty list
     :return: List[UserGame]
     """
     try:
         endpoint = CONSTS.endpoints.game.value["fetch_by_id"].format(game_id=game_id)
-        response = requests.get(
-            f"{CONSTS.BASE_URL}{CONSTS.version.v1.value}/{endpoint}",
-            headers=CONSTS.HEADERS,
+        response = _get(
+            "fetch_by_id", f"{CONSTS.BASE_URL}{CONSTS.version.v1.value}/{endpoint}"
         )
+        if response.status_code == 404:
+            return list()
         if response.status_code != 200:
-            raise Exception(f"Failed to fetch game data by game id: {game_id}")
-
-        game_data = response.json()
-        user_games = []
-        for player_data in game_data["userGames"]:
-            # Create KillData objects
-            kill_data_list = []
-            for i in range(1, 4):  # Up to 3 sets of kill data
-                killer_prefix = "" if i == 1 else f"{i}"
-                if f"killer{killer_prefix}" in player_data:
-                    kill_data = KillData(
-                        killerUserNum=player_data.get(
-                            f"killerUserNum{killer_prefix}", 0
-                        ),
-                        killer=player_data.get(f"killer{killer_prefix}", ""),
-                        killDetail=player_data.get(f"killDetail{killer_prefix}", ""),
-                        placeOfDeath=player_data.get(
-                            f"placeOfDeath{killer_prefix}", ""
-                        ),
-                        killerCharacter=player_data.get(
-                            f"killerCharacter{killer_prefix}", ""
-                        ),
-                        killerWeapon=player_data.get(
-                            f"killerWeapon{killer_prefix}", ""
-                        ),
-                    )
-                    kill_data_list.append(kill_data)
-
-            # Convert game_start_datetime to datetime object
-            player_data["startDtm"] = datetime.fromisoformat(
-                player_data["startDtm"].replace("+0900", "+09:00")
-            )
-
-            # Ensure equipment data is present
-            if "equipment" not in player_data:
-                player_data["equipment"] = {}
-            if "equipFirstItemForLog" not in player_data:
-                player_data["equipFirstItemForLog"] = {}
-
-            # Create UserGame object
-            user_game = UserGame(
-                **player_data,
-                killerList=KillDataList(root=kill_data_list),
-                # equipment=player_data["equipment"],
-                # equipFirstItemForLog=player_data["equipFirstItemForLog"]
+            raise requests.HTTPError(
+                f"Failed to fetch game data by game id: {game_id} "
+                f"(status {response.status_code})",
+                response=response,
             )
-            user_games.append(user_game)
 
-        return user_games
+        game_data = response.json()
+        return _parse_players(game_data["userGames"], tables)
     except requests.RequestException as e:
         print(f"Error fetching game data for game ID {game_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list()
     except KeyError as e:
         print(f"Unexpected response format for game ID {game_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list()
     except Exception as e:
         print(f"Unexpected error processing game ID {game_id}: {str(e)}")
+        if raise_errors:
+            raise
         return list()
 
 
@@ -166,9 +223,9 @@ def _fetch_user_id_by_username(username: str) -> User:
     """
     try:
         endpoint = CONSTS.endpoints.user.value["fetch_by_username"]
-        response = requests.get(
+        response = _get(
+            "fetch_by_username",
             f"{CONSTS.BASE_URL}{CONSTS.version.v1.value}/{endpoint}",
-            headers=CONSTS.HEADERS,
             params={"query": username},
         )
         if response.status_code != 200:
@@ -0,0 +1,374 @@
+"""
+Per-stage pipeline metrics with a local Prometheus-style exporter.
+
+The fetch, validation, insertion and database layers record counters and
+latency histograms here: ER API requests by endpoint and status, validation
+time per record, and rows, bytes and latency of every table write. Recording
+is disabled by default and every call returns at once until `enable` is
+called, so the instrumented code paths cost a flag check in normal runs.
+
+Once enabled, the metrics can be scraped from a local HTTP endpoint (`serve`,
+Prometheus text at `/metrics`, JSON at `/metrics.json`) and written as a JSON
+summary every few seconds for batch runs (`SummaryWriter`). The CLI turns both
+on with `--metrics-port` and `--metrics-summary`.
+"""
+
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Optional
+from storage.atomic import atomic_write
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)  # fmt: skip
+# Upper bounds of the per-record validation time buckets, in seconds.
+RECORD_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01,
+)  # fmt: skip
+
+# Every metric: its kind, help text, labels and, for histograms, buckets.
+METRICS = {
+    "api_requests_total": (
+        "counter",
+        "ER API requests by endpoint and HTTP status.",
+        ("endpoint", "status"),
+    ),
+    "api_request_seconds": (
+        "histogram",
+        "ER API request latency by endpoint and HTTP status.",
+        ("endpoint", "status"),
+        LATENCY_BUCKETS,
+    ),
+    "validation_records_total": (
+        "counter",
+        "Player records validated, by model.",
+        ("model",),
+    ),
+    "validation_seconds_per_record": (
+        "histogram",
+        "Validation time per player record, by model.",
+        ("model",),
+        RECORD_BUCKETS,
+    ),
+    "games_processed_total": (
+        "counter",
+        "Games fetched by process_game, by outcome.",
+        ("outcome",),
+    ),
+    "player_insert_seconds": (
+        "histogram",
+        "Time to write every table of a player.",
+        (),
+        LATENCY_BUCKETS,
+    ),
+    "player_insert_failures_total": (
+        "counter",
+        "Table writes that failed or were skipped, by table.",
+        ("table",),
+    ),
+    "db_requests_total": (
+        "counter",
+        "Supabase requests by table, operation and outcome.",
+        ("table", "operation", "outcome"),
+    ),
+    "db_request_seconds": (
+        "histogram",
+        "Supabase request latency by table and operation.",
+        ("table", "operation"),
+        LATENCY_BUCKETS,
+    ),
+    "db_rows_written_total": (
+        "counter",
+        "Rows sent in Supabase upserts and updates, by table.",
+        ("table",),
+    ),
+    "db_bytes_written_total": (
+        "counter",
+        "JSON bytes of the rows sent in Supabase upserts and updates, by table.",
+        ("table",),
+    ),
+}
+PREFIX = "matches_"
+
+
+@dataclass
+class Histogram:
+    """Observations of one label set, counted per bucket.
+
+    Attributes:
+        buckets (tuple[float, ...]): Upper bounds of the buckets, ascending.
+        counts (list[int]): Observations per bucket, the last for +Inf.
+        count (int): Number of observations.
+        sum (float): Sum of the observations.
+    """
+
+    buckets: tuple[float, ...]
+    counts: list[int] = field(default_factory=list)
+    count: int = 0
+    sum: float = 0.0
+
+    def __post_init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float, count: int = 1) -> None:
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.count += count
+        self.sum += value * count
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (
+                    (rank - seen) / bucket_count
+                )
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class Registry:
+    """Thread-safe store of every metric in METRICS, keyed by label values."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters: dict[str, dict[tuple[str, ...], float]] = {}
+        self.histograms: dict[str, dict[tuple[str, ...], Histogram]] = {}
+        for name, (kind, *_) in METRICS.items():
+            if kind == "counter":
+                self.counters[name] = {}
+            else:
+                self.histograms[name] = {}
+
+    def inc(self, name: str, labels: tuple[str, ...], amount: float = 1) -> None:
+        with self._lock:
+            series = self.counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(
+        self, name: str, labels: tuple[str, ...], value: float, count: int = 1
+    ) -> None:
+        with self._lock:
+            series = self.histograms[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(METRICS[name][3])
+            histogram.observe(value, count)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names, *_) in METRICS.items():
+                metric = PREFIX + name
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self.counters[name].items()):
+                        lines.append(f"{metric}{_labels(label_names, labels)} {value}")
+                    continue
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bucket, bucket_count in zip(
+                        (*histogram.buckets, math.inf), histogram.counts
+                    ):
+                        cumulative += bucket_count
+                        le = "+Inf" if bucket == math.inf else f"{bucket:g}"
+                        bucket_labels = _labels((*label_names, "le"), (*labels, le))
+                        lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+                    series = _labels(label_names, labels)
+                    lines.append(f"{metric}_sum{series} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{series} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict[str, Any]:
+        """The metrics as JSON: counters, and the count, sum, mean and p50/p99
+        of every histogram, per label set."""
+        with self._lock:
+            counters = {
+                name: [
+                    {**dict(zip(METRICS[name][2], labels)), "value": value}
+                    for labels, value in sorted(series.items())
+                ]
+                for name, series in self.counters.items()
+                if series
+            }
+            histograms = {
+                name: [
+                    {
+                        **dict(zip(METRICS[name][2], labels)),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "mean": histogram.sum / histogram.count,
+                        "p50": histogram.quantile(0.5),
+                        "p99": histogram.quantile(0.99),
+                    }
+                    for labels, histogram in sorted(series.items())
+                ]
+                for name, series in self.histograms.items()
+                if series
+            }
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "uptime_seconds": time.time() - self.started,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+registry = Registry()
+enabled = False
+
+
+def enable() -> None:
+    """Start recording metrics."""
+    global enabled
+    enabled = True
+
+
+def disable() -> None:
+    """Stop recording metrics; recorded values are kept."""
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+    """Drop every recorded value."""
+    global registry
+    registry = Registry()
+
+
+def inc(name: str, *labels: Any, amount: float = 1) -> None:
+    """Add to a counter of METRICS, labels given in its label order."""
+    if enabled:
+        registry.inc(name, tuple(map(str, labels)), amount)
+
+
+def observe(name: str, value: float, *labels: Any, count: int = 1) -> None:
+    """Record `count` observations of `value` in a histogram of METRICS.
+
+    Observing a batch's mean once with its size as `count` keeps per-record
+    histograms cheap.
+    """
+    if enabled:
+        registry.observe(name, tuple(map(str, labels)), value, count)
+
+
+def payload_bytes(payload: Any) -> int:
+    """Size of a payload as JSON, as sent to PostgREST; 0 when disabled."""
+    if not enabled:
+        return 0
+    return len(json.dumps(payload, default=str, separators=(",", ":")))
+
+
+def serve(port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """Enable metrics and serve them from a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port.
+        host (str): Interface to listen on, local only by default.
+
+    Returns:
+        ThreadingHTTPServer: The server; `shutdown` stops it.
+    """
+    # Imported here, as http.server is a noticeable share of CLI startup.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] == "/metrics":
+                data = registry.render().encode()
+                content_type = "text/plain; version=0.0.4"
+            elif self.path.split("?")[0] == "/metrics.json":
+                data = json.dumps(registry.summary()).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    enable()
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
+
+
+class SummaryWriter:
+    """Enable metrics and write their JSON summary every `interval` seconds.
+
+    The file is replaced atomically, and written a last time on `stop`.
+
+    Args:
+        path (str): The summary file.
+        interval (float): Seconds between writes.
+    """
+
+    def __init__(self, path: str, interval: float = 30.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SummaryWriter":
+        enable()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-summary", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        summary = registry.summary()
+        atomic_write(self.path, lambda f: json.dump(summary, f, indent=2), "w")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
@@ -0,0 +1,498 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Iterator, Optional, Union
+import numpy as np
+from models.game import KillData, KillDataList, UserGame
+from archive import iter_archive_files, load_archive_file
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ID_FIELDS = {"user_id", "game_id"}
+
+# Storage kind of every UserGame field, derived from its annotation.
+_SCALAR_DTYPES: dict[str, Any] = {
+    "id": np.int64,
+    "int": np.int32,
+    "bool": np.bool_,
+    "optional_int": np.float64,  # None is stored as NaN
+    "str": object,
+}
+
+
+def _field_kind(name: str, annotation: Any) -> str:
+    if annotation is int:
+        return "id" if name in _ID_FIELDS else "int"
+    if annotation is bool:
+        return "bool"
+    if annotation is str:
+        return "str"
+    if annotation is datetime:
+        return "datetime"
+    if annotation == Optional[int]:
+        return "optional_int"
+    if annotation == dict[str, int]:
+        return "map"
+    if annotation == dict[str, list[int]]:
+        return "map_of_lists"
+    if annotation == list[int]:
+        return "list"
+    if annotation is KillDataList:
+        return "kills"
+    raise TypeError(f"No columnar storage for field {name}: {annotation}")
+
+
+FIELD_KINDS: dict[str, str] = {
+    name: _field_kind(name, field.annotation)
+    for name, field in UserGame.model_fields.items()
+}
+_ALIASES = {name: field.alias for name, field in UserGame.model_fields.items()}
+_KILL_ALIASES = {name: field.alias for name, field in KillData.model_fields.items()}
+
+
+@dataclass(frozen=True)
+class RaggedColumn:
+    """Variable-length values per player, flattened into offset-indexed arrays.
+
+    The values of player `i` are `values[name][offsets[i]:offsets[i + 1]]`.
+
+    Attributes:
+        offsets (np.ndarray): int64 offsets, one more than the number of players.
+        values (dict[str, np.ndarray]): Flattened value arrays sharing the offsets.
+    """
+
+    offsets: np.ndarray
+    values: dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Number of values per player."""
+        return np.diff(self.offsets)
+
+    @property
+    def parent_index(self) -> np.ndarray:
+        """Player index of every flattened value, for joining back to scalars."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + sum(array.nbytes for array in self.values.values())
+
+    def row(self, index: int) -> dict[str, np.ndarray]:
+        """The values of a single player."""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return {name: array[start:end] for name, array in self.values.items()}
+
+    def take(self, indices: Union[slice, np.ndarray]) -> "RaggedColumn":
+        """Select players by contiguous slice or index array.
+
+        Contiguous slices return views; index arrays gather copies.
+        """
+        if isinstance(indices, slice) and indices.step in (None, 1):
+            start, stop, _ = indices.indices(len(self))
+            stop = max(start, stop)
+            offsets = self.offsets[start : stop + 1]
+            first, last = offsets[0], offsets[-1]
+            return RaggedColumn(
+                offsets=offsets - first,
+                values={name: array[first:last] for name, array in self.values.items()},
+            )
+
+        indices = (
+            np.arange(len(self))[indices] if isinstance(indices, slice) else indices
+        )
+        starts = self.offsets[:-1][indices]
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(
+            offsets[-1], dtype=np.int64
+        )
+        return RaggedColumn(
+            offsets=offsets,
+            values={name: array[positions] for name, array in self.values.items()},
+        )
+
+    @classmethod
+    def concat(cls, columns: list["RaggedColumn"]) -> "RaggedColumn":
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for column in columns:
+            offsets.append(column.offsets[1:] + base)
+            base += column.offsets[-1]
+        return cls(
+            offsets=np.concatenate(offsets),
+            values={
+                name: np.concatenate([column.values[name] for column in columns])
+                for name in columns[0].values
+            },
+        )
+
+
+class _RaggedBuilder:
+    def __init__(self, names: dict[str, Any]):
+        self._dtypes = names
+        self._lengths: list[int] = []
+        self._values: dict[str, list[Any]] = {name: [] for name in names}
+
+    def append(self, rows: list[tuple]) -> None:
+        self._lengths.append(len(rows))
+        for position, name in enumerate(self._values):
+            self._values[name].extend(row[position] for row in rows)
+
+    def build(self) -> RaggedColumn:
+        offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=offsets[1:])
+        return RaggedColumn(
+            offsets=offsets,
+            values={
+                name: np.array(values, dtype=self._dtypes[name])
+                for name, values in self._values.items()
+            },
+        )
+
+
+def _ragged_builder(kind: str) -> _RaggedBuilder:
+    if kind in ("map", "map_of_lists"):
+        return _RaggedBuilder({"key": np.int32, "value": np.int64})
+    if kind == "list":
+        return _RaggedBuilder({"value": np.int64})
+    return _RaggedBuilder(
+        {name: np.int64 if name == "killed_by_id" else object for name in _KILL_ALIASES}
+    )
+
+
+def _lookup(record: dict[str, Any], name: str, alias: Optional[str]) -> Any:
+    if name in record:
+        return record[name]
+    if alias in record:
+        return record[alias]
+    raise KeyError(f"Player record has no value for {name} ({alias})")
+
+
+def _parse_datetime(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("+0900", "+09:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _kill_rows(record: dict[str, Any]) -> list[tuple]:
+    if "killed_by_data" in record or "killerList" in record:
+        kills = _lookup(record, "killed_by_data", "killerList")
+    else:
+        kills = KillDataList.from_flattened(record)
+    if isinstance(kills, KillDataList):
+        kills = kills.root
+
+    rows = []
+    for kill in kills:
+        if isinstance(kill, KillData):
+            rows.append(tuple(getattr(kill, name) for name in _KILL_ALIASES))
+        else:
+            rows.append(
+                tuple(
+                    _lookup(kill, name, alias) for name, alias in _KILL_ALIASES.items()
+                )
+            )
+    return rows
+
+
+def _ragged_rows(kind: str, value: Any) -> list[tuple]:
+    if kind == "map":
+        return [(int(key), item) for key, item in value.items()]
+    if kind == "map_of_lists":
+        return [(int(key), item) for key, items in value.items() for item in items]
+    return [(item,) for item in value]
+
+
+class UserGameBatch:
+    """Columnar (struct-of-arrays) container for many players' game data.
+
+    Scalar UserGame fields are stored as one NumPy array each: ids as int64, other
+    integers as int32, optional integers as float64 with NaN for None, and strings
+    as object arrays. `game_start_datetime` is stored as UTC `datetime64[ms]` plus
+    the original UTC offset in seconds. The variable-length maps and lists
+    (`final_mastery_levels`, `final_equipment`, `equipment_first_item`,
+    `skill_order`, the purchase lists and `killed_by_data`) are RaggedColumns.
+
+    Index a batch by field name to get its column, or by slice, index array or
+    boolean mask to select players.
+
+    Example:
+        batch = UserGameBatch.from_archive(ARCHIVE_PATH)
+        ranked = batch[batch["match_mode"] == 3]
+        table_rows = build_table_rows(ranked.to_user_games())
+    """
+
+    def __init__(
+        self,
+        columns: dict[str, np.ndarray],
+        ragged: dict[str, RaggedColumn],
+        utc_offsets: Optional[np.ndarray] = None,
+    ):
+        self.columns = columns
+        self.ragged = ragged
+        self.utc_offsets = utc_offsets
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        """The UserGame fields held by the batch."""
+        return tuple(
+            name for name in FIELD_KINDS if name in self.columns or name in self.ragged
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the arrays, excluding string objects."""
+        total = sum(array.nbytes for array in self.columns.values())
+        total += sum(column.nbytes for column in self.ragged.values())
+        if self.utc_offsets is not None:
+            total += self.utc_offsets.nbytes
+        return total
+
+    def __len__(self) -> int:
+        for array in self.columns.values():
+            return len(array)
+        for column in self.ragged.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, key: Union[str, slice, np.ndarray, list[int]]) -> Any:
+        if isinstance(key, str):
+            if key in self.columns:
+                return self.columns[key]
+            return self.ragged[key]
+        return self.take(key)
+
+    def take(self, indices: Union[slice, np.ndarray, list[int]]) -> "UserGameBatch":
+        """Select players by slice, index array or boolean mask.
+
+        Args:
+            indices (Union[slice, np.ndarray, list[int]]): The players to keep.
+
+        Returns:
+            UserGameBatch: A batch of the selected players. Contiguous slices share
+            memory with this batch.
+        """
+        if not isinstance(indices, slice):
+            indices = np.asarray(indices)
+            if indices.dtype == np.bool_:
+                indices = np.flatnonzero(indices)
+        return UserGameBatch(
+            columns={name: array[indices] for name, array in self.columns.items()},
+            ragged={name: column.take(indices) for name, column in self.ragged.items()},
+            utc_offsets=None if self.utc_offsets is None else self.utc_offsets[indices],
+        )
+
+    def filter(self, mask: np.ndarray) -> "UserGameBatch":
+        """Keep the players where `mask` is True."""
+        return self.take(np.asarray(mask, dtype=np.bool_))
+
+    @classmethod
+    def concat(cls, batches: list["UserGameBatch"]) -> "UserGameBatch":
+        """Concatenate batches holding the same fields."""
+        if not batches:
+            return cls({}, {})
+        first = batches[0]
+        return cls(
+            columns={
+                name: np.concatenate([batch.columns[name] for batch in batches])
+                for name in first.columns
+            },
+            ragged={
+                name: RaggedColumn.concat([batch.ragged[name] for batch in batches])
+                for name in first.ragged
+            },
+            utc_offsets=(
+                None
+                if first.utc_offsets is None
+                else np.concatenate([batch.utc_offsets for batch in batches])
+            ),
+        )
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[dict[str, Any]],
+        fields: Optional[Iterable[str]] = None,
+    ) -> "UserGameBatch":
+        """Build a batch straight from player records, without pydantic objects.
+
+        Records may be raw API payloads (keyed by alias, with flattened killer
+        fields) or archived UserGame dumps (keyed by field name).
+
+        Args:
+            records (Iterable[dict[str, Any]]): The player records.
+            fields (Optional[Iterable[str]]): UserGame fields to load, all fields
+                when omitted.
+
+        Returns:
+            UserGameBatch: The columnar batch.
+
+        Raises:
+            KeyError: If a record is missing a requested field.
+        """
+        names = list(FIELD_KINDS) if fields is None else list(fields)
+        scalars: dict[str, list[Any]] = {
+            name: [] for name in names if FIELD_KINDS[name] in _SCALAR_DTYPES
+        }
+        ragged = {
+            name: _ragged_builder(FIELD_KINDS[name])
+            for name in names
+            if FIELD_KINDS[name] not in _SCALAR_DTYPES
+            and FIELD_KINDS[name] != "datetime"
+        }
+        start_times: Optional[list[int]] = (
+            [] if "game_start_datetime" in names else None
+        )
+        utc_offsets: list[int] = []
+
+        for record in records:
+            for name, values in scalars.items():
+                value = _lookup(record, name, _ALIASES[name])
+                if value is None and FIELD_KINDS[name] == "optional_int":
+                    value = np.nan
+                values.append(value)
+            for name, builder in ragged.items():
+                kind = FIELD_KINDS[name]
+                if kind == "kills":
+                    builder.append(_kill_rows(record))
+                else:
+                    value = record.get(name, record.get(_ALIASES[name])) or {}
+                    builder.append(_ragged_rows(kind, value))
+            if start_times is not None:
+                start = _parse_datetime(
+                    _lookup(
+                        record, "game_start_datetime", _ALIASES["game_start_datetime"]
+                    )
+                )
+                start_times.append((start - _EPOCH) // timedelta(milliseconds=1))
+                utc_offsets.append(int(start.utcoffset().total_seconds()))
+
+        columns = {
+            name: np.array(values, dtype=_SCALAR_DTYPES[FIELD_KINDS[name]])
+            for name, values in scalars.items()
+        }
+        offsets = None
+        if start_times is not None:
+            columns["game_start_datetime"] = np.array(
+                start_times, dtype="datetime64[ms]"
+            )
+            offsets = np.array(utc_offsets, dtype=np.int32)
+
+        return cls(
+            columns={name: columns[name] for name in names if name in columns},
+            ragged={name: builder.build() for name, builder in ragged.items()},
+            utc_offsets=offsets,
+        )
+
+    @classmethod
+    def from_user_games(
+        cls, games: Iterable[UserGame], fields: Optional[Iterable[str]] = None
+    ) -> "UserGameBatch":
+        """Build a batch from validated UserGame objects."""
+        return cls.from_records((game.__dict__ for game in games), fields)
+
+    @classmethod
+    def from_json_files(
+        cls, file_paths: Iterable[str], fields: Optional[Iterable[str]] = None
+    ) -> "UserGameBatch":
+        """Build a batch from JSON files each holding a list of player records."""
+        return cls.from_records(
+            (
+                record
+                for file_path in file_paths
+                for record in load_archive_file(file_path)
+            ),
+            fields,
+        )
+
+    @classmethod
+    def from_archive(
+        cls, root: str, fields: Optional[Iterable[str]] = None
+    ) -> "UserGameBatch":
+        """Build a batch from every JSON file under the archive root."""
+        return cls.from_json_files(iter_archive_files(root), fields)
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        """Yield one dict per player, keyed by UserGame field name.
+
+        Optional integers stored as NaN are returned as None.
+        """
+        scalars = {}
+        for name, array in self.columns.items():
+            kind = FIELD_KINDS[name]
+            if kind == "optional_int":
+                scalars[name] = [
+                    None if math.isnan(value) else int(value)
+                    for value in array.tolist()
+                ]
+            elif kind == "datetime":
+                scalars[name] = [
+                    _EPOCH.astimezone(timezone(timedelta(seconds=offset)))
+                    + timedelta(milliseconds=millis)
+                    for millis, offset in zip(
+                        array.astype(np.int64).tolist(), self.utc_offsets.tolist()
+                    )
+                ]
+            else:
+                scalars[name] = array.tolist()
+
+        ragged = {
+            name: (
+                FIELD_KINDS[name],
+                column.offsets.tolist(),
+                {key: values.tolist() for key, values in column.values.items()},
+            )
+            for name, column in self.ragged.items()
+        }
+
+        for index in range(len(self)):
+            record = {name: values[index] for name, values in scalars.items()}
+            for name, (kind, offsets, values) in ragged.items():
+                start, end = offsets[index], offsets[index + 1]
+                if kind == "map":
+                    record[name] = {
+                        str(key): value
+                        for key, value in zip(
+                            values["key"][start:end], values["value"][start:end]
+                        )
+                    }
+                elif kind == "map_of_lists":
+                    grouped: dict[str, list[int]] = {}
+                    for key, value in zip(
+                        values["key"][start:end], values["value"][start:end]
+                    ):
+                        grouped.setdefault(str(key), []).append(value)
+                    record[name] = grouped
+                elif kind == "list":
+                    record[name] = values["value"][start:end]
+                else:
+                    record[name] = [
+                        {column: values[column][position] for column in values}
+                        for position in range(start, end)
+                    ]
+            yield record
+
+    def to_user_games(self) -> list[UserGame]:
+        """Export the players as UserGame objects for the insertion layer.
+
+        The objects are built without re-validation; only the fields held by the
+        batch are set.
+        """
+        games = []
+        for record in self.iter_records():
+            if "killed_by_data" in record:
+                record["killed_by_data"] = KillDataList.model_construct(
+                    root=[
+                        KillData.model_construct(**kill)
+                        for kill in record["killed_by_data"]
+                    ]
+                )
+            games.append(UserGame.model_construct(**record))
+        return games
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict, Field, RootModel
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
 
 class KillData(BaseModel):
@@ -17,6 +17,30 @@ class KillData(BaseModel):
 class KillDataList(RootModel):
     root: list[KillData]
 
+    @classmethod
+    def from_flattened(cls, player_data: dict[str, Any]) -> "KillDataList":
+        """Collect the flattened killer fields of an API player payload.
+
+        The API reports up to 3 killers as `killer`, `killer2` and `killer3`, each
+        with matching `killerUserNum`, `killDetail`, etc. fields.
+        """
+        kill_data_list = []
+        for i in range(1, 4):  # Up to 3 sets of kill data
+            killer_prefix = "" if i == 1 else f"{i}"
+            if f"killer{killer_prefix}" in player_data:
+                kill_data = KillData(
+                    killerUserNum=player_data.get(f"killerUserNum{killer_prefix}", 0),
+                    killer=player_data.get(f"killer{killer_prefix}", ""),
+                    killDetail=player_data.get(f"killDetail{killer_prefix}", ""),
+                    placeOfDeath=player_data.get(f"placeOfDeath{killer_prefix}", ""),
+                    killerCharacter=player_data.get(
+                        f"killerCharacter{killer_prefix}", ""
+                    ),
+                    killerWeapon=player_data.get(f"killerWeapon{killer_prefix}", ""),
+                )
+                kill_data_list.append(kill_data)
+        return cls(root=kill_data_list)
+
 
 class UserGame(BaseModel):
     user_id: int = Field(..., alias="userNum")
@@ -0,0 +1,137 @@
+from copy import copy
+from functools import lru_cache
+from typing import Any, Iterable
+from pydantic import BaseModel, ConfigDict, PrivateAttr, create_model
+from models.game import UserGame
+
+
+# UserGame fields read when building the rows of each destination table.
+_GAME_KEYS = ("game_id", "game_start_datetime")
+_PLAYER_KEYS = (*_GAME_KEYS, "user_id")
+
+TABLE_FIELDS: dict[str, tuple[str, ...]] = {
+    "games": (
+        *_GAME_KEYS,
+        "season_id",
+        "match_mode",
+        "match_team_mode",
+        "server",
+        "duration",
+        "total_match_players",
+        "main_weather",
+        "sub_weather",
+    ),
+    "player_game_stats": (
+        *_PLAYER_KEYS,
+        "nickname",
+        "character_id",
+        "team_id",
+        "game_place_result",
+        "level",
+        "kills",
+        "assists",
+        "monster_kills",
+        "damage_to_player",
+        "damage_to_monster",
+        "tanked_damage",
+        "healing",
+        "victory",
+        "mmr_change",
+        "mmr_before",
+        "mmr_gain",
+        "mmr_after",
+        "starting_area",
+        "deaths",
+        "double_kills",
+        "triple_kills",
+        "quadra_kills",
+        "extra_kills",
+        "posessed_credits",
+        "used_credits",
+    ),
+    "mastery_levels": (*_PLAYER_KEYS, "final_mastery_levels"),
+    "equipment": (*_PLAYER_KEYS, "final_equipment", "equipment_first_item"),
+    "skill_order": (*_PLAYER_KEYS, "skill_order"),
+    "killed_by_data": (*_PLAYER_KEYS, "killed_by_data"),
+    "items_purchased": (
+        *_PLAYER_KEYS,
+        "items_purchased_from_console",
+        "items_purchased_from_drone",
+    ),
+}
+
+
+class ProjectedUserGame(BaseModel):
+    """Base class for models holding a validated subset of the UserGame fields.
+
+    Only the projected fields are validated; the untouched player payload is kept
+    as-is so the full UserGame can still be built on demand.
+    """
+
+    model_config = ConfigDict(populate_by_name=True, extra="ignore")
+
+    _raw: dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_raw(cls, player_data: dict[str, Any]) -> "ProjectedUserGame":
+        """Validate the projected fields of a player payload.
+
+        Args:
+            player_data (dict[str, Any]): A single player's game data, keyed either
+                by API alias or by UserGame field name.
+
+        Returns:
+            ProjectedUserGame: The projection, holding a reference to the payload.
+        """
+        projected = cls.model_validate(player_data)
+        projected._raw = player_data
+        return projected
+
+    @property
+    def raw(self) -> dict[str, Any]:
+        """The unvalidated player payload this projection was built from."""
+        return self._raw
+
+    def to_user_game(self) -> UserGame:
+        """Validate the full payload into a UserGame.
+
+        Returns:
+            UserGame: The fully validated game data.
+
+        Raises:
+            pydantic.ValidationError: If the payload does not satisfy UserGame.
+        """
+        return UserGame.model_validate(self._raw)
+
+
+@lru_cache(maxsize=None)
+def _projection_model(tables: frozenset[str]) -> type[ProjectedUserGame]:
+    unknown = tables - TABLE_FIELDS.keys()
+    if unknown:
+        raise ValueError(f"No projection defined for table(s): {sorted(unknown)}")
+
+    field_names = {name for table in tables for name in TABLE_FIELDS[table]}
+    fields = {
+        name: (field.annotation, copy(field))
+        for name, field in UserGame.model_fields.items()
+        if name in field_names
+    }
+    return create_model(
+        "UserGameProjection", __base__=ProjectedUserGame, **fields
+    )  # type: ignore[call-overload]
+
+
+def projection_model(tables: Iterable[str]) -> type[ProjectedUserGame]:
+    """Build (or fetch the cached) model validating only what `tables` consume.
+
+    Args:
+        tables (Iterable[str]): Destination table names, keys of TABLE_FIELDS.
+
+    Returns:
+        type[ProjectedUserGame]: A model class exposing the projected fields under
+        the same attribute names as UserGame.
+
+    Raises:
+        ValueError: If a table has no projection defined.
+    """
+    return _projection_model(frozenset(tables))
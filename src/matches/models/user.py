@@ -1,4 +1,6 @@
 from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime
+from typing import Optional
 import pendulum
 
 
@@ -8,3 +10,20 @@ class User(BaseModel):
     user_id: int = Field(..., alias="userNum")
     nickname: str = Field(..., alias="nickname")
     last_retrieval: pendulum.DateTime = Field(default_factory=pendulum.now)
+
+
+class UserWatermark(BaseModel):
+    """The newest game ingested for a user, where incremental syncs stop."""
+
+    user_id: int
+    last_game_id: Optional[int] = None
+    last_game_start_time: Optional[datetime] = None
+
+    def covers(self, game_start_time: datetime, game_id: int) -> bool:
+        """Whether a game is at or before the watermark, i.e. already ingested."""
+        if self.last_game_start_time is None:
+            return False
+        return (game_start_time, game_id) <= (
+            self.last_game_start_time,
+            self.last_game_id or 0,
+        )
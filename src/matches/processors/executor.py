@@ -0,0 +1,111 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class ExecutionResult:
+    """Outcome of a DependencyAwareExecutor run.
+
+    Attributes:
+        completed (list[str]): Tasks that finished successfully, in finish order.
+        errors (dict[str, Exception]): Tasks that raised, with their exception.
+        skipped (list[str]): Tasks not run because a dependency failed.
+    """
+
+    completed: list[str] = field(default_factory=list)
+    errors: dict[str, Exception] = field(default_factory=dict)
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.skipped
+
+
+class DependencyAwareExecutor:
+    """Run named tasks on a bounded thread pool, respecting their dependencies.
+
+    A task is submitted as soon as all of its dependencies have succeeded, so
+    independent tasks run concurrently. Tasks depending on a failed task are
+    skipped rather than run.
+
+    Args:
+        max_workers (int): Maximum number of tasks running at once.
+    """
+
+    def __init__(self, max_workers: int = 6):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="insert"
+            )
+        return self._pool
+
+    def run(
+        self,
+        tasks: dict[str, Callable[[], None]],
+        dependencies: Optional[dict[str, tuple[str, ...]]] = None,
+    ) -> ExecutionResult:
+        """Run the tasks and wait for all of them to finish or be skipped.
+
+        Args:
+            tasks (dict[str, Callable[[], None]]): Task callables by name.
+            dependencies (Optional[dict[str, tuple[str, ...]]]): Names of the tasks
+                each task waits for. Dependencies outside `tasks` are ignored.
+
+        Returns:
+            ExecutionResult: The completed, failed and skipped tasks.
+        """
+        dependencies = dependencies or {}
+        waiting_on = {
+            name: {dep for dep in dependencies.get(name, ()) if dep in tasks}
+            for name in tasks
+        }
+        result = ExecutionResult()
+        running: dict[Future, str] = {}
+        pool = self._get_pool()
+
+        def submit_ready() -> None:
+            for name in [name for name, deps in waiting_on.items() if not deps]:
+                del waiting_on[name]
+                running[pool.submit(tasks[name])] = name
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    result.completed.append(name)
+                    for deps in waiting_on.values():
+                        deps.discard(name)
+                else:
+                    result.errors[name] = error
+                    self._skip_dependents(name, waiting_on, result)
+            submit_ready()
+
+        # Anything still waiting is part of a dependency cycle.
+        result.skipped.extend(waiting_on)
+        return result
+
+    @staticmethod
+    def _skip_dependents(
+        failed: str, waiting_on: dict[str, set[str]], result: ExecutionResult
+    ) -> None:
+        blocked = [failed]
+        while blocked:
+            name = blocked.pop()
+            for dependent in [dep for dep, deps in waiting_on.items() if name in deps]:
+                del waiting_on[dependent]
+                result.skipped.append(dependent)
+                blocked.append(dependent)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads once running tasks finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -1,122 +1,93 @@
+import time
 from abc import ABC, abstractmethod
+from functools import partial
+from typing import Optional
+import metrics
+import profiling
 from models.game import UserGame
 from data_access.supabase import SupabaseDAO
-from itertools import groupby
-from operator import itemgetter
-from collections import Counter
+from processors.executor import DependencyAwareExecutor, ExecutionResult
+from processors.table_mappings import Row, TABLE_MAPPINGS, build_table_rows
+from storage.aggregates import AggregateStore, SOURCE_TABLES
+from storage.mmr_series import MMRSeriesStore
+
+
+class InsertionError(Exception):
+    """Raised when some tables of a player's game data could not be written.
+
+    Attributes:
+        game_id (int): The game the rows belong to.
+        user_id (int): The player the rows belong to.
+        result (ExecutionResult): The per-table outcome, with every table error.
+    """
+
+    def __init__(self, game_id: int, user_id: int, result: ExecutionResult):
+        self.game_id = game_id
+        self.user_id = user_id
+        self.result = result
+        failures = [f"{table}: {error}" for table, error in result.errors.items()]
+        failures += [f"{table}: skipped" for table in result.skipped]
+        super().__init__(
+            f"Failed to insert game {game_id} for user {user_id}: "
+            + "; ".join(failures)
+        )
 
 
 class InsertionStrategy(ABC):
+    # Tables written by the strategy, used to project the fields it reads.
+    tables: tuple[str, ...] = ()
+    # Tables that must be written before this strategy's, e.g. for foreign keys.
+    depends_on: tuple[str, ...] = ()
+
     @abstractmethod
     def insert(self, game_data: UserGame, dao: SupabaseDAO) -> None:
         pass
 
 
-class GameInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO) -> None:
-        game_insert = {
-            "game_id": game_data.game_id,
-            "game_start_time": game_data.game_start_datetime.isoformat(),
-            "season_id": game_data.season_id,
-            "match_mode": game_data.match_mode,
-            "match_team_mode": game_data.match_team_mode,
-            "server": game_data.server,
-            "duration": game_data.duration,
-            "total_match_players": game_data.total_match_players,
-            "main_weather_code": game_data.main_weather,
-            "sub_weather_code": game_data.sub_weather,
-        }
-        dao.insert_game(game_insert)
-
-
-class PlayerStatsInsertionStrategy(InsertionStrategy):
+class TableInsertionStrategy(InsertionStrategy):
+    """Strategy writing the rows of a single table described in TABLE_MAPPINGS."""
+
     def insert(self, game_data: UserGame, dao: SupabaseDAO) -> None:
-        player_stats = {
-            "game_id": game_data.game_id,
-            "game_start_time": game_data.game_start_datetime.isoformat(),
-            "user_id": game_data.user_id,
-            "nickname": game_data.nickname,
-            "character_id": game_data.character_id,
-            "team_id": game_data.team_id,
-            "game_place_result": game_data.game_place_result,
-            "level": game_data.level,
-            "kills": game_data.kills,
-            "assists": game_data.assists,
-            "monster_kills": game_data.monster_kills,
-            "damage_to_player": game_data.damage_to_player,
-            "damage_to_monster": game_data.damage_to_monster,
-            "tanked_damage": game_data.tanked_damage,
-            "healing": game_data.healing,
-            "victory": game_data.victory,
-            "mmr_change": game_data.mmr_change,
-            "mmr_before": game_data.mmr_before,
-            "mmr_gain": game_data.mmr_gain,
-            "mmr_after": game_data.mmr_after,
-            "starting_area": game_data.starting_area,
-            "deaths": game_data.deaths,
-            "double_kills": game_data.double_kills,
-            "triple_kills": game_data.triple_kills,
-            "quadra_kills": game_data.quadra_kills,
-            "extra_kills": game_data.extra_kills,
-            "possessed_credits": game_data.posessed_credits,
-            "used_credits": game_data.used_credits,
-        }
-        dao.insert_player_stats(player_stats)
-
-
-class MasteryLevelsInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO):
-        mastery_inserts = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "mastery_type": int(mastery_type),
-                "level": level,
-            }
-            for mastery_type, level in game_data.final_mastery_levels.items()
-        ]
-
-        mastery_inserts.sort(
-            key=itemgetter("game_start_time", "game_id", "user_id", "mastery_type")
-        )
-        unique_mastery = [
-            next(group)
-            for _, group in groupby(
-                mastery_inserts,
-                key=itemgetter("game_start_time", "game_id", "user_id", "mastery_type"),
-            )
-        ]
-
-        if unique_mastery:
-            dao.insert_mastery_levels(unique_mastery)
-
-
-class EquipmentInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO):
-        final_equipment = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "slot": int(slot),
-                "item_id": item_id,
-                "type": 2,  # Final equipment
-            }
-            for slot, item_id in game_data.final_equipment.items()
-        ]
-
-        first_equipment = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "slot": int(slot),
-                "item_id": item_id[0],
-                "type": 1,  # First equipment
-            }
-            for slot, item_id in game_data.equipment_first_item.items()
-        ]
+        self.write(TABLE_MAPPINGS[self.tables[0]].rows(game_data), dao)
+
+    @abstractmethod
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        pass
+
+
+class GameInsertionStrategy(TableInsertionStrategy):
+    tables = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        dao.insert_game(rows[0])
+
+
+class PlayerStatsInsertionStrategy(TableInsertionStrategy):
+    tables = ("player_game_stats",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        dao.insert_player_stats(rows[0])
+
+
+class MasteryLevelsInsertionStrategy(TableInsertionStrategy):
+    tables = ("mastery_levels",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        if rows:
+            dao.insert_mastery_levels(rows)
+
+
+class EquipmentInsertionStrategy(TableInsertionStrategy):
+    tables = ("equipment",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        # Final and first equipment share the slot conflict key, so they are
+        # upserted separately.
+        final_equipment = [row for row in rows if row["type"] == 2]
+        first_equipment = [row for row in rows if row["type"] == 1]
 
         # Insert final equipment
         if final_equipment:
@@ -127,111 +98,31 @@ class EquipmentInsertionStrategy(InsertionStrategy):
             dao.insert_equipment(first_equipment)
 
 
-class SkillOrderInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO):
-        skill_inserts = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "skill_level": int(skill_level),
-                "skill_id": skill_id,
-            }
-            for skill_level, skill_id in game_data.skill_order.items()
-        ]
-
-        skill_inserts.sort(
-            key=itemgetter("game_start_time", "game_id", "user_id", "skill_level")
-        )
-        unique_skills = [
-            next(group)
-            for _, group in groupby(
-                skill_inserts,
-                key=itemgetter("game_start_time", "game_id", "user_id", "skill_level"),
-            )
-        ]
-
-        if unique_skills:
-            dao.insert_skill_order(unique_skills)
-
-
-class KilledByDataInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO):
-        killed_by_inserts = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "killed_by_id": kill_data.killed_by_id,
-                "killed_by_type": kill_data.killed_by_type,
-                "killed_by_name": kill_data.killed_by_name,
-                "died_area": kill_data.died_area,
-                "killed_by_character": kill_data.killed_by_character,
-                "killed_by_character_weapon": kill_data.killed_by_character_weapon,
-            }
-            for kill_data in game_data.killed_by_data.root
-        ]
-
-        # Sort and group by the primary key fields
-        killed_by_inserts.sort(
-            key=itemgetter("game_start_time", "game_id", "user_id", "killed_by_id")
-        )
-        unique_killed_by = [
-            next(group)  # Take the first item from each group
-            for _, group in groupby(
-                killed_by_inserts,
-                key=itemgetter("game_start_time", "game_id", "user_id", "killed_by_id"),
-            )
-        ]
-
-        if unique_killed_by:
-            dao.insert_killed_by_data(unique_killed_by)
-
-
-class ItemPurchasesInsertionStrategy(InsertionStrategy):
-    def insert(self, game_data: UserGame, dao: SupabaseDAO):
-        console_items = Counter(game_data.items_purchased_from_console)
-        drone_items = Counter(game_data.items_purchased_from_drone)
-
-        item_purchases = [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "item_id": item_id,
-                "purchase_type": "console",
-                "quantity": quantity,
-            }
-            for item_id, quantity in console_items.items()
-        ] + [
-            {
-                "game_start_time": game_data.game_start_datetime.isoformat(),
-                "game_id": game_data.game_id,
-                "user_id": game_data.user_id,
-                "item_id": item_id,
-                "purchase_type": "drone",
-                "quantity": quantity,
-            }
-            for item_id, quantity in drone_items.items()
-        ]
-
-        item_purchases.sort(
-            key=itemgetter(
-                "game_start_time", "game_id", "user_id", "item_id", "purchase_type"
-            )
-        )
-        unique_purchases = [
-            next(group)
-            for _, group in groupby(
-                item_purchases,
-                key=itemgetter(
-                    "game_start_time", "game_id", "user_id", "item_id", "purchase_type"
-                ),
-            )
-        ]
+class SkillOrderInsertionStrategy(TableInsertionStrategy):
+    tables = ("skill_order",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        if rows:
+            dao.insert_skill_order(rows)
+
 
-        if unique_purchases:
-            dao.insert_items_purchased(unique_purchases)
+class KilledByDataInsertionStrategy(TableInsertionStrategy):
+    tables = ("killed_by_data",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        if rows:
+            dao.insert_killed_by_data(rows)
+
+
+class ItemPurchasesInsertionStrategy(TableInsertionStrategy):
+    tables = ("items_purchased",)
+    depends_on = ("games",)
+
+    def write(self, rows: list[Row], dao: SupabaseDAO) -> None:
+        if rows:
+            dao.insert_items_purchased(rows)
 
 
 class DataInsertionContext:
@@ -241,21 +132,110 @@ class DataInsertionContext:
     def set_strategy(self, strategy: InsertionStrategy):
         self._strategy = strategy
 
+    @property
+    def tables(self) -> tuple[str, ...]:
+        return self._strategy.tables
+
     def insert_data(self, game_data: UserGame, dao: SupabaseDAO):
         self._strategy.insert(game_data, dao)
 
 
 # Composite strategy to insert all data
 class AllDataInsertionStrategy(InsertionStrategy):
+    """Write every table, running independent table writes concurrently.
+
+    The `games` row is written first; the other tables are then upserted in
+    parallel on a bounded thread pool, so a player costs the `games` upsert plus
+    the slowest child table instead of every upsert in sequence.
+
+    Args:
+        max_workers (int): Maximum number of concurrent table writes.
+        ordered (bool): Wait for each table's `depends_on` tables to be written.
+            Disable when the database has no foreign keys between the tables.
+        aggregates (Optional[AggregateStore]): Materialized aggregates to update
+            once every table of the player has been written. A failed update is
+            reported without failing the insert.
+        mmr_series (Optional[MMRSeriesStore]): MMR time series to append the
+            player's game to once its `player_game_stats` row is written.
+    """
+
+    strategies: tuple[type[TableInsertionStrategy], ...] = (
+        GameInsertionStrategy,
+        PlayerStatsInsertionStrategy,
+        MasteryLevelsInsertionStrategy,
+        EquipmentInsertionStrategy,
+        SkillOrderInsertionStrategy,
+        KilledByDataInsertionStrategy,
+        ItemPurchasesInsertionStrategy,
+    )
+    tables = tuple(table for strategy in strategies for table in strategy.tables)
+
+    def __init__(
+        self,
+        max_workers: int = 6,
+        ordered: bool = True,
+        aggregates: Optional[AggregateStore] = None,
+        mmr_series: Optional[MMRSeriesStore] = None,
+    ):
+        self._executor = DependencyAwareExecutor(max_workers)
+        self._ordered = ordered
+        self._aggregates = aggregates
+        self._mmr_series = mmr_series
+
     def insert(self, game_data: UserGame, dao: SupabaseDAO) -> None:
-        strategies = [
-            GameInsertionStrategy(),
-            PlayerStatsInsertionStrategy(),
-            MasteryLevelsInsertionStrategy(),
-            EquipmentInsertionStrategy(),
-            SkillOrderInsertionStrategy(),
-            KilledByDataInsertionStrategy(),
-            ItemPurchasesInsertionStrategy(),
-        ]
-        for strategy in strategies:
-            strategy.insert(game_data, dao)
+        """Write all tables for a player.
+
+        Raises:
+            InsertionError: If any table failed, listing every failed or skipped
+                table.
+        """
+        start = time.perf_counter()
+        # Build every table's rows in one pass so the shared keys are computed once.
+        with profiling.span("build_rows"):
+            table_rows = build_table_rows([game_data], self.tables)
+        tasks = {}
+        dependencies = {}
+        for strategy in self.strategies:
+            table = strategy.tables[0]
+            tasks[table] = partial(strategy().write, table_rows[table], dao)
+            if self._ordered:
+                dependencies[table] = strategy.depends_on
+
+        if self._aggregates is not None:
+            # Only count players whose rows were all written; the aggregate
+            # ledger makes the retry of a failed player count it exactly once.
+            tasks["aggregates"] = partial(
+                self._update_aggregates,
+                game_data,
+                {table: table_rows[table] for table in SOURCE_TABLES},
+            )
+            dependencies["aggregates"] = self.tables
+
+        if self._mmr_series is not None:
+            tasks["mmr_series"] = partial(
+                self._mmr_series.append_rows, table_rows["player_game_stats"]
+            )
+            dependencies["mmr_series"] = ("player_game_stats",)
+
+        result = self._executor.run(tasks, dependencies)
+        metrics.observe("player_insert_seconds", time.perf_counter() - start)
+        for table in (*result.errors, *result.skipped):
+            metrics.inc("player_insert_failures_total", table)
+        if not result.ok:
+            raise InsertionError(game_data.game_id, game_data.user_id, result)
+
+    def _update_aggregates(
+        self, game_data: UserGame, table_rows: dict[str, list[Row]]
+    ) -> None:
+        # The aggregates are a local sidecar of the database: failing to update
+        # them must not fail a player whose rows are all written. The update's
+        # transaction is rolled back, so the player stays out of the ledger and
+        # `rebuild-aggregates` counts them.
+        try:
+            self._aggregates.apply_rows(table_rows)
+        except Exception as e:
+            metrics.inc("player_insert_failures_total", "aggregates")
+            print(
+                f"Failed to update aggregates for game {game_data.game_id}, user "
+                f"{game_data.user_id}: {e}; run rebuild-aggregates to count it"
+            )
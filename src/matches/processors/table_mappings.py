@@ -0,0 +1,246 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+from models.game import UserGame
+
+
+Row = dict[str, Any]
+
+
+def player_keys(game_data: UserGame) -> Row:
+    """Compute the key columns shared by every row a player contributes.
+
+    Args:
+        game_data (UserGame): The player's game data.
+
+    Returns:
+        Row: The game_id, game_start_time and user_id key values.
+    """
+    return {
+        "game_start_time": game_data.game_start_datetime.isoformat(),
+        "game_id": game_data.game_id,
+        "user_id": game_data.user_id,
+    }
+
+
+@dataclass(frozen=True)
+class TableMapping:
+    """Declarative description of how a UserGame maps onto the rows of a table.
+
+    Attributes:
+        table (str): The destination table name.
+        keys (tuple[str, ...]): Shared key columns (see `player_keys`) to include.
+        columns (dict[str, str]): Column name to UserGame attribute for the
+            per-player values.
+        explode (Optional[Callable]): Yields the per-child values for child tables,
+            one dict per row. Scalar tables produce a single row when unset.
+        unique_on (tuple[str, ...]): Columns, besides the keys, identifying a row.
+            Later duplicates are dropped.
+    """
+
+    table: str
+    keys: tuple[str, ...]
+    columns: dict[str, str] = field(default_factory=dict)
+    explode: Optional[Callable[[UserGame], Iterable[Row]]] = None
+    unique_on: tuple[str, ...] = ()
+
+    def rows(self, game_data: UserGame, keys: Optional[Row] = None) -> list[Row]:
+        """Build the table rows for a single player.
+
+        Args:
+            game_data (UserGame): The player's game data.
+            keys (Optional[Row]): Precomputed `player_keys(game_data)`, computed
+                when omitted.
+
+        Returns:
+            list[Row]: The rows for this table, without duplicates.
+        """
+        if keys is None:
+            keys = player_keys(game_data)
+
+        base = {key: keys[key] for key in self.keys}
+        for column, attribute in self.columns.items():
+            base[column] = getattr(game_data, attribute)
+
+        if self.explode is None:
+            return [base]
+
+        rows = [{**base, **child} for child in self.explode(game_data)]
+        if not self.unique_on:
+            return rows
+
+        seen = set()
+        unique_rows = []
+        for row in rows:
+            identity = tuple(row[column] for column in self.unique_on)
+            if identity not in seen:
+                seen.add(identity)
+                unique_rows.append(row)
+        return unique_rows
+
+
+def _explode_mastery(game_data: UserGame) -> Iterable[Row]:
+    for mastery_type, level in game_data.final_mastery_levels.items():
+        yield {"mastery_type": int(mastery_type), "level": level}
+
+
+def _explode_equipment(game_data: UserGame) -> Iterable[Row]:
+    for slot, item_id in game_data.final_equipment.items():
+        yield {"slot": int(slot), "item_id": item_id, "type": 2}  # Final equipment
+    for slot, item_id in game_data.equipment_first_item.items():
+        yield {"slot": int(slot), "item_id": item_id[0], "type": 1}  # First equipment
+
+
+def _explode_skills(game_data: UserGame) -> Iterable[Row]:
+    for skill_level, skill_id in game_data.skill_order.items():
+        yield {"skill_level": int(skill_level), "skill_id": skill_id}
+
+
+def _explode_killed_by(game_data: UserGame) -> Iterable[Row]:
+    for kill_data in game_data.killed_by_data.root:
+        yield {
+            "killed_by_id": kill_data.killed_by_id,
+            "killed_by_type": kill_data.killed_by_type,
+            "killed_by_name": kill_data.killed_by_name,
+            "died_area": kill_data.died_area,
+            "killed_by_character": kill_data.killed_by_character,
+            "killed_by_character_weapon": kill_data.killed_by_character_weapon,
+        }
+
+
+def _explode_purchases(game_data: UserGame) -> Iterable[Row]:
+    for purchase_type, items in (
+        ("console", game_data.items_purchased_from_console),
+        ("drone", game_data.items_purchased_from_drone),
+    ):
+        for item_id, quantity in Counter(items).items():
+            yield {
+                "item_id": item_id,
+                "purchase_type": purchase_type,
+                "quantity": quantity,
+            }
+
+
+_CHILD_KEYS = ("game_start_time", "game_id", "user_id")
+
+TABLE_MAPPINGS: dict[str, TableMapping] = {
+    mapping.table: mapping
+    for mapping in (
+        TableMapping(
+            table="games",
+            keys=("game_id", "game_start_time"),
+            columns={
+                "season_id": "season_id",
+                "match_mode": "match_mode",
+                "match_team_mode": "match_team_mode",
+                "server": "server",
+                "duration": "duration",
+                "total_match_players": "total_match_players",
+                "main_weather_code": "main_weather",
+                "sub_weather_code": "sub_weather",
+            },
+        ),
+        TableMapping(
+            table="player_game_stats",
+            keys=("game_id", "game_start_time", "user_id"),
+            columns={
+                "nickname": "nickname",
+                "character_id": "character_id",
+                "team_id": "team_id",
+                "game_place_result": "game_place_result",
+                "level": "level",
+                "kills": "kills",
+                "assists": "assists",
+                "monster_kills": "monster_kills",
+                "damage_to_player": "damage_to_player",
+                "damage_to_monster": "damage_to_monster",
+                "tanked_damage": "tanked_damage",
+                "healing": "healing",
+                "victory": "victory",
+                "mmr_change": "mmr_change",
+                "mmr_before": "mmr_before",
+                "mmr_gain": "mmr_gain",
+                "mmr_after": "mmr_after",
+                "starting_area": "starting_area",
+                "deaths": "deaths",
+                "double_kills": "double_kills",
+                "triple_kills": "triple_kills",
+                "quadra_kills": "quadra_kills",
+                "extra_kills": "extra_kills",
+                "possessed_credits": "posessed_credits",
+                "used_credits": "used_credits",
+            },
+        ),
+        TableMapping(
+            table="mastery_levels",
+            keys=_CHILD_KEYS,
+            explode=_explode_mastery,
+            unique_on=("mastery_type",),
+        ),
+        TableMapping(
+            table="equipment",
+            keys=_CHILD_KEYS,
+            explode=_explode_equipment,
+            unique_on=("slot", "type"),
+        ),
+        TableMapping(
+            table="skill_order",
+            keys=_CHILD_KEYS,
+            explode=_explode_skills,
+            unique_on=("skill_level",),
+        ),
+        TableMapping(
+            table="killed_by_data",
+            keys=_CHILD_KEYS,
+            explode=_explode_killed_by,
+            unique_on=("killed_by_id",),
+        ),
+        TableMapping(
+            table="items_purchased",
+            keys=_CHILD_KEYS,
+            explode=_explode_purchases,
+            unique_on=("item_id", "purchase_type"),
+        ),
+    )
+}
+
+
+def build_table_rows(
+    games: Iterable[UserGame], tables: Optional[Iterable[str]] = None
+) -> dict[str, list[Row]]:
+    """Turn a batch of UserGames into per-table row batches in a single pass.
+
+    Args:
+        games (Iterable[UserGame]): The players' game data.
+        tables (Optional[Iterable[str]]): Tables to build rows for, all mapped
+            tables when omitted.
+
+    Returns:
+        dict[str, list[Row]]: Rows per table name, ready for a DAO upsert.
+
+    Raises:
+        KeyError: If a table has no mapping.
+    """
+    mappings = [TABLE_MAPPINGS[table] for table in (tables or TABLE_MAPPINGS.keys())]
+    table_rows: dict[str, list[Row]] = {mapping.table: [] for mapping in mappings}
+
+    for game_data in games:
+        keys = player_keys(game_data)
+        for mapping in mappings:
+            table_rows[mapping.table].extend(mapping.rows(game_data, keys))
+
+    return table_rows
+
+
+def to_columns(rows: list[Row]) -> dict[str, list[Any]]:
+    """Pivot a row batch into column arrays.
+
+    Args:
+        rows (list[Row]): Rows sharing the same columns.
+
+    Returns:
+        dict[str, list[Any]]: A list of values per column, in row order.
+    """
+    if not rows:
+        return {}
+    return {column: [row[column] for row in rows] for column in rows[0]}
@@ -0,0 +1,378 @@
+"""
+Built-in profiling for the CLI commands.
+
+A `Session` profiles everything run between `start` and `stop` in one of four
+modes, and always records the wall time of the named spans the pipeline marks
+with `span` (`fetch`, `validate`, `build_rows`, `upsert`, `select`, ...):
+
+- `cpu`: deterministic profiling with cProfile, of every thread; writes a
+  `.pstats` file (for `pstats`, snakeviz or gprof2dot) and the top functions.
+- `sample`: samples the stacks of every thread every few milliseconds; writes
+  collapsed stacks (`.collapsed`, for flamegraph.pl or speedscope) and the
+  functions with the most samples. Cheap enough for production runs.
+- `memory`: traces allocations with tracemalloc; writes the top allocation
+  sites, by line and by traceback.
+- `spans`: only the span breakdown.
+
+`game_data_cli.py` takes `--profile MODE` before any command. Other scripts,
+such as the l10n CLIs, are profiled unchanged by running them through this
+module:
+
+    poetry run python src/matches/profiling.py --profile sample src/ingest/l10n_data/l10n_refresh.py DUMP
+"""
+
+import cProfile
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+import typer
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Optional
+
+MODES = ("cpu", "sample", "memory", "spans")
+DEFAULT_OUTPUT_DIR = "profiles"
+
+
+class SpanRecorder:
+    """Wall time and calls per span name, summed over threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals: dict[str, float] = {}
+        self.calls: Counter = Counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.calls[name] += 1
+
+    def report(self, wall: float) -> str:
+        """A table of the spans by total time, against the session's wall time."""
+        lines = [
+            f"Spans (wall {wall:.2f}s; summed over threads, so may exceed it)",
+            f"{'span':<20} {'calls':>9} {'total s':>10} {'mean ms':>10} {'% wall':>7}",
+        ]
+        for name, total in sorted(self.totals.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(
+                f"{name:<20} {calls:>9} {total:>10.3f} {total / calls * 1000:>10.3f} "
+                f"{total / wall * 100 if wall else 0:>6.1f}%"
+            )
+        return "\n".join(lines)
+
+
+_recorder: Optional[SpanRecorder] = None
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        recorder = _recorder
+        if recorder is not None:
+            recorder.add(self.name, time.perf_counter() - self.start)
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str) -> _Span | _NullSpan:
+    """Time a block under a span name while a Session runs; a no-op otherwise.
+
+    Example:
+        with profiling.span("fetch"):
+            response = requests.get(url)
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    location = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+    return f"{code.co_qualname} ({location})"
+
+
+class StackSampler:
+    """Background thread counting the stacks of every other thread.
+
+    Args:
+        interval (float): Seconds between samples.
+
+    Attributes:
+        stacks (Counter): Samples per stack, as tuples of frame names root first.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-sampler", daemon=True
+        )
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The stacks in the collapsed format: `root;...;leaf count` per line."""
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def report(self, top: int) -> str:
+        """The functions with the most samples, on the stack and at its top."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        samples = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms"]
+        for title, counter in (("self", own), ("inclusive", total)):
+            lines.append(f"Top functions by {title} samples:")
+            for name, count in counter.most_common(top):
+                lines.append(f"{count / samples * 100:6.1f}% {count:>8}  {name}")
+        return "\n".join(lines)
+
+
+class Session:
+    """Profile everything between `start` and `stop`, and write the results.
+
+    Args:
+        mode (str): One of MODES.
+        output_dir (str): Directory the results are written to, as
+            `<name>-<timestamp>.<ext>`.
+        name (str): Name of what is profiled, e.g. the command.
+        interval (float): Seconds between stack samples, in `sample` mode.
+        top (int): Number of functions or allocation sites reported.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        output_dir: str = DEFAULT_OUTPUT_DIR,
+        name: str = "cli",
+        interval: float = 0.005,
+        top: int = 25,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode}; use one of {MODES}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.interval = interval
+        self.top = top
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.prefix = os.path.join(output_dir, f"{name}-{stamp}-{os.getpid()}")
+        self.spans = SpanRecorder()
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._watcher: Optional[AllocationWatcher] = None
+        self._started = 0.0
+
+    def start(self) -> "Session":
+        global _recorder
+        _recorder = self.spans
+        if self.mode == "cpu":
+            # From Python 3.12 cProfile runs on sys.monitoring and sees every
+            # thread, including the insertion and fetch pools.
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == "sample":
+            self._sampler = StackSampler(self.interval).start()
+        elif self.mode == "memory":
+            self._watcher = AllocationWatcher().start()
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self) -> str:
+        """Stop profiling and write the results.
+
+        Returns:
+            str: The report, also written to `<prefix>.txt`.
+        """
+        global _recorder
+        wall = time.perf_counter() - self._started
+        sections = [f"Profile ({self.mode}) of {os.path.basename(self.prefix)}"]
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.mode == "cpu":
+            self._profile.disable()
+            stats = pstats.Stats(self._profile)
+            stats.dump_stats(f"{self.prefix}.pstats")
+            stream = _Capture()
+            stats.stream = stream
+            stats.sort_stats("cumulative").print_stats(self.top)
+            sections.append(f"Wrote {self.prefix}.pstats\n{stream.text.strip()}")
+        elif self.mode == "sample":
+            self._sampler.stop()
+            with open(f"{self.prefix}.collapsed", "w") as f:
+                f.write(self._sampler.collapsed())
+            sections.append(
+                f"Wrote {self.prefix}.collapsed\n{self._sampler.report(self.top)}"
+            )
+        elif self.mode == "memory":
+            sections.append(self._watcher.stop(self.top))
+        sections.append(self.spans.report(wall))
+        _recorder = None
+        report = "\n\n".join(sections)
+        with open(f"{self.prefix}.txt", "w") as f:
+            f.write(report + "\n")
+        return report
+
+
+class AllocationWatcher:
+    """Trace allocations, keeping a snapshot of the largest traced footprint.
+
+    The footprint is checked every `interval` seconds and at `stop`, so the
+    reported sites are those holding memory when usage was highest rather than
+    what is left at exit.
+
+    Args:
+        interval (float): Seconds between footprint checks.
+        frames (int): Frames kept per allocation traceback.
+    """
+
+    def __init__(self, interval: float = 1.0, frames: int = 10):
+        self.interval = interval
+        self.frames = frames
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_size = -1
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-allocations", daemon=True
+        )
+
+    def start(self) -> "AllocationWatcher":
+        tracemalloc.start(self.frames)
+        self._thread.start()
+        return self
+
+    def _check(self) -> None:
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._check()
+
+    def stop(self, top: int) -> str:
+        """Stop tracing and report the top allocation sites."""
+        self._stop.set()
+        self._thread.join()
+        self._check()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = self.snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        lines = [
+            f"Traced memory: {peak / 2**20:.1f} MiB peak, "
+            f"{self.snapshot_size / 2**20:.1f} MiB in the largest snapshot",
+            "Top allocation sites of the largest snapshot:",
+        ]
+        for stat in snapshot.statistics("lineno")[:top]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size / 2**10:10.1f} KiB {stat.count:>9} blocks  "
+                f"{frame.filename}:{frame.lineno}"
+            )
+        lines.append("Top allocation tracebacks:")
+        for stat in snapshot.statistics("traceback")[:5]:
+            lines.append(f"{stat.size / 2**10:10.1f} KiB {stat.count:>9} blocks")
+            lines.extend(
+                f"    {line}" for line in stat.traceback.format(most_recent_first=True)
+            )
+        return "\n".join(lines)
+
+
+class _Capture:
+    def __init__(self):
+        self.text = ""
+
+    def write(self, text: str) -> None:
+        self.text += text
+
+
+app = typer.Typer()
+
+
+@app.command(
+    context_settings={
+        "allow_extra_args": True,
+        "allow_interspersed_args": False,
+        "ignore_unknown_options": True,
+    }
+)
+def run(
+    ctx: typer.Context,
+    script: str = typer.Argument(..., help="Python script to run, e.g. a CLI"),
+    profile: str = typer.Option("sample", help=f"Profile mode: {', '.join(MODES)}"),
+    profile_dir: str = typer.Option(DEFAULT_OUTPUT_DIR, help="Directory for results"),
+    profile_interval: float = typer.Option(0.005, help="Seconds between samples"),
+) -> None:
+    """Run a script unchanged under the profiler, passing it the remaining arguments."""
+    if profile not in MODES:
+        raise typer.BadParameter(f"Unknown profile mode {profile}")
+    sys.argv = [script, *ctx.args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    name = os.path.splitext(os.path.basename(script))[0]
+    session = Session(profile, profile_dir, name, profile_interval).start()
+    code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        code = e.code
+    finally:
+        typer.echo(session.stop(), err=True)
+    raise typer.Exit(code if isinstance(code, int) else 1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,340 @@
+"""
+Materialized aggregates maintained as games are inserted.
+
+A SQLite database of rolling counts and sums, so common dashboard stats are a
+primary-key lookup instead of a scan of player_game_stats and its child tables:
+
+- `character_aggregates` per (season_id, character_id, match_mode)
+- `item_aggregates` per (item_id, slot), over final equipment
+- `weather_aggregates` per (main_weather, sub_weather), counted once per game;
+  games without weather data are left out of this one only
+
+Every aggregate family keeps a ledger of the games or players it has counted, and
+a row batch only adds the entries missing from the ledger, in the same
+transaction. Replaying a game, or inserting the same player twice, is a no-op.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Any, Iterable, Optional
+from processors.table_mappings import Row
+
+# Tables whose rows feed the aggregates, in the shape of build_table_rows.
+SOURCE_TABLES = ("games", "player_game_stats", "equipment")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS character_aggregates (
+    season_id INTEGER NOT NULL,
+    character_id INTEGER NOT NULL,
+    match_mode INTEGER NOT NULL,
+    players INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    kills INTEGER NOT NULL,
+    assists INTEGER NOT NULL,
+    place_sum INTEGER NOT NULL,
+    damage_sum INTEGER NOT NULL,
+    mmr_gain_sum INTEGER NOT NULL,
+    mmr_gain_count INTEGER NOT NULL,
+    PRIMARY KEY (season_id, character_id, match_mode)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS item_aggregates (
+    item_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    picks INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (item_id, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS weather_aggregates (
+    main_weather INTEGER NOT NULL,
+    sub_weather INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    duration_sum INTEGER NOT NULL,
+    PRIMARY KEY (main_weather, sub_weather)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS applied_games (
+    game_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS applied_players (
+    game_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (game_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS applied_equipment (
+    game_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    PRIMARY KEY (game_id, user_id, slot)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_CHARACTER = """
+INSERT INTO character_aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (season_id, character_id, match_mode) DO UPDATE SET
+    players = players + excluded.players,
+    wins = wins + excluded.wins,
+    kills = kills + excluded.kills,
+    assists = assists + excluded.assists,
+    place_sum = place_sum + excluded.place_sum,
+    damage_sum = damage_sum + excluded.damage_sum,
+    mmr_gain_sum = mmr_gain_sum + excluded.mmr_gain_sum,
+    mmr_gain_count = mmr_gain_count + excluded.mmr_gain_count
+"""
+_UPSERT_ITEM = """
+INSERT INTO item_aggregates VALUES (?, ?, ?, ?)
+ON CONFLICT (item_id, slot) DO UPDATE SET
+    picks = picks + excluded.picks,
+    wins = wins + excluded.wins
+"""
+_UPSERT_WEATHER = """
+INSERT INTO weather_aggregates VALUES (?, ?, ?, ?)
+ON CONFLICT (main_weather, sub_weather) DO UPDATE SET
+    games = games + excluded.games,
+    duration_sum = duration_sum + excluded.duration_sum
+"""
+
+
+class AggregateStore:
+    """Rolling aggregates in a SQLite file, safe to update from worker threads.
+
+    Args:
+        path (str): The SQLite database file, created if missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def _claim(
+        cursor: sqlite3.Cursor, ledger: str, columns: tuple[str, ...], rows: list[Row]
+    ) -> set[tuple]:
+        """Add row keys to a ledger, returning the keys that were not in it yet."""
+        query = (
+            f"INSERT OR IGNORE INTO {ledger} ({', '.join(columns)})"
+            f" VALUES ({', '.join('?' * len(columns))})"
+        )
+        claimed = set()
+        for key in dict.fromkeys(
+            tuple(row[column] for column in columns) for row in rows
+        ):
+            cursor.execute(query, key)
+            if cursor.rowcount:
+                claimed.add(key)
+        return claimed
+
+    def _apply_games(self, cursor: sqlite3.Cursor, games: list[Row]) -> None:
+        claimed = self._claim(cursor, "applied_games", ("game_id",), games)
+        totals: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        for row in games:
+            if (row["game_id"],) in claimed:
+                claimed.discard((row["game_id"],))
+                if row["main_weather_code"] is None or row["sub_weather_code"] is None:
+                    continue
+                total = totals[(row["main_weather_code"], row["sub_weather_code"])]
+                total[0] += 1
+                total[1] += row["duration"]
+        cursor.executemany(
+            _UPSERT_WEATHER, [(*key, *total) for key, total in totals.items()]
+        )
+
+    def _apply_players(
+        self,
+        cursor: sqlite3.Cursor,
+        players: list[Row],
+        games: dict[int, Row],
+        known_games: dict[int, Row],
+    ) -> None:
+        games = {
+            row["game_id"]: games.get(row["game_id"]) or known_games[row["game_id"]]
+            for row in players
+            if row["game_id"] in games or row["game_id"] in known_games
+        }
+        players = [row for row in players if row["game_id"] in games]
+        claimed = self._claim(
+            cursor, "applied_players", ("game_id", "user_id"), players
+        )
+        totals: dict[tuple, list[int]] = defaultdict(lambda: [0] * 8)
+        for row in players:
+            key = (row["game_id"], row["user_id"])
+            if key not in claimed:
+                continue
+            claimed.discard(key)
+            game = games[row["game_id"]]
+            total = totals[(game["season_id"], row["character_id"], game["match_mode"])]
+            total[0] += 1
+            total[1] += bool(row["victory"])
+            total[2] += row["kills"]
+            total[3] += row["assists"]
+            total[4] += row["game_place_result"]
+            total[5] += row["damage_to_player"]
+            if row["mmr_gain"] is not None:
+                total[6] += row["mmr_gain"]
+                total[7] += 1
+        cursor.executemany(
+            _UPSERT_CHARACTER, [(*key, *total) for key, total in totals.items()]
+        )
+
+    def _apply_equipment(
+        self,
+        cursor: sqlite3.Cursor,
+        equipment: list[Row],
+        victories: dict[tuple[int, int], bool],
+        known_victories: dict[tuple[int, int], bool],
+    ) -> None:
+        # Only final equipment counts as a pick.
+        victories = {
+            player: (
+                victories[player] if player in victories else known_victories[player]
+            )
+            for player in {(row["game_id"], row["user_id"]) for row in equipment}
+            if player in victories or player in known_victories
+        }
+        equipment = [
+            row
+            for row in equipment
+            if row["type"] == 2 and (row["game_id"], row["user_id"]) in victories
+        ]
+        claimed = self._claim(
+            cursor, "applied_equipment", ("game_id", "user_id", "slot"), equipment
+        )
+        totals: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        for row in equipment:
+            player = (row["game_id"], row["user_id"])
+            key = (*player, row["slot"])
+            if key in claimed:
+                claimed.discard(key)
+                total = totals[(row["item_id"], row["slot"])]
+                total[0] += 1
+                total[1] += bool(victories[player])
+        cursor.executemany(
+            _UPSERT_ITEM, [(*key, *total) for key, total in totals.items()]
+        )
+
+    def apply_rows(
+        self,
+        table_rows: dict[str, list[Row]],
+        games: Optional[dict[int, Row]] = None,
+        victories: Optional[dict[tuple[int, int], bool]] = None,
+    ) -> None:
+        """Add table rows to the aggregates, skipping already counted entries.
+
+        Args:
+            table_rows (dict[str, list[Row]]): Rows of any SOURCE_TABLES, as
+                returned by `build_table_rows` or read from the database.
+            games (Optional[dict[int, Row]]): `games` rows by game ID, for player
+                rows whose game is not in `table_rows`.
+            victories (Optional[dict[tuple[int, int], bool]]): Victory per
+                (game_id, user_id), for equipment rows whose player is not in
+                `table_rows`.
+        """
+        batch_games = {row["game_id"]: row for row in table_rows.get("games", [])}
+        batch_victories = {
+            (row["game_id"], row["user_id"]): row["victory"]
+            for row in table_rows.get("player_game_stats", [])
+        }
+        with self._lock, self._connection:
+            cursor = self._connection.cursor()
+            self._apply_games(cursor, table_rows.get("games", []))
+            self._apply_players(
+                cursor,
+                table_rows.get("player_game_stats", []),
+                batch_games,
+                games or {},
+            )
+            self._apply_equipment(
+                cursor,
+                table_rows.get("equipment", []),
+                batch_victories,
+                victories or {},
+            )
+
+    def _lookup(self, query: str, parameters: tuple) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(query, parameters).fetchone()
+        return dict(row) if row else None
+
+    def character(
+        self, season_id: int, character_id: int, match_mode: int
+    ) -> Optional[dict[str, Any]]:
+        """Counts and sums of a character in a season and match mode, if played."""
+        return self._lookup(
+            "SELECT * FROM character_aggregates"
+            " WHERE season_id = ? AND character_id = ? AND match_mode = ?",
+            (season_id, character_id, match_mode),
+        )
+
+    def item(self, item_id: int, slot: int) -> Optional[dict[str, Any]]:
+        """Picks and wins of an item in an equipment slot, if picked."""
+        return self._lookup(
+            "SELECT * FROM item_aggregates WHERE item_id = ? AND slot = ?",
+            (item_id, slot),
+        )
+
+    def weather(self, main_weather: int, sub_weather: int) -> Optional[dict[str, Any]]:
+        """Game count and total duration of a weather combination, if seen."""
+        return self._lookup(
+            "SELECT * FROM weather_aggregates WHERE main_weather = ? AND sub_weather = ?",
+            (main_weather, sub_weather),
+        )
+
+    def rows(self, table: str) -> list[dict[str, Any]]:
+        """Every row of an aggregate table.
+
+        Raises:
+            ValueError: If the table is not an aggregate table.
+        """
+        if table not in (
+            "character_aggregates",
+            "item_aggregates",
+            "weather_aggregates",
+        ):
+            raise ValueError(f"Unknown aggregate table: {table}")
+        with self._lock:
+            return [
+                dict(row) for row in self._connection.execute(f"SELECT * FROM {table}")
+            ]
+
+
+def rebuild_aggregates(path: str, batches: Iterable[dict[str, list[Row]]]) -> None:
+    """Recompute the aggregates from scratch and swap them in atomically.
+
+    The new database is built next to `path` and replaces it once complete, so
+    readers keep seeing the previous aggregates until then. Games inserted into
+    the old database while the rebuild runs are not carried over.
+
+    Args:
+        path (str): The aggregate database to replace.
+        batches (Iterable[dict[str, list[Row]]]): Table row batches covering all
+            data. Batches may split a game's rows, but every game's `games` row and
+            every player's `player_game_stats` row must come no later than the
+            rows that refer to them.
+    """
+    building = f"{path}.building"
+    if os.path.exists(building):
+        os.remove(building)
+
+    store = AggregateStore(building)
+    games: dict[int, Row] = {}
+    victories: dict[tuple[int, int], bool] = {}
+    for table_rows in batches:
+        store.apply_rows(table_rows, games, victories)
+        # Keep only what later batches' player and equipment rows look up.
+        for row in table_rows.get("games", []):
+            games[row["game_id"]] = {
+                "season_id": row["season_id"],
+                "match_mode": row["match_mode"],
+            }
+        for row in table_rows.get("player_game_stats", []):
+            victories[(row["game_id"], row["user_id"])] = row["victory"]
+    store.close()
+    os.replace(building, path)
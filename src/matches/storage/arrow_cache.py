@@ -0,0 +1,403 @@
+"""
+Arrow IPC cache of the processed match archive.
+
+The cache holds the table rows of every archived player as uncompressed Arrow
+IPC files, so a season loads by memory-mapping its files instead of re-parsing
+JSON into UserGame objects. The columns are those of the Parquet export plus
+`season_id`.
+
+Rows are stored in segments, `<cache>/season_id=<n>/<table>/part-<segment>.arrow`,
+each holding the players of a set of archive files. Invalidation is driven by
+the archive index: the cache records the size and modification time of every
+archive file and the segment holding it. A refresh parses only the new files,
+once, into a new segment, so adding games never rewrites the rows already
+cached. A game's team files always share a segment, which keeps its `games` row
+unique: when one of them is added, rewritten or removed, the game's remaining
+files are parsed into the new segment, and the other games of the segment that
+held it are copied over from its Arrow files. Once there are more than
+`max_segments` segments, the smallest are merged the same way, without
+re-reading the archive.
+"""
+
+import json
+import os
+import shutil
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Iterable, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+from archive import archive_index, index_fingerprint
+from models.batch import UserGameBatch
+from processors.table_mappings import Row, TABLE_MAPPINGS
+from storage.atomic import atomic_write
+from storage.parquet_export import TABLE_SCHEMAS, add_user_games
+
+
+INDEX_FILE = "_cache_index.json"
+INDEX_VERSION = 2
+
+CACHE_SCHEMAS: dict[str, pa.Schema] = {
+    table: schema.append(pa.field("season_id", pa.int32()))
+    for table, schema in TABLE_SCHEMAS.items()
+}
+
+
+def _season_path(root: str, season_id: int) -> str:
+    return os.path.join(root, f"season_id={season_id}")
+
+
+def _part_path(root: str, season_id: int, table: str, segment: int) -> str:
+    return os.path.join(
+        _season_path(root, season_id), table, f"part-{segment:06d}.arrow"
+    )
+
+
+def _game_directory(path: str) -> str:
+    # Archive files are `<game_id>/team_<team_id>.json`.
+    return path.split(os.sep, 1)[0]
+
+
+class _SegmentWriter:
+    """PartitionSink streaming rows into the Arrow IPC files of one segment."""
+
+    def __init__(self, root: str, segment: int, max_buffered_rows: int):
+        self.root = root
+        self.segment = segment
+        self.max_buffered_rows = max_buffered_rows
+        self.seasons: set[int] = set()
+        self._buffers: dict[tuple[str, int], list[Row]] = defaultdict(list)
+        self._writers: dict[tuple[str, int], pa.ipc.RecordBatchFileWriter] = {}
+
+    def add(self, table: str, season_id: int, day: date, rows: list[Row]) -> None:
+        if not rows:
+            return
+        buffer = self._buffers[table, season_id]
+        buffer.extend(rows)
+        if len(buffer) >= self.max_buffered_rows:
+            self._write(table, season_id)
+
+    def _write(self, table: str, season_id: int) -> None:
+        rows = self._buffers.pop((table, season_id), [])
+        if not rows:
+            return
+        batch = pa.Table.from_pylist(rows, schema=TABLE_SCHEMAS[table])
+        batch = batch.append_column(
+            "season_id", pa.array([season_id] * len(rows), pa.int32())
+        )
+        self.write_table(table, season_id, batch)
+
+    def write_table(self, table: str, season_id: int, data: pa.Table) -> None:
+        """Append rows already in the cache schema, e.g. from another segment."""
+        if (table, season_id) not in self._writers:
+            path = _part_path(self.root, season_id, table, self.segment)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._writers[table, season_id] = pa.ipc.new_file(
+                path, CACHE_SCHEMAS[table]
+            )
+            self.seasons.add(season_id)
+        self._writers[table, season_id].write_table(data)
+
+    def close(self) -> None:
+        for table, season_id in list(self._buffers):
+            self._write(table, season_id)
+        for writer in self._writers.values():
+            writer.close()
+
+
+@dataclass
+class RefreshResult:
+    """Outcome of an ArrowCache refresh.
+
+    Attributes:
+        updated (set[int]): Seasons that got new or rebuilt rows.
+        removed (set[int]): Seasons dropped because no archive file holds them.
+        files_read (int): Archive files parsed during the refresh.
+        merged (int): Segments merged into one to bound their number.
+    """
+
+    updated: set[int] = field(default_factory=set)
+    removed: set[int] = field(default_factory=set)
+    files_read: int = 0
+    merged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.updated or self.removed or self.merged)
+
+
+class ArrowCache:
+    """Memory-mappable Arrow cache of the archive, refreshed from its index.
+
+    Args:
+        cache_dir (str): Directory holding the cache.
+        archive_dir (str): The archive root the cache is built from.
+        files_per_batch (int): Archive files parsed at once while building.
+        max_buffered_rows (int): Rows per table held in memory before they are
+            written as a record batch.
+        max_segments (int): Segments kept before the smallest are merged.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        archive_dir: str,
+        files_per_batch: int = 500,
+        max_buffered_rows: int = 131_072,
+        max_segments: int = 32,
+    ):
+        self.cache_dir = cache_dir
+        self.archive_dir = archive_dir
+        self.files_per_batch = files_per_batch
+        self.max_buffered_rows = max_buffered_rows
+        self.max_segments = max_segments
+
+    def _load_index(self) -> dict[str, Any]:
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        if state.get("version") != INDEX_VERSION:
+            # No cache yet, or one laid out by an older version: start over.
+            state = {"version": INDEX_VERSION, "fingerprint": None, "files": {}}
+            state.update(segments={}, next_segment=0)
+        return state
+
+    def _save_index(self, state: dict[str, Any]) -> None:
+        atomic_write(
+            os.path.join(self.cache_dir, INDEX_FILE),
+            lambda f: json.dump(state, f),
+            "w",
+        )
+
+    @property
+    def seasons(self) -> list[int]:
+        """Seasons present in the cache."""
+        segments = self._load_index()["segments"]
+        return sorted({season for seasons in segments.values() for season in seasons})
+
+    def is_stale(self) -> bool:
+        """Whether the archive changed since the cache was last refreshed."""
+        current = index_fingerprint(archive_index(self.archive_dir))
+        return current != self._load_index()["fingerprint"]
+
+    def refresh(self, rebuild: bool = False) -> RefreshResult:
+        """Bring the cache up to date with the archive.
+
+        New and rewritten archive files are parsed once, into a new segment,
+        along with the other team files of their games. The rows of other games
+        in segments touched by the change are copied over from their Arrow
+        files; untouched segments are kept as is.
+
+        Args:
+            rebuild (bool): Rebuild the whole cache regardless of the index.
+
+        Returns:
+            RefreshResult: The seasons updated or removed.
+        """
+        result = RefreshResult()
+        index = archive_index(self.archive_dir)
+        fingerprint = index_fingerprint(index)
+        state = self._load_index()
+        if not rebuild and fingerprint == state["fingerprint"]:
+            return result
+        # Drop what an interrupted refresh may have left behind.
+        self._remove_unlisted(state)
+
+        previous = state["files"]
+        changed = {
+            _game_directory(path)
+            for path, entry in previous.items()
+            if rebuild or tuple(entry[:2]) != index.get(path)
+        }
+        changed.update(_game_directory(path) for path in index if path not in previous)
+        stale = {
+            entry[2]
+            for path, entry in previous.items()
+            if _game_directory(path) in changed
+        }
+        files = {
+            path: entry for path, entry in previous.items() if entry[2] not in stale
+        }
+        segments = {
+            segment: seasons
+            for segment, seasons in state["segments"].items()
+            if int(segment) not in stale
+        }
+
+        # Unchanged games of stale segments are copied, which needs the game IDs
+        # the changed files belong to.
+        changed_games = {int(name) for name in changed if name.isdigit()}
+        copy = not rebuild and len(changed_games) == len(changed)
+        moved = sorted(path for path in index if path not in files)
+        paths = [path for path in moved if not copy or _game_directory(path) in changed]
+        if moved:
+            segment = state["next_segment"]
+            state["next_segment"] += 1
+            writer = _SegmentWriter(self.cache_dir, segment, self.max_buffered_rows)
+            if copy:
+                for source in sorted(stale):
+                    self._copy(
+                        writer, source, state["segments"][str(source)], changed_games
+                    )
+            self._parse(writer, paths, result)
+            writer.close()
+            segments[str(segment)] = sorted(writer.seasons)
+            for path in moved:
+                files[path] = [*index[path], segment]
+            result.updated.update(writer.seasons)
+
+        live = {season for seasons in segments.values() for season in seasons}
+        result.removed = {
+            season
+            for segment in stale
+            for season in state["segments"][str(segment)]
+            if season not in live
+        }
+        state.update(fingerprint=fingerprint, files=files, segments=segments)
+        if len(segments) > self.max_segments:
+            result.merged = self._merge(state)
+        # The index only lists finished segments, so files are dropped after it
+        # is saved and a crash at any point leaves a consistent cache.
+        self._save_index(state)
+        self._remove_unlisted(state)
+        return result
+
+    def _parse(
+        self, writer: "_SegmentWriter", paths: list[str], result: RefreshResult
+    ) -> None:
+        exported_games: set[int] = set()
+        tables = list(TABLE_MAPPINGS)
+        for start in range(0, len(paths), self.files_per_batch):
+            chunk = [
+                os.path.join(self.archive_dir, path)
+                for path in paths[start : start + self.files_per_batch]
+            ]
+            batch = UserGameBatch.from_json_files(chunk)
+            result.files_read += len(chunk)
+            add_user_games(writer, batch.to_user_games(), tables, exported_games)
+
+    def _copy(
+        self,
+        writer: "_SegmentWriter",
+        segment: int,
+        seasons: list[int],
+        exclude_games: Optional[set[int]] = None,
+    ) -> None:
+        """Copy the rows of a segment into another, minus some games."""
+        excluded = pa.array(sorted(exclude_games or ()), pa.int64())
+        for season_id in seasons:
+            for table in TABLE_MAPPINGS:
+                path = _part_path(self.cache_dir, season_id, table, segment)
+                if not os.path.exists(path):
+                    continue
+                with pa.memory_map(path, "r") as mapped:
+                    data = pa.ipc.open_file(mapped).read_all()
+                    if len(excluded):
+                        data = data.filter(
+                            pc.invert(pc.is_in(data["game_id"], value_set=excluded))
+                        )
+                    if data.num_rows:
+                        writer.write_table(table, season_id, data)
+
+    def _merge(self, state: dict[str, Any]) -> int:
+        """Merge the smallest segments into a new one, leaving `max_segments / 2`.
+
+        The merged rows are copied from the Arrow files, so no archive file is
+        parsed. Returns the number of segments merged.
+        """
+        files_per_segment: dict[int, int] = defaultdict(int)
+        for entry in state["files"].values():
+            files_per_segment[entry[2]] += 1
+        by_size = sorted(map(int, state["segments"]), key=files_per_segment.get)
+        merged = by_size[: len(by_size) - self.max_segments // 2 + 1]
+        segment = state["next_segment"]
+        state["next_segment"] += 1
+
+        writer = _SegmentWriter(self.cache_dir, segment, self.max_buffered_rows)
+        for source in merged:
+            self._copy(writer, source, state["segments"][str(source)])
+        writer.close()
+
+        merged_set = set(merged)
+        for entry in state["files"].values():
+            if entry[2] in merged_set:
+                entry[2] = segment
+        for source in merged:
+            del state["segments"][str(source)]
+        state["segments"][str(segment)] = sorted(writer.seasons)
+        return len(merged)
+
+    def _remove_unlisted(self, state: dict[str, Any]) -> None:
+        """Delete the files of segments the index no longer lists."""
+        listed = {
+            (int(season), table, f"part-{int(segment):06d}.arrow")
+            for segment, seasons in state["segments"].items()
+            for season in seasons
+            for table in TABLE_MAPPINGS
+        }
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and entry.name.startswith(".building-"):
+                # Season builds of an older cache layout.
+                shutil.rmtree(entry.path, ignore_errors=True)
+            if not entry.is_dir() or not entry.name.startswith("season_id="):
+                continue
+            season_id = int(entry.name.split("=", 1)[1])
+            for table in os.listdir(entry.path):
+                table_dir = os.path.join(entry.path, table)
+                if not os.path.isdir(table_dir):
+                    # Season files of an older cache layout.
+                    os.remove(table_dir)
+                    continue
+                for name in os.listdir(table_dir):
+                    if (season_id, table, name) not in listed:
+                        os.remove(os.path.join(table_dir, name))
+                if not os.listdir(table_dir):
+                    os.rmdir(table_dir)
+            if not os.listdir(entry.path):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def load(
+        self,
+        seasons: Optional[Iterable[int]] = None,
+        tables: Optional[Iterable[str]] = None,
+    ) -> dict[str, pa.Table]:
+        """Memory-map cached tables without copying or parsing them.
+
+        The returned tables reference the mapped files, so loading costs no more
+        than reading the IPC footers; pages are only read when columns are used.
+
+        Args:
+            seasons (Optional[Iterable[int]]): Seasons to load, all when omitted.
+            tables (Optional[Iterable[str]]): Tables to load, all when omitted.
+
+        Returns:
+            dict[str, pa.Table]: The tables by name, with one chunk per season,
+            segment and record batch.
+        """
+        segments = self._load_index()["segments"]
+        wanted = None if seasons is None else set(seasons)
+        parts_of = sorted(
+            (season, int(segment))
+            for segment, segment_seasons in segments.items()
+            for season in segment_seasons
+            if wanted is None or season in wanted
+        )
+        tables = list(TABLE_MAPPINGS) if tables is None else list(tables)
+        loaded = {}
+        for table in tables:
+            parts = []
+            for season_id, segment in parts_of:
+                path = _part_path(self.cache_dir, season_id, table, segment)
+                if os.path.exists(path):
+                    # The table's buffers keep the mapping open.
+                    source = pa.memory_map(path, "r")
+                    parts.append(pa.ipc.open_file(source).read_all())
+            loaded[table] = (
+                pa.concat_tables(parts) if parts else CACHE_SCHEMAS[table].empty_table()
+            )
+        return loaded
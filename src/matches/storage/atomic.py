@@ -0,0 +1,49 @@
+"""
+Atomic file replacement.
+
+A file is written to a temporary file in its destination's directory, flushed
+to disk and renamed over the destination, so readers, and a crash at any point,
+see either the previous file or the complete new one, never a partial write.
+"""
+
+import os
+import tempfile
+from typing import IO, Any, Callable
+
+
+def atomic_write(path: str, write: Callable[[IO[Any]], None], mode: str = "wb") -> None:
+    """Write a file atomically, replacing the previous one if any.
+
+    Args:
+        path (str): The file to write. It is used as is: writers handed the
+            open file, like `np.savez`, add no suffix to it.
+        write (Callable[[IO[Any]], None]): Writes the content to the open file.
+        mode (str): The mode to open the temporary file in, "w" for text.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        mode, dir=directory, prefix=f".{os.path.basename(path)}-", delete=False
+    ) as f:
+        try:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+    fsync_directory(directory)
+
+
+def fsync_directory(directory: str) -> None:
+    """Flush a directory's entries, such as a rename into it, to disk."""
+    if os.name != "posix":
+        # Directories cannot be opened for syncing elsewhere.
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,406 @@
+"""
+Per-user MMR time series.
+
+Every ranked player row adds one point to its user's series: the game's start
+time (UTC seconds), its game ID and the MMR after the game. Points are appended to
+a binary log as they are inserted and periodically compacted into `series.npz`,
+which stores the users' series back to back, sorted by user then time:
+
+- `users` and `offsets`: the sorted user IDs and where their points start,
+- per column (`time`, `game_id`, `mmr`): the first value of every user and the
+  differences between consecutive points, in the narrowest integer type that
+  holds them.
+
+MMR moves by tens of points per game and games are minutes to days apart, so the
+differences mostly fit in 16 or 32 bits. A user's history decodes with a cumsum
+over their slice; snapshots over all users decode every series at once. Game
+start times must fall between 1970 and 2106 to fit the 32-bit snapshot keys.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Union
+import numpy as np
+from models.game import UserGame
+from processors.table_mappings import Row
+from storage.atomic import atomic_write
+
+
+SERIES_FILE = "series.npz"
+LOG_FILE = "append.log"
+COLUMNS = ("time", "game_id", "mmr")
+_LOG_DTYPE = np.dtype(
+    [("user_id", "<i8"), ("time", "<i8"), ("game_id", "<i8"), ("mmr", "<i4")]
+)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Timestamp = Union[datetime, str]
+
+
+def _seconds(moment: Timestamp) -> int:
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int((moment - _EPOCH).total_seconds())
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    """Cast integers to the narrowest signed type holding all of them."""
+    if not len(values):
+        return values.astype(np.int16)
+    low, high = int(values.min()), int(values.max())
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+class _Series:
+    """Delta-encoded series of every user, sorted by user then time."""
+
+    def __init__(
+        self,
+        users: np.ndarray,
+        offsets: np.ndarray,
+        starts: dict[str, np.ndarray],
+        deltas: dict[str, np.ndarray],
+    ):
+        self.users = users
+        self.offsets = offsets
+        self.starts = starts
+        self.deltas = deltas
+
+    @classmethod
+    def empty(cls) -> "_Series":
+        return cls(
+            np.empty(0, np.int64),
+            np.zeros(1, np.int64),
+            {column: np.empty(0, np.int64) for column in COLUMNS},
+            {column: np.empty(0, np.int16) for column in COLUMNS},
+        )
+
+    @classmethod
+    def encode(cls, points: dict[str, np.ndarray]) -> "_Series":
+        """Encode decoded points, deduplicating games and sorting by time."""
+        # Keep one point per user and game, then order by user, time and game.
+        order = np.lexsort((points["game_id"], points["user_id"]))
+        user_id, game_id = points["user_id"][order], points["game_id"][order]
+        unique = order[
+            np.r_[True, (user_id[1:] != user_id[:-1]) | (game_id[1:] != game_id[:-1])]
+        ]
+        points = {name: values[unique] for name, values in points.items()}
+        order = np.lexsort((points["game_id"], points["time"], points["user_id"]))
+        points = {name: values[order] for name, values in points.items()}
+
+        users, first, counts = np.unique(
+            points["user_id"], return_index=True, return_counts=True
+        )
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        starts, deltas = {}, {}
+        for column in COLUMNS:
+            values = points[column].astype(np.int64)
+            delta = np.diff(values, prepend=values[:1])
+            delta[first] = 0
+            starts[column] = values[first]
+            deltas[column] = _narrow(delta)
+        return cls(users, offsets, starts, deltas)
+
+    def decode(self) -> dict[str, np.ndarray]:
+        """Every point, with absolute values and its user_id."""
+        counts = np.diff(self.offsets)
+        user_index = np.repeat(np.arange(len(self.users)), counts)
+        points = {"user_id": self.users[user_index]}
+        for column in COLUMNS:
+            running = np.cumsum(self.deltas[column], dtype=np.int64)
+            base = self.starts[column] - running[self.offsets[:-1]]
+            points[column] = base[user_index] + running
+        return points
+
+    def user(self, user_id: int) -> dict[str, np.ndarray]:
+        """The decoded points of one user, empty if unknown."""
+        position = np.searchsorted(self.users, user_id)
+        if position == len(self.users) or self.users[position] != user_id:
+            return {column: np.empty(0, np.int64) for column in COLUMNS}
+        points = slice(self.offsets[position], self.offsets[position + 1])
+        return {
+            column: self.starts[column][position]
+            + np.cumsum(self.deltas[column][points], dtype=np.int64)
+            for column in COLUMNS
+        }
+
+
+class MMRSeriesStore:
+    """Append-only MMR history per user, safe to append to from worker threads.
+
+    Args:
+        path (str): Directory holding the compacted series and the append log,
+            created if missing.
+        compact_every (int): Logged points that trigger a compaction.
+    """
+
+    def __init__(self, path: str, compact_every: int = 100_000):
+        self.path = path
+        self.compact_every = compact_every
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._series = self._load_series()
+        self._pending = self._load_log()
+        self._merged: Optional[_Series] = None
+
+    def _load_series(self) -> _Series:
+        try:
+            with np.load(os.path.join(self.path, SERIES_FILE)) as data:
+                return _Series(
+                    data["users"],
+                    data["offsets"],
+                    {column: data[f"{column}_start"] for column in COLUMNS},
+                    {column: data[f"{column}_delta"] for column in COLUMNS},
+                )
+        except FileNotFoundError:
+            return _Series.empty()
+
+    def _load_log(self) -> list[np.ndarray]:
+        log_path = os.path.join(self.path, LOG_FILE)
+        if not os.path.exists(log_path):
+            return []
+        with open(log_path, "rb") as f:
+            data = f.read()
+        # Drop a record torn by an interrupted append so later ones stay aligned.
+        usable = len(data) - len(data) % _LOG_DTYPE.itemsize
+        if usable < len(data):
+            os.truncate(log_path, usable)
+        records = np.frombuffer(data[:usable], dtype=_LOG_DTYPE)
+        return [records] if len(records) else []
+
+    def append(
+        self,
+        user_id: np.ndarray,
+        time: np.ndarray,
+        game_id: np.ndarray,
+        mmr: np.ndarray,
+    ) -> None:
+        """Append points; games a user already has are ignored when merged.
+
+        Args:
+            user_id (np.ndarray): User of every point.
+            time (np.ndarray): Game start time of every point, in UTC seconds.
+            game_id (np.ndarray): Game of every point.
+            mmr (np.ndarray): MMR after the game of every point.
+        """
+        records = np.empty(len(user_id), dtype=_LOG_DTYPE)
+        records["user_id"] = user_id
+        records["time"] = time
+        records["game_id"] = game_id
+        records["mmr"] = mmr
+        if not len(records):
+            return
+        with self._lock:
+            with open(os.path.join(self.path, LOG_FILE), "ab") as f:
+                records.tofile(f)
+            self._pending.append(records)
+            self._merged = None
+            if sum(len(pending) for pending in self._pending) >= self.compact_every:
+                self._compact()
+
+    def append_rows(self, rows: list[Row]) -> None:
+        """Append the ranked players of `player_game_stats` rows.
+
+        Rows without `mmr_after`, i.e. unranked games, are skipped.
+        """
+        rows = [row for row in rows if row.get("mmr_after") is not None]
+        self.append(
+            np.array([row["user_id"] for row in rows], np.int64),
+            np.array([_seconds(row["game_start_time"]) for row in rows], np.int64),
+            np.array([row["game_id"] for row in rows], np.int64),
+            np.array([row["mmr_after"] for row in rows], np.int32),
+        )
+
+    def append_games(self, games: Iterable[UserGame]) -> None:
+        """Append the ranked players among validated games."""
+        games = [game for game in games if game.mmr_after is not None]
+        self.append(
+            np.array([game.user_id for game in games], np.int64),
+            np.array([_seconds(game.game_start_datetime) for game in games], np.int64),
+            np.array([game.game_id for game in games], np.int64),
+            np.array([game.mmr_after for game in games], np.int32),
+        )
+
+    def _current(self) -> _Series:
+        """The compacted series merged with the logged points, cached."""
+        if not self._pending:
+            return self._series
+        if self._merged is None:
+            points = self._series.decode()
+            for records in self._pending:
+                for name in points:
+                    points[name] = np.concatenate(
+                        [points[name], records[name].astype(np.int64)]
+                    )
+            self._merged = _Series.encode(points)
+        return self._merged
+
+    def _compact(self) -> None:
+        series = self._current()
+        arrays = {
+            "users": series.users,
+            "offsets": series.offsets,
+            **{f"{column}_start": series.starts[column] for column in COLUMNS},
+            **{f"{column}_delta": series.deltas[column] for column in COLUMNS},
+        }
+        atomic_write(
+            os.path.join(self.path, SERIES_FILE), lambda f: np.savez(f, **arrays)
+        )
+        # The log is only emptied once its points are durably in the compacted
+        # file, which `atomic_write` has synced to disk along with its rename.
+        open(os.path.join(self.path, LOG_FILE), "wb").close()
+        self._series, self._pending, self._merged = series, [], None
+
+    def compact(self) -> None:
+        """Merge the append log into the compacted series file."""
+        with self._lock:
+            self._compact()
+
+    @property
+    def users(self) -> np.ndarray:
+        """Sorted IDs of the users with at least one point."""
+        with self._lock:
+            return self._current().users
+
+    def history(
+        self,
+        user_id: int,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> dict[str, np.ndarray]:
+        """A user's points in time order, optionally within [start, end).
+
+        Args:
+            user_id (int): The user.
+            start (Optional[Timestamp]): First game start time to include.
+            end (Optional[Timestamp]): Game start time to stop before.
+
+        Returns:
+            dict[str, np.ndarray]: `time` as datetime64[s] and `game_id` and `mmr`
+            as int64, one entry per game.
+        """
+        with self._lock:
+            points = self._current().user(user_id)
+        low = 0 if start is None else np.searchsorted(points["time"], _seconds(start))
+        high = (
+            len(points["time"])
+            if end is None
+            else np.searchsorted(points["time"], _seconds(end))
+        )
+        points = {column: values[low:high] for column, values in points.items()}
+        points["time"] = points["time"].astype("datetime64[s]")
+        return points
+
+    def downsample(
+        self,
+        user_id: int,
+        interval: timedelta,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        how: str = "last",
+    ) -> dict[str, np.ndarray]:
+        """A user's MMR reduced to one value per fixed interval with games.
+
+        Args:
+            user_id (int): The user.
+            interval (timedelta): Width of the buckets, aligned on the epoch.
+            start (Optional[Timestamp]): First game start time to include.
+            end (Optional[Timestamp]): Game start time to stop before.
+            how (str): "last", "min", "max" or "mean" MMR per bucket.
+
+        Returns:
+            dict[str, np.ndarray]: Bucket start `time` as datetime64[s], `mmr` and
+            the number of `games` per bucket.
+
+        Raises:
+            ValueError: If `how` is unknown.
+        """
+        if how not in ("last", "min", "max", "mean"):
+            raise ValueError(f"Unknown reduction: {how}")
+        points = self.history(user_id, start, end)
+        if not len(points["time"]):
+            # An unknown user, or no game in the window.
+            return {
+                "time": np.array([], "datetime64[s]"),
+                "mmr": (
+                    points["mmr"].astype(np.float64) if how == "mean" else points["mmr"]
+                ),
+                "games": np.array([], np.int64),
+            }
+        width = int(interval.total_seconds())
+        bucket = points["time"].astype(np.int64) // width
+        first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        games = np.diff(np.r_[first, len(bucket)])
+        mmr = points["mmr"]
+        if how == "last":
+            values = mmr[first + games - 1]
+        elif how == "min":
+            values = np.minimum.reduceat(mmr, first)
+        elif how == "max":
+            values = np.maximum.reduceat(mmr, first)
+        else:
+            values = np.add.reduceat(mmr, first) / games
+        return {
+            "time": (bucket[first] * width).astype("datetime64[s]"),
+            "mmr": values,
+            "games": games,
+        }
+
+    def snapshots(
+        self,
+        dates: Iterable[Timestamp],
+        percentiles: Iterable[float] = (10, 25, 50, 75, 90),
+        active_within: Optional[timedelta] = None,
+    ) -> list[dict[str, float]]:
+        """MMR percentiles over all users as of each date.
+
+        Every user counts with the MMR of their last game before the date.
+
+        Args:
+            dates (Iterable[Timestamp]): Moments to take snapshots at.
+            percentiles (Iterable[float]): Percentiles to compute, 0 to 100.
+            active_within (Optional[timedelta]): Only count users whose last game
+                before the date is at most this old.
+
+        Returns:
+            list[dict[str, float]]: Per date, the `users` counted and every
+            percentile keyed `p<percentile>`, NaN without users.
+        """
+        with self._lock:
+            series = self._current()
+        points = series.decode()
+        percentiles = list(percentiles)
+        # Points are sorted by user then time, so these (user, time) keys are too.
+        user_index = np.repeat(np.arange(len(series.users)), np.diff(series.offsets))
+        keys = (user_index << 32) | points["time"]
+        snapshots = []
+        for moment in dates:
+            seconds = _seconds(moment)
+            # Position of each user's first point at or after the date.
+            ends = np.searchsorted(keys, (np.arange(len(series.users)) << 32) | seconds)
+            last = ends - 1
+            counted = last >= series.offsets[:-1]
+            if active_within is not None:
+                counted &= points["time"][np.maximum(last, 0)] >= seconds - int(
+                    active_within.total_seconds()
+                )
+            values = points["mmr"][last[counted]]
+            snapshot: dict[str, float] = {"users": int(counted.sum())}
+            for q, value in zip(
+                percentiles,
+                (
+                    np.percentile(values, percentiles)
+                    if len(values)
+                    else [np.nan] * len(percentiles)
+                ),
+            ):
+                snapshot[f"p{q:g}"] = float(value)
+            snapshots.append(snapshot)
+        return snapshots
@@ -0,0 +1,597 @@
+"""
+Parquet export of the match tables.
+
+Every table in TABLE_MAPPINGS is written as a hive-partitioned Parquet dataset,
+`<root>/<table>/season_id=<season>/start_date=<YYYY-MM-DD>/part-<n>.parquet`,
+readable with `pyarrow.dataset.dataset(path, partitioning="hive")` or any engine
+understanding hive partitions. Start dates are UTC calendar dates.
+
+Exports are incremental: a successful run records what it exported in
+`<root>/_export_state.json`, and the next run only rewrites the partitions that
+new rows fall into, whatever their start date. For the archive, the state is
+the size and modification time of every archive file, like the Arrow cache's
+index, and only new or rewritten files are parsed; their partitions are merged
+with the rows already exported. For the database, it is the number of games and
+players per partition, and the partitions whose counts changed are re-read.
+"""
+
+import json
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timezone
+from typing import Any, Iterable, Iterator, Optional, Protocol
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from models.batch import FIELD_KINDS, UserGameBatch
+from models.game import UserGame
+from processors.table_mappings import Row, TABLE_MAPPINGS, TableMapping, player_keys
+from archive import archive_index, load_archive_file
+from analytics.enrichment import Enricher
+from storage.atomic import atomic_write
+
+
+STATE_FILE = "_export_state.json"
+STATE_VERSION = 2
+PARTITION_COLUMNS = ("season_id", "start_date")
+
+_KIND_TYPES: dict[str, pa.DataType] = {
+    "id": pa.int64(),
+    "int": pa.int32(),
+    "bool": pa.bool_(),
+    "optional_int": pa.int32(),
+    "str": pa.string(),
+}
+_KEY_TYPES: dict[str, pa.DataType] = {
+    "game_id": pa.int64(),
+    "user_id": pa.int64(),
+    "game_start_time": pa.timestamp("ms", tz="UTC"),
+}
+# Types of the columns produced by the child tables' `explode` functions.
+_CHILD_TYPES: dict[str, pa.DataType] = {
+    "mastery_type": pa.int32(),
+    "level": pa.int32(),
+    "slot": pa.int32(),
+    "item_id": pa.int32(),
+    "type": pa.int8(),
+    "skill_level": pa.int32(),
+    "skill_id": pa.int32(),
+    "killed_by_id": pa.int64(),
+    "killed_by_type": pa.string(),
+    "killed_by_name": pa.string(),
+    "died_area": pa.string(),
+    "killed_by_character": pa.string(),
+    "killed_by_character_weapon": pa.string(),
+    "purchase_type": pa.string(),
+    "quantity": pa.int32(),
+}
+_CHILD_COLUMNS: dict[str, tuple[str, ...]] = {
+    "mastery_levels": ("mastery_type", "level"),
+    "equipment": ("slot", "item_id", "type"),
+    "skill_order": ("skill_level", "skill_id"),
+    "killed_by_data": (
+        "killed_by_id",
+        "killed_by_type",
+        "killed_by_name",
+        "died_area",
+        "killed_by_character",
+        "killed_by_character_weapon",
+    ),
+    "items_purchased": ("item_id", "purchase_type", "quantity"),
+}
+
+
+def table_schema(mapping: TableMapping) -> pa.Schema:
+    """Build the Parquet schema of a mapped table, without partition columns.
+
+    Args:
+        mapping (TableMapping): The table's mapping.
+
+    Returns:
+        pa.Schema: The file schema of the table.
+    """
+    fields = [pa.field(key, _KEY_TYPES[key]) for key in mapping.keys]
+    fields += [
+        pa.field(column, _KIND_TYPES[FIELD_KINDS[attribute]])
+        for column, attribute in mapping.columns.items()
+        if column not in PARTITION_COLUMNS
+    ]
+    fields += [
+        pa.field(column, _CHILD_TYPES[column])
+        for column in _CHILD_COLUMNS.get(mapping.table, ())
+    ]
+    return pa.schema(fields)
+
+
+TABLE_SCHEMAS: dict[str, pa.Schema] = {
+    table: table_schema(mapping) for table, mapping in TABLE_MAPPINGS.items()
+}
+
+
+def start_date(game_start_time: datetime) -> date:
+    """The UTC calendar date a game started on, used as its partition."""
+    return game_start_time.astimezone(timezone.utc).date()
+
+
+def load_state(root: str) -> dict[str, Any]:
+    """Read what the last successful run exported, empty if there is none.
+
+    State written by an older version, which only recorded a start date, is
+    ignored, so the next run exports everything again.
+    """
+    try:
+        with open(os.path.join(root, STATE_FILE), "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return state if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(root: str, state: dict[str, Any]) -> None:
+    """Atomically record what a run exported."""
+    atomic_write(
+        os.path.join(root, STATE_FILE),
+        lambda f: json.dump({**state, "version": STATE_VERSION}, f),
+        "w",
+    )
+
+
+def _partition_key(season_id: int, day: date) -> str:
+    return f"{season_id}/{day.isoformat()}"
+
+
+def _parse_partition_key(key: str) -> tuple[int, date]:
+    season_id, day = key.split("/")
+    return int(season_id), date.fromisoformat(day)
+
+
+class PartitionSink(Protocol):
+    """Anything accepting table rows by season and start date partition."""
+
+    def add(self, table: str, season_id: int, day: date, rows: list[Row]) -> None: ...
+
+
+@dataclass
+class ExportSummary:
+    """Outcome of an export.
+
+    Attributes:
+        rows (dict[str, int]): Rows written per table.
+        files (int): Parquet files written.
+        partitions (int): Partitions (re)written, across tables.
+        skipped_rows (int): Rows read but left out, as their partition has not
+            changed since the last export.
+    """
+
+    rows: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    files: int = 0
+    partitions: int = 0
+    skipped_rows: int = 0
+
+
+class PartitionedParquetWriter:
+    """Buffer table rows per partition and write them as Parquet files.
+
+    Rows of partitions outside `partitions` are skipped. A partition has its
+    existing files replaced the first time this writer touches it, so a rerun
+    rewrites rather than duplicates it; after `replace_games`, the rows it
+    already holds are merged in instead. Rows are buffered until
+    `max_buffered_rows` is reached, then every buffered partition is written as
+    one sorted file, cut into row groups of `row_group_size` rows.
+
+    Args:
+        root (str): The dataset root directory.
+        partitions (Optional[set[tuple[int, date]]]): The (season, start date)
+            partitions to (re)write, None for all.
+        row_group_size (int): Rows per Parquet row group.
+        max_buffered_rows (int): Rows held in memory before flushing to files.
+        compression (str): Parquet compression codec.
+        enricher (Optional[Enricher]): Adds name columns for the tables' ID
+            columns, e.g. `character_name` next to `character_id`.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        partitions: Optional[set[tuple[int, date]]] = None,
+        row_group_size: int = 131_072,
+        max_buffered_rows: int = 1_000_000,
+        compression: str = "zstd",
+        enricher: Optional[Enricher] = None,
+    ):
+        self.root = root
+        self.partitions = partitions
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.compression = compression
+        self.enricher = enricher
+        self.summary = ExportSummary()
+        self._buffers: dict[tuple[str, int, date], list[Row]] = defaultdict(list)
+        self._buffered_rows = 0
+        self._file_counts: dict[tuple[str, int, date], int] = {}
+        self._merge = False
+        self._replaced_games = pa.array([], pa.int64())
+        self._stale: set[tuple[int, date]] = set()
+
+    def partition_path(self, table: str, season_id: int, day: date) -> str:
+        return os.path.join(
+            self.root, table, f"season_id={season_id}", f"start_date={day.isoformat()}"
+        )
+
+    def add(self, table: str, season_id: int, day: date, rows: list[Row]) -> None:
+        """Queue rows of a table for the partition of a season and start date."""
+        if not rows:
+            return
+        if self.partitions is not None and (season_id, day) not in self.partitions:
+            self.summary.skipped_rows += len(rows)
+            return
+
+        self._buffers[(table, season_id, day)].extend(rows)
+        self._buffered_rows += len(rows)
+        if self._buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def replace_games(
+        self, game_ids: Iterable[int], partitions: Iterable[tuple[int, date]]
+    ) -> None:
+        """Add to the rows already exported rather than replace them.
+
+        Every partition this writer touches keeps its exported rows, except
+        those of `game_ids`, whose rows are being written anew. `partitions`,
+        the ones those games were exported to, are rewritten on close even if no
+        new row falls into them.
+        """
+        self._merge = True
+        self._replaced_games = pa.array(sorted(set(game_ids)), pa.int64())
+        self._stale.update(partitions)
+
+    def _open_partition(self, key: tuple[str, int, date]) -> tuple[str, pa.Table]:
+        """The partition's directory, and on its first write in this run, the
+        previously exported rows to keep; their files are removed."""
+        path = self.partition_path(*key)
+        kept = TABLE_SCHEMAS[key[0]].empty_table()
+        if key not in self._file_counts:
+            # First write to the partition in this run: drop the previous export.
+            if os.path.isdir(path):
+                files = sorted(
+                    os.path.join(path, file)
+                    for file in os.listdir(path)
+                    if file.endswith(".parquet")
+                )
+                if self._merge and files:
+                    kept = self._read_kept(key[0], files)
+                for file in files:
+                    os.remove(file)
+            os.makedirs(path, exist_ok=True)
+            self._file_counts[key] = 0
+            self.summary.partitions += 1
+        return path, kept
+
+    def _read_kept(self, table: str, files: list[str]) -> pa.Table:
+        schema = TABLE_SCHEMAS[table]
+        # Name columns are added again, in this run's languages.
+        kept = pa.concat_tables(
+            [pq.ParquetFile(file).read(columns=schema.names) for file in files]
+        ).cast(schema)
+        if len(self._replaced_games):
+            kept = kept.filter(
+                pc.invert(pc.is_in(kept["game_id"], value_set=self._replaced_games))
+            )
+        return kept
+
+    def flush(self) -> None:
+        """Write every buffered partition as a new Parquet file."""
+        for key, rows in self._buffers.items():
+            self._write(key, rows)
+        self._buffers.clear()
+        self._buffered_rows = 0
+
+    def _write(self, key: tuple[str, int, date], rows: list[Row]) -> None:
+        table = key[0]
+        path, kept = self._open_partition(key)
+        arrow_table = pa.Table.from_pylist(rows, schema=TABLE_SCHEMAS[table])
+        if kept.num_rows:
+            arrow_table = pa.concat_tables([kept, arrow_table])
+        if arrow_table.num_rows:
+            if self.enricher is not None:
+                arrow_table = self.enricher.enrich_table(arrow_table)
+            sort_keys = [
+                (column, "ascending")
+                for column in ("game_id", "user_id")
+                if column in arrow_table.column_names
+            ]
+            pq.write_table(
+                arrow_table.sort_by(sort_keys),
+                os.path.join(path, f"part-{self._file_counts[key]:05d}.parquet"),
+                row_group_size=self.row_group_size,
+                compression=self.compression,
+            )
+            self._file_counts[key] += 1
+            self.summary.files += 1
+            self.summary.rows[table] += len(rows)
+        elif not os.listdir(path):
+            # Every row of the partition was replaced by nothing.
+            os.rmdir(path)
+
+    def close(self) -> ExportSummary:
+        """Flush the remaining rows and return the export summary.
+
+        Partitions of replaced games that received no new row are rewritten
+        without those games.
+        """
+        self.flush()
+        for season_id, day in sorted(self._stale):
+            for table in TABLE_SCHEMAS:
+                key = (table, season_id, day)
+                if key not in self._file_counts and os.path.isdir(
+                    self.partition_path(*key)
+                ):
+                    self._write(key, [])
+        self._stale.clear()
+        return self.summary
+
+
+def add_user_games(
+    writer: PartitionSink,
+    games: Iterable[UserGame],
+    tables: Iterable[str],
+    exported_games: set[int],
+) -> None:
+    """Partition the table rows of validated players into the writer.
+
+    Args:
+        writer (PartitionSink): The dataset writer.
+        games (Iterable[UserGame]): The players' game data.
+        tables (Iterable[str]): Tables to export.
+        exported_games (set[int]): IDs of the games whose `games` row was already
+            exported, updated in place. Every player of a game shares the row.
+    """
+    mappings = [TABLE_MAPPINGS[table] for table in tables]
+    for game_data in games:
+        keys = {
+            **player_keys(game_data),
+            "game_start_time": game_data.game_start_datetime,
+        }
+        day = start_date(game_data.game_start_datetime)
+        for mapping in mappings:
+            if mapping.table == "games":
+                if game_data.game_id in exported_games:
+                    continue
+                exported_games.add(game_data.game_id)
+            writer.add(
+                mapping.table,
+                game_data.season_id,
+                day,
+                mapping.rows(game_data, keys),
+            )
+
+
+def export_archive(
+    writer: PartitionedParquetWriter,
+    archive_dir: str,
+    tables: Iterable[str],
+    previous_files: Optional[dict[str, list]] = None,
+    files_per_batch: int = 500,
+) -> dict[str, list]:
+    """Export the players stored in the JSON archive.
+
+    With `previous_files`, only game directories holding a new, rewritten or
+    removed file since that export are read, and their games replace the ones
+    already exported; the partitions they fall into keep their other rows.
+
+    Args:
+        writer (PartitionedParquetWriter): The dataset writer.
+        archive_dir (str): The archive root directory.
+        tables (Iterable[str]): Tables to export.
+        previous_files (Optional[dict[str, list]]): The files of the previous
+            export, as returned by this function, None to export everything.
+        files_per_batch (int): Archive files loaded into memory at once.
+
+    Returns:
+        dict[str, list]: Every archive file's size, modification time, game IDs
+        and (season, start date) partitions, keyed by path relative to the root.
+    """
+    tables = list(tables)
+    index = archive_index(archive_dir)
+    previous = previous_files or {}
+    if previous_files is None:
+        changed = {_game_directory(path) for path in index}
+    else:
+        changed = {
+            _game_directory(path)
+            for path, entry in previous.items()
+            if tuple(entry[:2]) != index.get(path)
+        }
+        changed.update(_game_directory(path) for path in index if path not in previous)
+        replaced = [
+            entry
+            for path, entry in previous.items()
+            if _game_directory(path) in changed
+        ]
+        writer.replace_games(
+            (game_id for entry in replaced for game_id in entry[2]),
+            (_parse_partition_key(key) for entry in replaced for key in entry[3]),
+        )
+
+    files = {
+        path: entry
+        for path, entry in previous.items()
+        if path in index and _game_directory(path) not in changed
+    }
+    paths = [path for path in index if _game_directory(path) in changed]
+    exported_games: set[int] = set()
+    for start in range(0, len(paths), files_per_batch):
+        batch_paths = paths[start : start + files_per_batch]
+        file_records = [
+            load_archive_file(os.path.join(archive_dir, path)) for path in batch_paths
+        ]
+        games = UserGameBatch.from_records(
+            record for records in file_records for record in records
+        ).to_user_games()
+        offset = 0
+        for path, records in zip(batch_paths, file_records):
+            file_games = games[offset : offset + len(records)]
+            offset += len(records)
+            files[path] = [
+                *index[path],
+                sorted({game.game_id for game in file_games}),
+                sorted(
+                    {
+                        _partition_key(
+                            game.season_id, start_date(game.game_start_datetime)
+                        )
+                        for game in file_games
+                    }
+                ),
+            ]
+        add_user_games(writer, games, tables, exported_games)
+    return files
+
+
+def _game_directory(path: str) -> str:
+    # Archive files are `<game_id>/team_<team_id>.json`.
+    return path.split(os.sep, 1)[0]
+
+
+def iter_table_pages(
+    dao: Any,
+    table: str,
+    since: Optional[date] = None,
+    page_size: int = 1000,
+    workers: int = 1,
+) -> Iterator[list[Row]]:
+    """Stream a mapped table from the database page by page, by keyset.
+
+    Args:
+        dao (SupabaseDAO): The data access object to read with.
+        table (str): A table in TABLE_MAPPINGS.
+        since (Optional[date]): Only read rows of games started on or after it.
+        page_size (int): Rows requested per page.
+        workers (int): Key ranges read concurrently; pages are then in key
+            order within a range only.
+
+    Returns:
+        Iterator[list[Row]]: The table's rows, one list per page.
+    """
+    mapping = TABLE_MAPPINGS[table]
+    order = [key for key in mapping.keys if key != "game_start_time"]
+    order += list(mapping.unique_on)
+    yield from dao.stream(
+        table,
+        key=order,
+        page_size=page_size,
+        # Partitions are UTC dates, whatever the database session's time zone.
+        since=(
+            datetime.combine(since, time(), timezone.utc).isoformat() if since else None
+        ),
+        workers=workers,
+    )
+
+
+def export_database(
+    writer: PartitionedParquetWriter,
+    dao: Any,
+    tables: Iterable[str],
+    previous_partitions: Optional[dict[str, list[int]]] = None,
+    page_size: int = 1000,
+    workers: int = 1,
+) -> dict[str, list[int]]:
+    """Export rows read from the database.
+
+    Games and players are first counted per partition from their keys alone.
+    With `previous_partitions`, only the partitions whose counts changed since
+    that export are rewritten, and tables are read from the earliest of them.
+    The `games` table is read first to find each game's season, which the child
+    tables do not store.
+
+    Args:
+        writer (PartitionedParquetWriter): The dataset writer.
+        dao (SupabaseDAO): The data access object to read with.
+        tables (Iterable[str]): Tables to export.
+        previous_partitions (Optional[dict[str, list[int]]]): The partitions of
+            the previous export, as returned by this function, None to export
+            everything.
+        page_size (int): Rows requested per page.
+        workers (int): Key ranges of each table read concurrently.
+
+    Returns:
+        dict[str, list[int]]: The number of games and players of every
+        partition, keyed by `<season>/<start date>`.
+    """
+    tables = list(tables)
+    partitions = _count_partitions(dao, page_size, workers)
+    if previous_partitions is None:
+        touched = set(partitions)
+    else:
+        touched = {
+            key
+            for key in partitions.keys() | previous_partitions.keys()
+            if partitions.get(key) != previous_partitions.get(key)
+        }
+    writer.partitions = {_parse_partition_key(key) for key in touched}
+    if not touched:
+        return partitions
+    since = min(day for _, day in writer.partitions)
+
+    seasons: dict[int, int] = {}
+    for rows in iter_table_pages(dao, "games", since, page_size, workers):
+        for row in rows:
+            seasons[row["game_id"]] = row["season_id"]
+        if "games" in tables:
+            _add_database_rows(writer, "games", rows, seasons)
+
+    for table in tables:
+        if table == "games":
+            continue
+        for rows in iter_table_pages(dao, table, since, page_size, workers):
+            _add_database_rows(writer, table, rows, seasons)
+    return partitions
+
+
+def _count_partitions(dao: Any, page_size: int, workers: int) -> dict[str, list[int]]:
+    """Count games and players per partition, reading key columns only."""
+    partitions: dict[int, str] = {}
+    counts: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    for rows in dao.stream(
+        "games",
+        key=["game_id"],
+        columns="game_id,season_id,game_start_time",
+        page_size=page_size,
+        workers=workers,
+    ):
+        for row in rows:
+            day = start_date(datetime.fromisoformat(row["game_start_time"]))
+            key = _partition_key(row["season_id"], day)
+            partitions[row["game_id"]] = key
+            counts[key][0] += 1
+    for rows in dao.stream(
+        "player_game_stats",
+        key=["game_id", "user_id"],
+        columns="game_id,user_id",
+        page_size=page_size,
+        workers=workers,
+    ):
+        for row in rows:
+            key = partitions.get(row["game_id"])
+            if key is not None:
+                counts[key][1] += 1
+    return dict(counts)
+
+
+def _add_database_rows(
+    writer: PartitionedParquetWriter,
+    table: str,
+    rows: list[Row],
+    seasons: dict[int, int],
+) -> None:
+    partitions: dict[tuple[int, date], list[Row]] = defaultdict(list)
+    for row in rows:
+        row["game_start_time"] = datetime.fromisoformat(row["game_start_time"])
+        season_id = seasons.get(row["game_id"])
+        if season_id is None:
+            # The game row is missing or older than the first changed partition.
+            continue
+        partitions[(season_id, start_date(row["game_start_time"]))].append(row)
+    for (season_id, day), partition_rows in partitions.items():
+        writer.add(table, season_id, day, partition_rows)